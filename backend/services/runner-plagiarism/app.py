@@ -1,6 +1,8 @@
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel, Field
 from typing import List, Optional
+import asyncio
 import uuid
 import tempfile
 import os
@@ -11,8 +13,33 @@ import sys
 import pathlib
 import time
 
+from container_pool import ContainerPool, sandbox_flags, scratch_flags
+from job_queue import JobQueue, QueueFull
+from result_cache import ResultCache, cache_key, cacheable
+
 app = FastAPI(title='Runner & Plagiarism Runner (sandboxed)')
 
+# Warm container pool: RUNNER_POOL_SIZE=0 disables it (every job does a cold `docker run`).
+# Containers serve RUNNER_POOL_MAX_USES jobs (default 1) before being destroyed and replaced.
+POOL_SIZE = int(os.environ.get('RUNNER_POOL_SIZE', '2'))
+POOL_MAX_USES = int(os.environ.get('RUNNER_POOL_MAX_USES', '1'))
+POOL_MEMORY_MB = int(os.environ.get('RUNNER_POOL_MEMORY_MB', '256'))
+
+# Job queue: RUNNER_MAX_CONCURRENT jobs run at once, up to RUNNER_MAX_QUEUE wait behind them
+# (further submissions get 429); finished jobs stay pollable for RUNNER_JOB_TTL_S seconds.
+MAX_CONCURRENT = int(os.environ.get('RUNNER_MAX_CONCURRENT', str(max(1, POOL_SIZE))))
+MAX_QUEUE = int(os.environ.get('RUNNER_MAX_QUEUE', '64'))
+JOB_TTL_S = float(os.environ.get('RUNNER_JOB_TTL_S', '600'))
+
+# Result cache: RUNNER_CACHE_SIZE results in memory (0 disables caching), all of them
+# also in the SQLite file RUNNER_CACHE_DB (empty: memory only).
+CACHE_SIZE = int(os.environ.get('RUNNER_CACHE_SIZE', '1024'))
+CACHE_DB = os.environ.get('RUNNER_CACHE_DB', os.path.join(tempfile.gettempdir(), 'runner-plagiarism-cache.sqlite3'))
+
+_pool: Optional[ContainerPool] = None
+_jobs: Optional[JobQueue] = None
+_cache: Optional[ResultCache] = None
+
 
 class TestCaseIn(BaseModel):
     input: str
@@ -26,6 +53,9 @@ class RunRequest(BaseModel):
     time_limit_ms: Optional[int] = Field(5000, description='Total time limit in ms')
     memory_mb: Optional[int] = Field(256, description='Memory limit for container in MB')
     max_output_bytes: Optional[int] = Field(20000, description='Max stdout/stderr bytes to capture per test')
+    per_test_time_limit_ms: Optional[int] = Field(None, description='Time limit per test in ms (defaults to time_limit_ms)')
+    parallelism: Optional[int] = Field(None, description='Tests run concurrently inside the container (defaults to its CPUs)')
+    bypass_cache: Optional[bool] = Field(False, description='Always execute; the fresh result still refreshes the cache')
 
 
 class TestCaseOut(BaseModel):
@@ -35,6 +65,11 @@ class TestCaseOut(BaseModel):
     expected: Optional[str]
     durationMs: Optional[int]
     stderr: Optional[str]
+    exitCode: Optional[int]
+    # resource usage of the test process (wait4 rusage)
+    memoryKb: Optional[int]
+    cpuUserMs: Optional[int]
+    cpuSysMs: Optional[int]
 
 
 class RunResponse(BaseModel):
@@ -43,10 +78,19 @@ class RunResponse(BaseModel):
     totalPassed: int
     totalTests: int
     runtimeMs: Optional[int]
+    # peak memory of the container cgroup, or of the largest test process when that is unavailable
     memoryKb: Optional[int]
+    memoryPeakSource: Optional[str]
+    wallMs: Optional[int]
+    # container cgroup CPU time and CFS throttling over the whole job
+    cpuUserMs: Optional[int]
+    cpuSysMs: Optional[int]
+    cpuThrottledPeriods: Optional[int]
+    cpuThrottledMs: Optional[int]
     stdout: Optional[str]
     stderr: Optional[str]
     exitCode: Optional[int]
+    cached: Optional[bool] = False
 
 
 class PlagiarismRequest(BaseModel):
@@ -68,126 +112,91 @@ class PlagiarismResponse(BaseModel):
     evidence: List[EvidenceItem]
 
 
-def _write_container_runner(tmpdir: str):
-    """Write the script that will run inside the Docker container.
+# Script that grades a job inside the sandbox; shipped next to this file.
+CONTAINER_RUNNER = pathlib.Path(__file__).with_name('container_runner.py').read_text(encoding='utf-8')
 
-    The script reads `user.py` and executes it for each test by running `python user.py` with provided stdin.
-    It prints a JSON result to stdout with per-test outputs and truncated stdout/stderr.
-    """
-    script = r"""#!/usr/bin/env python3
-import json, subprocess, time, sys, os
+# How a cold container gets its job: 'stdin' streams one JSON payload into `docker run -i`
+# (no host temp dir, no bind mount); 'mount' bind-mounts a temp dir with the job files.
+TRANSFER_MODE = os.environ.get('RUNNER_TRANSFER', 'stdin')
+# Path of container_runner.py baked into the sandbox image (see Dockerfile.sandbox);
+# empty passes the script with `python -c` instead.
+BAKED_RUNNER = os.environ.get('RUNNER_BAKED_RUNNER', '')
 
-def run_test(user_path, test_input, expected, max_output_bytes, per_test_timeout):
-    # Run user code as a separate process to isolate per-test execution
-    try:
-        start = time.time()
-        proc = subprocess.run([sys.executable, user_path], input=test_input.encode('utf-8'), stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=per_test_timeout)
-        duration = int((time.time() - start) * 1000)
-        out = proc.stdout.decode('utf-8', errors='replace')
-        err = proc.stderr.decode('utf-8', errors='replace')
-        # truncate
-        if len(out) > max_output_bytes:
-            out = out[:max_output_bytes] + '\n...[truncated]'
-        if len(err) > max_output_bytes:
-            err = err[:max_output_bytes] + '\n...[truncated]'
-        return {
-            'passed': out.strip() == (expected or '').strip(),
-            'output': out,
-            'expected': expected,
-            'durationMs': duration,
-            'stderr': err,
-            'exitCode': proc.returncode,
-        }
-    except subprocess.TimeoutExpired:
-        return {'passed': False, 'output': '', 'expected': expected, 'durationMs': per_test_timeout, 'stderr': 'timeout', 'exitCode': None}
-    except Exception as e:
-        return {'passed': False, 'output': '', 'expected': expected, 'durationMs': 0, 'stderr': str(e), 'exitCode': None}
-
-def main():
-    with open('run_meta.json','r') as f:
-        meta = json.load(f)
-    tests = meta.get('tests', [])
-    max_output_bytes = meta.get('max_output_bytes', 20000)
-    per_test_timeout = max(1, int(meta.get('time_limit_ms',5000))/1000)
-    results = []
-    total_passed = 0
-    for t in tests:
-        r = run_test('user.py', t.get('input',''), t.get('expected',''), max_output_bytes, per_test_timeout)
-        if r.get('passed'):
-            total_passed += 1
-        results.append(r)
-    out = {
-        'submissionId': meta.get('submissionId'),
-        'results': results,
-        'totalPassed': total_passed,
-        'totalTests': len(results),
-        'runtimeMs': sum([r.get('durationMs',0) for r in results]),
-        'memoryKb': None,
-        'stdout': '\n'.join([r.get('output','') for r in results]),
-        'stderr': '\n'.join([r.get('stderr','') for r in results]),
-        'exitCode': 0,
-    }
-    print(json.dumps(out))
 
-if __name__ == '__main__':
-    main()
-"""
-    path = os.path.join(tmpdir, 'container_runner.py')
-    with open(path, 'w', encoding='utf-8') as f:
-        f.write(script)
-    os.chmod(path, 0o755)
+def _runner_cmd(*args: str) -> List[str]:
+    """Command that starts the container runner in stdin mode."""
+    if BAKED_RUNNER:
+        return ['python', BAKED_RUNNER, '--stdin', *args]
+    return ['python', '-c', CONTAINER_RUNNER, '--stdin', *args]
 
 
-def run_in_docker(code: str, tests: List[dict], time_limit_ms: int = 5000, memory_mb: int = 256, max_output_bytes: int = 20000, docker_image: Optional[str] = None):
-    """Run the provided code in a Docker container with resource limits. Returns parsed JSON result from container script.
+def _write_container_runner(tmpdir: str):
+    """Write container_runner.py into `tmpdir` for the bind-mounted (`RUNNER_TRANSFER=mount`) mode.
 
-    This function requires Docker to be available on the host and the provided image (or python:3.11-slim) to be pullable.
+    Inside the container the script reads `user.py` and `run_meta.json` from the working directory
+    and runs the tests, up to `parallelism` at once, each in its own session under the per-test
+    rlimits (address space, CPU, file size) and within the suite's time budget. The process count
+    is capped per container by `--pids-limit`. It prints a JSON RunResponse to stdout with per-test
+    outputs and truncated stdout/stderr.
     """
-    if docker_image is None:
-        docker_image = os.environ.get('RUNNER_DOCKER_IMAGE', 'python:3.11-slim')
+    path = os.path.join(tmpdir, 'container_runner.py')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(CONTAINER_RUNNER)
+    os.chmod(path, 0o755)
+
 
+def _parse_runner_output(proc: subprocess.CompletedProcess) -> dict:
+    out = proc.stdout.decode('utf-8', errors='replace')
+    # The container_runner prints JSON; parse it
+    try:
+        return json.loads(out)
+    except Exception as e:
+        raise RuntimeError(f'Failed to parse runner output: {e}\nRaw output:\n{out}\nStderr:\n{proc.stderr.decode("utf-8", errors="replace")}')
+
+
+def _run_cold(code: str, meta: dict, memory_mb: int, docker_image: str) -> dict:
+    """Run one job in a fresh `docker run --rm` container."""
+    if TRANSFER_MODE == 'mount':
+        return _run_cold_mounted(code, meta, memory_mb, docker_image)
+    docker_cmd = [
+        'docker', 'run', '-i', '--rm', *sandbox_flags(memory_mb), *scratch_flags(),
+        docker_image, *_runner_cmd()
+    ]
+    # Use host-side timeout slightly larger than requested to allow container startup
+    host_timeout = max(1, int(meta['time_limit_ms'] / 1000) + 2)
+    payload = json.dumps({'meta': meta, 'code': code}).encode('utf-8')
+    proc = subprocess.run(docker_cmd, input=payload, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=host_timeout)
+    if proc.returncode != 0:
+        # include stderr for diagnostics
+        raise RuntimeError(f'Docker run failed: {proc.stderr.decode("utf-8", errors="replace")}')
+    return _parse_runner_output(proc)
+
+
+def _run_cold_mounted(code: str, meta: dict, memory_mb: int, docker_image: str) -> dict:
+    """Run one job in a fresh container with the job files bind-mounted from a temp dir."""
     tmpdir = tempfile.mkdtemp(prefix='runner-')
     try:
         user_path = os.path.join(tmpdir, 'user.py')
         with open(user_path, 'w', encoding='utf-8') as f:
             f.write(code)
-
-        meta = {
-            'submissionId': str(uuid.uuid4()),
-            'tests': tests,
-            'time_limit_ms': time_limit_ms,
-            'max_output_bytes': max_output_bytes,
-        }
         with open(os.path.join(tmpdir, 'run_meta.json'), 'w', encoding='utf-8') as f:
             json.dump(meta, f)
 
         _write_container_runner(tmpdir)
 
-        # Build docker run command
-        # Use --network none to block network, set memory and disable swap by --memory-swap=memory_mb
         docker_cmd = [
-            'docker', 'run', '--rm', '--network', 'none',
-            '--memory', f'{memory_mb}m', '--memory-swap', f'{memory_mb}m', '--pids-limit', '64',
-            '--user', '65534:65534', '--security-opt', 'no-new-privileges',
+            'docker', 'run', '--rm', *sandbox_flags(memory_mb),
             '-v', f'{os.path.abspath(tmpdir)}:/work:ro', '-w', '/work', docker_image,
             sys.executable, 'container_runner.py'
         ]
 
         # Use host-side timeout slightly larger than requested to allow container startup
-        host_timeout = max(1, int(time_limit_ms / 1000) + 2)
+        host_timeout = max(1, int(meta['time_limit_ms'] / 1000) + 2)
         proc = subprocess.run(docker_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=host_timeout)
         if proc.returncode != 0:
             # include stderr for diagnostics
             raise RuntimeError(f'Docker run failed: {proc.stderr.decode("utf-8", errors="replace")}')
-
-        out = proc.stdout.decode('utf-8', errors='replace')
-        # The container_runner prints JSON; parse it
-        try:
-            parsed = json.loads(out)
-        except Exception as e:
-            raise RuntimeError(f'Failed to parse runner output: {e}\nRaw output:\n{out}\nStderr:\n{proc.stderr.decode("utf-8", errors="replace")}')
-
-        return parsed
+        return _parse_runner_output(proc)
     finally:
         try:
             shutil.rmtree(tmpdir)
@@ -195,35 +204,177 @@ def run_in_docker(code: str, tests: List[dict], time_limit_ms: int = 5000, memor
             pass
 
 
+def _run_warm(pool: ContainerPool, container, code: str, meta: dict) -> Optional[dict]:
+    """Run one job in an idle pooled container over `docker exec -i`.
+
+    Returns None if the container turned out to be gone, so the caller can retry cold.
+    """
+    healthy = False
+    try:
+        args = ['--reap'] if pool.max_uses > 1 else []
+        docker_cmd = ['docker', 'exec', '-i', container.id, *_runner_cmd(*args)]
+        payload = json.dumps({'meta': meta, 'code': code}).encode('utf-8')
+        # the container is already running, so only a little slack for the exec itself
+        host_timeout = max(1, int(meta['time_limit_ms'] / 1000) + 1)
+        proc = subprocess.run(docker_cmd, input=payload, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=host_timeout)
+        if proc.returncode != 0:
+            err = proc.stderr.decode('utf-8', errors='replace')
+            if not proc.stdout and ('No such container' in err or 'is not running' in err):
+                return None
+            raise RuntimeError(f'Docker exec failed: {err}')
+        parsed = _parse_runner_output(proc)
+        healthy = True
+        return parsed
+    finally:
+        pool.release(container, healthy)
+
+
+def run_in_docker(code: str, tests: List[dict], time_limit_ms: int = 5000, memory_mb: int = 256, max_output_bytes: int = 20000, docker_image: Optional[str] = None,
+                  per_test_time_limit_ms: Optional[int] = None, parallelism: Optional[int] = None):
+    """Run the provided code in a Docker container with resource limits. Returns parsed JSON result from container script.
+
+    `time_limit_ms` budgets the whole suite; each test additionally runs under
+    `per_test_time_limit_ms` and its own rlimits (address space capped at `memory_mb`,
+    CPU seconds, file size, process count), with up to `parallelism` tests at once.
+
+    Uses a pre-started container from the warm pool when one with the same image and
+    memory limit is idle, otherwise falls back to a cold `docker run --rm`.
+    This function requires Docker to be available on the host and the provided image (or python:3.11-slim) to be pullable.
+    """
+    if docker_image is None:
+        docker_image = os.environ.get('RUNNER_DOCKER_IMAGE', 'python:3.11-slim')
+
+    meta = {
+        'submissionId': str(uuid.uuid4()),
+        'tests': tests,
+        'time_limit_ms': time_limit_ms,
+        'per_test_time_limit_ms': per_test_time_limit_ms,
+        'parallelism': parallelism,
+        'case_memory_mb': memory_mb,
+        'max_output_bytes': max_output_bytes,
+    }
+
+    pool = _pool
+    if pool is not None:
+        if pool.matches(docker_image, memory_mb):
+            container = pool.acquire()
+            if container is not None:
+                parsed = _run_warm(pool, container, code, meta)
+                if parsed is not None:
+                    return parsed
+        else:
+            pool.bypass()
+    return _run_cold(code, meta, memory_mb, docker_image)
+
+
+def _run_job(cache_key: Optional[str] = None, **kwargs):
+    """Job handler: run_in_docker, remembering deterministic results under `cache_key`."""
+    parsed = run_in_docker(**kwargs)
+    if cache_key and _cache is not None and cacheable(parsed):
+        _cache.put(cache_key, parsed)
+    return parsed
+
+
+@app.on_event('startup')
+async def _start_pool():
+    global _pool, _jobs, _cache
+    if CACHE_SIZE > 0:
+        _cache = ResultCache(CACHE_SIZE, CACHE_DB or None)
+    if POOL_SIZE > 0:
+        _pool = ContainerPool(
+            image=os.environ.get('RUNNER_DOCKER_IMAGE', 'python:3.11-slim'),
+            memory_mb=POOL_MEMORY_MB,
+            size=POOL_SIZE,
+            max_uses=POOL_MAX_USES,
+        )
+        _pool.start()
+    _jobs = JobQueue(_run_job, workers=MAX_CONCURRENT, max_queued=MAX_QUEUE, ttl_s=JOB_TTL_S)
+    await _jobs.start()
+
+
+@app.on_event('shutdown')
+async def _stop_pool():
+    if _jobs is not None:
+        await _jobs.stop()
+    if _pool is not None:
+        _pool.close()
+    if _cache is not None:
+        _cache.close()
+
+
+def _http_error(e: BaseException) -> HTTPException:
+    """Map a failed job to the status code /run has always used for it."""
+    if isinstance(e, subprocess.TimeoutExpired):
+        return HTTPException(status_code=504, detail='Runner timed out')
+    if isinstance(e, RuntimeError):
+        # Docker failures or parsing failures
+        return HTTPException(status_code=502, detail=str(e))
+    return HTTPException(status_code=500, detail=str(e))
+
+
+def _job_body(job) -> dict:
+    body = job.describe()
+    if job.status == 'done':
+        body['result'] = job.result
+    elif job.status == 'failed':
+        err = _http_error(job.error)
+        body['error'] = {'statusCode': err.status_code, 'detail': err.detail}
+    return body
+
+
 @app.post('/run', response_model=RunResponse)
-async def run_code(req: RunRequest):
+async def run_code(req: RunRequest, wait: bool = True, wait_timeout_ms: Optional[int] = None):
     """Run the code inside a sandboxed Docker container.
 
     The endpoint accepts optional resource limits and will call Docker to execute
-    the submitted `code` against the provided `tests`. Results are returned in
-    the same RunResponse shape.
+    the submitted `code` against the provided `tests`. The job is queued and run off
+    the event loop; by default the request waits and returns the RunResponse.
+    With `?wait=false` (or once `wait_timeout_ms` passes) it answers 202 with a
+    job ID to poll at `GET /jobs/{id}`. A full queue answers 429.
+    Identical earlier runs are answered from the result cache (`cached: true`)
+    unless `bypass_cache` is set.
     """
+    # prepare test dicts
+    tests = [t.dict() for t in req.tests]
+    limits = {
+        'time_limit_ms': int(req.time_limit_ms or 5000),
+        'memory_mb': int(req.memory_mb or 256),
+        'max_output_bytes': int(req.max_output_bytes or 20000),
+        'per_test_time_limit_ms': req.per_test_time_limit_ms,
+        'parallelism': req.parallelism,
+    }
+    docker_image = os.environ.get('RUNNER_DOCKER_IMAGE')
+    key = None
+    if _cache is not None:
+        key = cache_key(req.code, tests, docker_image or 'python:3.11-slim', limits, CONTAINER_RUNNER)
+        # SQLite lookups block; keep them off the event loop
+        hit = None if req.bypass_cache else await asyncio.to_thread(_cache.get, key)
+        if hit is not None:
+            result = dict(hit, submissionId=str(uuid.uuid4()), cached=True)
+            if wait:
+                return result
+            return JSONResponse(status_code=202, content=_job_body(_jobs.completed(result)))
     try:
-        # prepare test dicts
-        tests = [t.dict() for t in req.tests]
-        parsed = run_in_docker(
-            code=req.code,
-            tests=tests,
-            time_limit_ms=int(req.time_limit_ms or 5000),
-            memory_mb=int(req.memory_mb or 256),
-            max_output_bytes=int(req.max_output_bytes or 20000),
-            docker_image=os.environ.get('RUNNER_DOCKER_IMAGE')
-        )
+        job = _jobs.submit({'code': req.code, 'tests': tests, 'docker_image': docker_image, 'cache_key': key, **limits})
+    except QueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={'Retry-After': '1'})
 
-        # parsed should be a dict compatible with RunResponse
-        return parsed
-    except subprocess.TimeoutExpired:
-        raise HTTPException(status_code=504, detail='Runner timed out')
-    except RuntimeError as e:
-        # Docker failures or parsing failures
-        raise HTTPException(status_code=502, detail=str(e))
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    timeout = wait_timeout_ms / 1000 if wait_timeout_ms else None
+    if not wait or not await _jobs.wait(job, timeout):
+        return JSONResponse(status_code=202, content=_job_body(job))
+    if job.status == 'failed':
+        raise _http_error(job.error)
+    # result should be a dict compatible with RunResponse
+    return job.result
+
+
+@app.get('/jobs/{job_id}')
+async def get_job(job_id: str):
+    """Status of a queued `/run` job, with its result (or error) once finished."""
+    job = _jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail='Unknown or expired job')
+    return _job_body(job)
 
 
 @app.post('/plagiarism', response_model=PlagiarismResponse)
@@ -233,3 +384,25 @@ async def plagiarism_check(req: PlagiarismRequest):
     Later this endpoint will connect to a vector DB and compute similarities.
     """
     return PlagiarismResponse(staticScore=0.0, dynamicScore=0.0, webScore=0.0, finalScore=0.0, evidence=[])
+
+
+@app.get('/metrics/pool')
+async def pool_metrics():
+    """Warm container pool counters: hits, misses, hit rate, idle and starting containers."""
+    if _pool is None:
+        return {'enabled': False}
+    return _pool.metrics()
+
+
+@app.get('/metrics/cache')
+async def cache_metrics():
+    """Result cache counters: hits (in memory and from SQLite), misses, hit rate, size."""
+    if _cache is None:
+        return {'enabled': False}
+    return _cache.metrics()
+
+
+@app.get('/metrics/jobs')
+async def job_metrics():
+    """Job queue depth and worker usage."""
+    return _jobs.stats()
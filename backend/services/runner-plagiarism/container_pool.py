@@ -0,0 +1,189 @@
+"""Warm pool of pre-started sandbox containers for `run_in_docker`.
+
+Containers are started ahead of time with the same isolation as a cold run
+(no network, memory and pid limits, unprivileged user) plus a read-only root
+and a small tmpfs for job files, and just idle (`sleep infinity`). A job is
+dispatched with `docker exec -i`, streaming code and test metadata over stdin,
+so the request path never pays for container creation.
+
+By default a container serves exactly one job and is then destroyed and
+replaced in the background; `max_uses > 1` lets a container be reused, in which
+case the runner script kills leftover processes before reporting.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+import collections
+import logging
+import subprocess
+import threading
+import time
+import uuid
+
+log = logging.getLogger(__name__)
+
+POOL_LABEL = 'runner-plagiarism.pool'
+
+
+def sandbox_flags(memory_mb: int) -> List[str]:
+    """`docker run` flags shared by cold and pooled containers."""
+    # Use --network none to block network, set memory and disable swap by --memory-swap=memory_mb
+    return [
+        '--network', 'none',
+        '--memory', f'{memory_mb}m', '--memory-swap', f'{memory_mb}m', '--pids-limit', '64',
+        '--user', '65534:65534', '--security-opt', 'no-new-privileges',
+    ]
+
+
+def scratch_flags(tmpfs_mb: int = 64) -> List[str]:
+    """Read-only root with a small writable tmpfs at /tmp for job files (stdin transfer)."""
+    return ['--read-only', '--tmpfs', f'/tmp:rw,exec,nosuid,size={tmpfs_mb}m', '-w', '/tmp']
+
+
+class WarmContainer:
+    """A started, idle container owned by a ContainerPool."""
+
+    def __init__(self, container_id: str):
+        self.id = container_id
+        self.uses = 0
+        self.started_at = time.monotonic()
+
+
+class ContainerPool:
+    """Keeps `size` idle containers of one image/memory limit ready for `docker exec`.
+
+    acquire() never blocks: on an empty pool it returns None and the caller falls
+    back to a cold `docker run`. Creation and destruction happen on a small
+    background executor; repeated creation failures back off exponentially.
+    """
+
+    def __init__(self, image: str, memory_mb: int, size: int, max_uses: int = 1, tmpfs_mb: int = 64):
+        self.image = image
+        self.memory_mb = memory_mb
+        self.size = size
+        self.max_uses = max(1, max_uses)
+        self.tmpfs_mb = tmpfs_mb
+        self.pool_id = uuid.uuid4().hex[:12]
+        self._idle = collections.deque()
+        self._lock = threading.Lock()
+        self._starting = 0
+        self._closed = False
+        self._backoff_until = 0.0
+        self._failures = 0
+        self._executor = ThreadPoolExecutor(max_workers=max(2, size), thread_name_prefix='container-pool')
+        self.stats = {
+            'hits': 0, 'misses': 0, 'bypassed': 0, 'reused': 0,
+            'created': 0, 'destroyed': 0, 'createFailures': 0,
+        }
+
+    def matches(self, image: str, memory_mb: int) -> bool:
+        return image == self.image and memory_mb == self.memory_mb
+
+    def start(self):
+        self._refill()
+
+    def acquire(self) -> Optional[WarmContainer]:
+        """Take an idle container, or None (counted as a miss) if none is ready."""
+        with self._lock:
+            container = self._idle.popleft() if self._idle else None
+            self.stats['hits' if container else 'misses'] += 1
+        self._refill()
+        if container:
+            container.uses += 1
+        return container
+
+    def bypass(self):
+        """Record a job that could not use the pool (different image or limits)."""
+        with self._lock:
+            self.stats['bypassed'] += 1
+
+    def release(self, container: WarmContainer, healthy: bool):
+        """Return a container after a job; it is recycled unless it may be reused."""
+        with self._lock:
+            reuse = healthy and not self._closed and container.uses < self.max_uses
+            if reuse:
+                self._idle.append(container)
+                self.stats['reused'] += 1
+        if not reuse:
+            try:
+                self._executor.submit(self._destroy, container.id)
+            except RuntimeError:
+                # pool already shut down
+                self._destroy(container.id)
+            self._refill()
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+        for container in idle:
+            self._destroy(container.id)
+        self._executor.shutdown(wait=True)
+        # anything that finished starting during shutdown
+        with self._lock:
+            late = list(self._idle)
+            self._idle.clear()
+        for container in late:
+            self._destroy(container.id)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            served = self.stats['hits'] + self.stats['misses']
+            return {
+                'enabled': True,
+                'image': self.image,
+                'memoryMb': self.memory_mb,
+                'size': self.size,
+                'maxUses': self.max_uses,
+                'idle': len(self._idle),
+                'starting': self._starting,
+                'hitRate': round(self.stats['hits'] / served, 4) if served else None,
+                **self.stats,
+            }
+
+    def _refill(self):
+        with self._lock:
+            if self._closed or time.monotonic() < self._backoff_until:
+                return
+            deficit = self.size - len(self._idle) - self._starting
+            self._starting += max(0, deficit)
+        for _ in range(deficit):
+            self._executor.submit(self._create)
+
+    def _create(self):
+        cmd = [
+            'docker', 'run', '-d', '--rm', '--label', f'{POOL_LABEL}={self.pool_id}',
+            *sandbox_flags(self.memory_mb),
+            *scratch_flags(self.tmpfs_mb),
+            self.image, 'sleep', 'infinity',
+        ]
+        container = None
+        try:
+            proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=60)
+            if proc.returncode != 0:
+                raise RuntimeError(proc.stderr.decode('utf-8', errors='replace').strip())
+            container = WarmContainer(proc.stdout.decode('utf-8').strip())
+        except Exception as e:
+            log.warning('warm container start failed: %s', e)
+        with self._lock:
+            self._starting -= 1
+            if container is None:
+                self.stats['createFailures'] += 1
+                self._failures += 1
+                self._backoff_until = time.monotonic() + min(30.0, 0.5 * 2 ** self._failures)
+                return
+            self._failures = 0
+            self.stats['created'] += 1
+            if not self._closed:
+                self._idle.append(container)
+                return
+        self._destroy(container.id)
+
+    def _destroy(self, container_id: str):
+        try:
+            # started with --rm, so a kill also removes it
+            subprocess.run(['docker', 'rm', '-f', container_id], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=30)
+        except Exception as e:
+            log.warning('failed to remove warm container %s: %s', container_id, e)
+        with self._lock:
+            self.stats['destroyed'] += 1
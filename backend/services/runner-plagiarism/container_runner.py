@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""Grades one submission inside the sandbox container and prints a RunResponse JSON.
+
+Either baked into the sandbox image (see Dockerfile.sandbox) or passed to
+`python -c` by app.py. With `--stdin` the job arrives as one JSON payload
+{"meta": ..., "code": ...} on stdin; without it, user.py and run_meta.json are
+read from a bind-mounted working directory.
+"""
+import json, math, subprocess, time, sys, os, shutil, signal, tempfile, threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Applies the per-case rlimits inside the test process itself, then runs user.py
+# as __main__ (no second interpreter start, and no preexec_fn in a threaded parent).
+# There is no RLIMIT_NPROC: it counts every process of the UID, and all containers
+# run as 65534, so the process cap is the container's pids.max (--pids-limit).
+# argv: <as_bytes> <cpu_s> <fsize_bytes> <user_path>
+BOOT = '''
+import os, resource, sys, traceback
+as_bytes, cpu_s, fsize = (int(v) for v in sys.argv[1:4])
+if as_bytes:
+    resource.setrlimit(resource.RLIMIT_AS, (as_bytes, as_bytes))
+resource.setrlimit(resource.RLIMIT_CPU, (cpu_s, cpu_s + 1))
+resource.setrlimit(resource.RLIMIT_FSIZE, (fsize, fsize))
+resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+path = sys.argv[4]
+sys.argv = [path]
+sys.path[0] = os.path.dirname(path)
+with open(path, 'rb') as f:
+    code = compile(f.read(), path, 'exec', dont_inherit=True)
+# a real __main__ module, so classes defined by user.py pickle (multiprocessing etc.)
+main = type(sys)('__main__')
+main.__file__ = path
+sys.modules['__main__'] = main
+try:
+    exec(code, main.__dict__)
+except SystemExit:
+    raise
+except BaseException as e:
+    # drop this frame so the traceback looks like a plain `python user.py` run
+    traceback.print_exception(type(e), e, e.__traceback__.tb_next)
+    sys.exit(1)
+'''
+
+def _kill_group(proc):
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except Exception:
+        pass
+
+def _wait4(proc, timeout_s):
+    # reap the test process with its rusage; the process group is killed at timeout_s
+    fired = threading.Event()
+
+    def expire():
+        fired.set()
+        _kill_group(proc)
+
+    timer = threading.Timer(timeout_s, expire)
+    timer.start()
+    try:
+        _, status, ru = os.wait4(proc.pid, 0)
+    finally:
+        timer.cancel()
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return fired.is_set(), ru
+
+def _usage(ru):
+    # ru_maxrss is the high-water mark of the case process; it has a floor of this
+    # runner's RSS at fork time since the counter survives exec
+    return {
+        'memoryKb': ru.ru_maxrss,
+        'cpuUserMs': int(ru.ru_utime * 1000),
+        'cpuSysMs': int(ru.ru_stime * 1000),
+    }
+
+CGROUP_ROOT = '/sys/fs/cgroup'
+
+def _read_kv(path):
+    with open(path) as f:
+        return {k: int(v) for k, v in (line.split() for line in f if line.strip())}
+
+def _read_int(path):
+    with open(path) as f:
+        return int(f.read().strip())
+
+def cgroup_cpu():
+    # container-wide CPU counters in microseconds (cgroup v2, or v1 cpu/cpuacct); None if unavailable
+    try:
+        st = _read_kv(os.path.join(CGROUP_ROOT, 'cpu.stat'))
+        if 'usage_usec' in st:
+            return {
+                'usage': st['usage_usec'], 'user': st.get('user_usec', 0), 'system': st.get('system_usec', 0),
+                'nr_throttled': st.get('nr_throttled', 0), 'throttled': st.get('throttled_usec', 0),
+            }
+    except (OSError, ValueError):
+        pass
+    try:
+        st = _read_kv(os.path.join(CGROUP_ROOT, 'cpu', 'cpu.stat'))
+        acct = _read_kv(os.path.join(CGROUP_ROOT, 'cpuacct', 'cpuacct.stat'))
+        hz = os.sysconf('SC_CLK_TCK')
+        return {
+            'usage': _read_int(os.path.join(CGROUP_ROOT, 'cpuacct', 'cpuacct.usage')) // 1000,
+            'user': acct.get('user', 0) * 1000000 // hz, 'system': acct.get('system', 0) * 1000000 // hz,
+            'nr_throttled': st.get('nr_throttled', 0), 'throttled': st.get('throttled_time', 0) // 1000,
+        }
+    except (OSError, ValueError):
+        return None
+
+def cgroup_memory_peak_kb():
+    # peak memory of the whole container (cgroup v2 memory.peak, v1 max_usage_in_bytes)
+    for path in (os.path.join(CGROUP_ROOT, 'memory.peak'),
+                 os.path.join(CGROUP_ROOT, 'memory', 'memory.max_usage_in_bytes')):
+        try:
+            return _read_int(path) // 1024
+        except (OSError, ValueError):
+            continue
+    return None
+
+def _read_capped(f, max_output_bytes):
+    f.seek(0)
+    data = f.read(max_output_bytes + 1).decode('utf-8', errors='replace')
+    if len(data) > max_output_bytes:
+        return data[:max_output_bytes] + '\n...[truncated]'
+    return data
+
+def run_test(user_path, test_input, expected, max_output_bytes, timeout_s, limits):
+    # Run user code as a separate process (and session) to isolate per-test execution.
+    # stdio goes through files so only the test process itself is waited for (not
+    # whatever it forked while holding a pipe), and RLIMIT_FSIZE also caps its output.
+    cmd = [sys.executable, '-c', BOOT, str(limits['as_bytes']), str(max(1, math.ceil(timeout_s))),
+           str(limits['fsize_bytes']), user_path]
+    case_dir = tempfile.mkdtemp(prefix='case-')
+    try:
+        in_path = os.path.join(case_dir, 'stdin')
+        with open(in_path, 'wb') as f:
+            f.write(test_input.encode('utf-8'))
+        with open(in_path, 'rb') as fin, open(os.path.join(case_dir, 'stdout'), 'w+b') as fout, \
+                open(os.path.join(case_dir, 'stderr'), 'w+b') as ferr:
+            start = time.time()
+            try:
+                proc = subprocess.Popen(cmd, stdin=fin, stdout=fout, stderr=ferr, cwd=case_dir, start_new_session=True)
+            except Exception as e:
+                return {'passed': False, 'output': '', 'expected': expected, 'durationMs': 0, 'stderr': str(e), 'exitCode': None}
+            try:
+                timed_out, ru = _wait4(proc, timeout_s)
+            finally:
+                # nothing the test started may outlive it
+                _kill_group(proc)
+            duration = int((time.time() - start) * 1000)
+            if timed_out:
+                return {'passed': False, 'output': '', 'expected': expected, 'durationMs': duration, 'stderr': 'timeout',
+                        'exitCode': None, **_usage(ru)}
+            out = _read_capped(fout, max_output_bytes)
+            err = _read_capped(ferr, max_output_bytes)
+    finally:
+        shutil.rmtree(case_dir, ignore_errors=True)
+    if proc.returncode == -signal.SIGXCPU:
+        err = (err + '\n' if err else '') + 'cpu time limit exceeded'
+    elif proc.returncode == -signal.SIGXFSZ:
+        err = (err + '\n' if err else '') + 'output/file size limit exceeded'
+    return {
+        'passed': out.strip() == (expected or '').strip(),
+        'output': out,
+        'expected': expected,
+        'durationMs': duration,
+        'stderr': err,
+        'exitCode': proc.returncode,
+        **_usage(ru),
+    }
+
+def run_job(meta, user_path, fresh_container=True):
+    # every case runs in its own directory, so the path must not be relative
+    user_path = os.path.abspath(user_path)
+    # fresh_container: this job is the only one the container has run, so its
+    # cgroup peak memory belongs to this job alone
+    tests = meta.get('tests', [])
+    max_output_bytes = meta.get('max_output_bytes', 20000)
+    # time_limit_ms is the budget for the whole suite; a case gets at most its own
+    # limit and never more than what is left of the budget
+    total_s = max(1, int(meta.get('time_limit_ms', 5000))) / 1000
+    per_test_s = min(total_s, int(meta.get('per_test_time_limit_ms') or meta.get('time_limit_ms', 5000)) / 1000)
+    limits = {
+        'as_bytes': int(meta.get('case_memory_mb') or 0) << 20,
+        'fsize_bytes': int(meta.get('fsize_bytes', 16 << 20)),
+    }
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except Exception:
+        cpus = os.cpu_count() or 1
+    parallelism = max(1, min(int(meta.get('parallelism') or cpus), len(tests) or 1))
+    cpu_before = cgroup_cpu()
+    start = time.time()
+    deadline = start + total_s
+
+    def grade(t):
+        remaining = deadline - time.time()
+        if remaining <= 0.01:
+            return {'passed': False, 'output': '', 'expected': t.get('expected', ''), 'durationMs': 0,
+                    'stderr': 'time budget exhausted', 'exitCode': None}
+        return run_test(user_path, t.get('input', ''), t.get('expected', ''), max_output_bytes,
+                        min(per_test_s, remaining), limits)
+
+    if parallelism == 1:
+        results = [grade(t) for t in tests]
+    else:
+        # cases are independent; map() starts them in order and keeps results in order
+        with ThreadPoolExecutor(max_workers=parallelism) as ex:
+            results = list(ex.map(grade, tests))
+    wall_ms = int((time.time() - start) * 1000)
+    cpu_after = cgroup_cpu()
+    total_passed = sum(1 for r in results if r.get('passed'))
+    case_peak_kb = max([r.get('memoryKb') or 0 for r in results], default=0) or None
+    container_peak_kb = cgroup_memory_peak_kb() if fresh_container else None
+    if cpu_before and cpu_after:
+        cpu = {k: cpu_after[k] - cpu_before[k] for k in cpu_after}
+        usage = {
+            'cpuUserMs': cpu['user'] // 1000,
+            'cpuSysMs': cpu['system'] // 1000,
+            'cpuThrottledPeriods': cpu['nr_throttled'],
+            'cpuThrottledMs': cpu['throttled'] // 1000,
+        }
+    else:
+        # no cgroup visible: add up what the cases themselves used
+        usage = {
+            'cpuUserMs': sum([r.get('cpuUserMs') or 0 for r in results]),
+            'cpuSysMs': sum([r.get('cpuSysMs') or 0 for r in results]),
+            'cpuThrottledPeriods': None,
+            'cpuThrottledMs': None,
+        }
+    return {
+        'submissionId': meta.get('submissionId'),
+        'results': results,
+        'totalPassed': total_passed,
+        'totalTests': len(results),
+        'runtimeMs': sum([r.get('durationMs',0) for r in results]),
+        'wallMs': wall_ms,
+        'memoryKb': container_peak_kb or case_peak_kb,
+        'memoryPeakSource': 'cgroup' if container_peak_kb else ('rusage' if case_peak_kb else None),
+        **usage,
+        'stdout': '\n'.join([r.get('output','') for r in results]),
+        'stderr': '\n'.join([r.get('stderr','') for r in results]),
+        'exitCode': 0,
+    }
+
+def main():
+    if '--stdin' not in sys.argv:
+        # mount mode: job files are bind-mounted into the working directory
+        with open('run_meta.json','r') as f:
+            meta = json.load(f)
+        print(json.dumps(run_job(meta, 'user.py')))
+        return
+    # stdin mode: {"meta": ..., "code": ...} arrives on stdin; the job lives in a
+    # private dir on the container's tmpfs and leaves nothing behind
+    payload = json.load(sys.stdin)
+    jobdir = tempfile.mkdtemp(prefix='job-')
+    try:
+        user_path = os.path.join(jobdir, 'user.py')
+        with open(user_path, 'w', encoding='utf-8') as f:
+            f.write(payload['code'])
+        out = run_job(payload['meta'], user_path, fresh_container='--reap' not in sys.argv)
+    finally:
+        shutil.rmtree(jobdir, ignore_errors=True)
+        if '--reap' in sys.argv:
+            # container will be reused: kill anything the submission left running
+            # (Linux skips the caller and PID 1 for kill(-1))
+            try:
+                os.kill(-1, signal.SIGKILL)
+            except Exception:
+                pass
+    print(json.dumps(out))
+
+if __name__ == '__main__':
+    main()
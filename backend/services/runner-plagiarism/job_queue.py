@@ -0,0 +1,137 @@
+"""Bounded in-process job queue for `/run`.
+
+Submissions are queued on an asyncio.Queue and picked up by a fixed number of
+worker tasks, each running the blocking handler (`run_in_docker`) on a
+dedicated thread pool, so the event loop keeps serving requests while
+containers run. Jobs get an ID that can be polled via `GET /jobs/{id}`;
+finished jobs are kept for `ttl_s` seconds.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+import asyncio
+import time
+import uuid
+
+
+class QueueFull(Exception):
+    """Raised by JobQueue.submit when `max_queued` jobs are already waiting."""
+
+
+class Job:
+    def __init__(self, payload: Dict[str, Any]):
+        self.id = str(uuid.uuid4())
+        self.payload = payload
+        self.status = 'queued'
+        self.result: Optional[Any] = None
+        self.error: Optional[BaseException] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.done = asyncio.Event()
+
+    def describe(self) -> dict:
+        return {
+            'jobId': self.id,
+            'status': self.status,
+            'createdAt': self.created_at,
+            'startedAt': self.started_at,
+            'finishedAt': self.finished_at,
+        }
+
+
+class JobQueue:
+    """Runs `handler(**payload)` for queued jobs on `workers` threads."""
+
+    def __init__(self, handler: Callable[..., Any], workers: int, max_queued: int, ttl_s: float = 600.0):
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.max_queued = max(1, max_queued)
+        self.ttl_s = ttl_s
+        self._jobs: Dict[str, Job] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._running = 0
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self.max_queued)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='run-job')
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, payload: Dict[str, Any]) -> Job:
+        """Queue a job without waiting for it. Raises QueueFull under back-pressure."""
+        self._expire()
+        job = Job(payload)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise QueueFull(f'{self.max_queued} jobs already queued')
+        self._jobs[job.id] = job
+        return job
+
+    def completed(self, result: Any) -> Job:
+        """Track a job that was answered without running (e.g. from the result cache)."""
+        self._expire()
+        job = Job({})
+        job.status = 'done'
+        job.result = result
+        job.started_at = job.finished_at = job.created_at
+        job.done.set()
+        self._jobs[job.id] = job
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    async def wait(self, job: Job, timeout: Optional[float] = None) -> bool:
+        """Wait for `job` to finish; False if `timeout` seconds passed first."""
+        try:
+            await asyncio.wait_for(job.done.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def stats(self) -> dict:
+        return {
+            'workers': self.workers,
+            'running': self._running,
+            'queued': self._queue.qsize() if self._queue else 0,
+            'maxQueued': self.max_queued,
+            'tracked': len(self._jobs),
+        }
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl_s
+        for job_id in [j.id for j in self._jobs.values() if j.finished_at and j.finished_at < cutoff]:
+            del self._jobs[job_id]
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self._queue.get()
+            job.status = 'running'
+            job.started_at = time.time()
+            self._running += 1
+            try:
+                job.result = await loop.run_in_executor(self._executor, lambda: self.handler(**job.payload))
+                job.status = 'done'
+            except asyncio.CancelledError:
+                job.status = 'failed'
+                job.error = RuntimeError('Runner shutting down')
+                raise
+            except Exception as e:
+                job.status = 'failed'
+                job.error = e
+            finally:
+                self._running -= 1
+                job.finished_at = time.time()
+                job.done.set()
+                self._queue.task_done()
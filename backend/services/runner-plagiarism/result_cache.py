@@ -0,0 +1,127 @@
+"""Content-addressed cache of `/run` results.
+
+Entries are keyed by a hash of the normalized code, the test suite, the image,
+the limits and the container runner script, so an identical submission
+returns the stored RunResponse without touching Docker. Recent entries live in
+an in-memory LRU; every entry is also written to SQLite so the cache survives
+restarts and can be shared by workers on one host.
+"""
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+
+def normalize_code(code: str) -> str:
+    """Only CRLF line endings are folded; any other whitespace can matter (string literals, `\\ `)."""
+    return code.replace('\r\n', '\n')
+
+
+def cache_key(code: str, tests: List[dict], image: str, limits: Dict[str, Any], runner: str) -> str:
+    h = hashlib.sha256()
+    for part in (
+        normalize_code(code),
+        json.dumps(tests, sort_keys=True, separators=(',', ':')),
+        image,
+        json.dumps(limits, sort_keys=True, separators=(',', ':')),
+        hashlib.sha256(runner.encode('utf-8')).hexdigest(),
+    ):
+        data = part.encode('utf-8')
+        # length-prefixed so adjacent parts cannot run into each other
+        h.update(len(data).to_bytes(8, 'big'))
+        h.update(data)
+    return h.hexdigest()
+
+
+def cacheable(result: dict) -> bool:
+    """Only deterministic outcomes are cached: nothing timed out or ran out of budget."""
+    return not any(r.get('stderr') in ('timeout', 'time budget exhausted') for r in result.get('results', []))
+
+
+class ResultCache:
+    """LRU of up to `max_entries` results in memory, backed by SQLite at `db_path` (None: memory only)."""
+
+    def __init__(self, max_entries: int, db_path: Optional[str] = None, max_db_entries: int = 100000):
+        self.max_entries = max_entries
+        self.max_db_entries = max_db_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._puts = 0
+        self.stats = {'hits': 0, 'diskHits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS results ('
+                'key TEXT PRIMARY KEY, result TEXT NOT NULL, created REAL NOT NULL, last_used REAL NOT NULL)'
+            )
+            self._db.execute('CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)')
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+                self.stats['hits'] += 1
+                return result
+            if self._db is not None:
+                row = self._db.execute('SELECT result FROM results WHERE key = ?', (key,)).fetchone()
+                if row is not None:
+                    self._db.execute('UPDATE results SET last_used = ? WHERE key = ?', (time.time(), key))
+                    result = json.loads(row[0])
+                    self._remember(key, result)
+                    self.stats['hits'] += 1
+                    self.stats['diskHits'] += 1
+                    return result
+            self.stats['misses'] += 1
+            return None
+
+    def put(self, key: str, result: dict):
+        with self._lock:
+            self._remember(key, result)
+            self.stats['stores'] += 1
+            if self._db is not None:
+                now = time.time()
+                self._db.execute(
+                    'INSERT OR REPLACE INTO results (key, result, created, last_used) VALUES (?, ?, ?, ?)',
+                    (key, json.dumps(result), now, now),
+                )
+                self._puts += 1
+                if self._puts % 1000 == 0:
+                    self._trim_db()
+
+    def metrics(self) -> dict:
+        with self._lock:
+            looked_up = self.stats['hits'] + self.stats['misses']
+            return {
+                'enabled': True,
+                'entries': len(self._entries),
+                'maxEntries': self.max_entries,
+                'persistent': self._db is not None,
+                'hitRate': round(self.stats['hits'] / looked_up, 4) if looked_up else None,
+                **self.stats,
+            }
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def _remember(self, key: str, result: dict):
+        self._entries[key] = result
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats['evictions'] += 1
+
+    def _trim_db(self):
+        # least recently used rows beyond the on-disk cap
+        self._db.execute(
+            'DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY last_used DESC LIMIT -1 OFFSET ?)',
+            (self.max_db_entries,),
+        )
@@ -1,20 +1,292 @@
-"""Container pool to reuse or limit concurrent containers."""
-from queue import Queue
-from threading import Lock
+"""Container pool: pre-warmed, health-checked containers per language image.
+
+Each language keeps between `min_size` and `max_size` containers created
+through DockerManager. Idle containers are handed out by `acquire`; when none is
+idle and the language is below `max_size` one is created on the spot, otherwise
+the caller waits for a release. The container being handed out is checked
+first (expired or not running: destroyed, and the next one is tried). A
+maintenance thread keeps `min_size` idle containers plus one per waiting caller
+ready; it is woken early only when a caller needs a container. Every
+`check_interval_s` it also drops idle containers that fail a health check,
+outlive `ttl_s` or sit unused beyond `min_size` for `idle_timeout_s`. A container
+is destroyed after `max_uses` jobs.
+"""
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from app.execution_engine.docker_manager import DockerManager
+
+DEFAULT_IMAGES = {
+    "python": "python:3.11-slim",
+    "node": "node:20-slim",
+    "cpp": "gcc:13",
+    "java": "eclipse-temurin:21-jdk",
+}
+
+DEFAULT_LIMITS = {"memory_mb": 256, "cpus": 1.0, "pids": 64, "network": False}
+
+
+class PooledContainer:
+    """A container owned by the pool; `handle` is what DockerManager returned."""
+
+    def __init__(self, handle: Dict[str, Any], language: str):
+        self.handle = handle
+        self.id = handle["id"]
+        self.language = language
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.uses = 0
+
+    def expired(self, ttl_s: float, now: float) -> bool:
+        return ttl_s > 0 and now - self.created_at >= ttl_s
+
+
+class _LanguagePool:
+    def __init__(self, language: str, image: str):
+        self.language = language
+        self.image = image
+        self.idle: List[PooledContainer] = []
+        self.in_use = 0
+        self.creating = 0
+        self.waiting = 0
+        self.stats = {
+            "hits": 0, "misses": 0, "timeouts": 0, "created": 0, "destroyed": 0,
+            "createFailures": 0, "healthFailures": 0, "expired": 0, "retired": 0, "scaledDown": 0,
+        }
+
+    @property
+    def total(self) -> int:
+        return len(self.idle) + self.in_use + self.creating
 
 
 class ContainerPool:
-    def __init__(self, max_size: int = 10):
-        self.max_size = max_size
-        self.pool = Queue(max_size)
-        self.lock = Lock()
+    def __init__(self, manager: Optional[DockerManager] = None, images: Optional[Dict[str, str]] = None,
+                 min_size: int = 1, max_size: int = 10, max_uses: int = 50, ttl_s: float = 600.0,
+                 idle_timeout_s: float = 120.0, check_interval_s: float = 5.0,
+                 limits: Optional[Dict[str, Any]] = None, command: str = "sleep infinity"):
+        self.manager = manager or DockerManager()
+        self.min_size = min_size
+        self.max_size = max(max_size, min_size, 1)
+        self.max_uses = max_uses
+        self.ttl_s = ttl_s
+        self.idle_timeout_s = idle_timeout_s
+        self.check_interval_s = check_interval_s
+        self.limits = dict(DEFAULT_LIMITS, **(limits or {}))
+        self.command = command
+        self.lock = threading.Lock()
+        # releases and new containers, for callers waiting in acquire()
+        self._changed = threading.Condition(self.lock)
+        # demand for containers, for the maintenance thread
+        self._demand = threading.Condition(self.lock)
+        self._pools = {lang: _LanguagePool(lang, image) for lang, image in (images or DEFAULT_IMAGES).items()}
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Start pre-warming and the maintenance thread."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._maintain, name="container-pool", daemon=True)
+            self._thread.start()
+
+    def acquire(self, language: str = "python", timeout: Optional[float] = None) -> Optional[PooledContainer]:
+        """Return a ready container for `language`, or None if none became available within `timeout`."""
+        pool = self._pools[language]
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self.lock:
+                pool.waiting += 1
+                if len(pool.idle) <= self.min_size:
+                    # taking one leaves the pool short: let the maintenance thread top it up
+                    self._demand.notify()
+                try:
+                    while True:
+                        if self._closed:
+                            return None
+                        if pool.idle:
+                            container = pool.idle.pop()
+                            pool.in_use += 1
+                            break
+                        if pool.total < self.max_size:
+                            # nothing warm: create one for this caller (counted as a miss)
+                            pool.creating += 1
+                            pool.stats["misses"] += 1
+                            container = None
+                            break
+                        remaining = None if deadline is None else deadline - time.monotonic()
+                        if remaining is not None and remaining <= 0:
+                            pool.stats["timeouts"] += 1
+                            return None
+                        self._changed.wait(remaining)
+                finally:
+                    pool.waiting -= 1
+            if container is None:
+                break
+            # only the container being handed out is checked here; the rest wait for _check_idle
+            reason = self._unusable(container, time.monotonic())
+            with self.lock:
+                if reason is None:
+                    pool.stats["hits"] += 1
+                    break
+                pool.in_use -= 1
+                pool.stats[reason] += 1
+                self._changed.notify_all()
+            self._destroy(pool, container)
+        if container is None:
+            container = self._create(pool)
+            with self.lock:
+                pool.creating -= 1
+                if container is not None:
+                    pool.in_use += 1
+                self._changed.notify_all()
+        if container is not None:
+            container.uses += 1
+            container.last_used = time.monotonic()
+        return container
 
-    def acquire(self):
-        # placeholder: in production return an actual container
-        return self.pool.get() if not self.pool.empty() else None
+    def release(self, container: PooledContainer, healthy: bool = True):
+        """Return a container after a job. Broken, worn-out or expired containers are destroyed."""
+        pool = self._pools[container.language]
+        now = time.monotonic()
+        with self.lock:
+            pool.in_use -= 1
+            retire = self._closed or not healthy or container.uses >= self.max_uses or container.expired(self.ttl_s, now)
+            if not retire:
+                container.last_used = now
+                pool.idle.append(container)
+            elif healthy and container.uses >= self.max_uses:
+                pool.stats["retired"] += 1
+            elif healthy and container.expired(self.ttl_s, now):
+                pool.stats["expired"] += 1
+            self._changed.notify_all()
+        if retire:
+            self._destroy(pool, container)
 
-    def release(self, container):
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                lang: {
+                    "image": pool.image,
+                    "idle": len(pool.idle),
+                    "inUse": pool.in_use,
+                    "creating": pool.creating,
+                    "waiting": pool.waiting,
+                    **pool.stats,
+                }
+                for lang, pool in self._pools.items()
+            }
+
+    def close(self):
+        with self.lock:
+            self._closed = True
+            idle = [(pool, c) for pool in self._pools.values() for c in pool.idle]
+            for pool in self._pools.values():
+                pool.idle = []
+            self._changed.notify_all()
+            self._demand.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        for pool, container in idle:
+            self._destroy(pool, container)
+
+    def _create(self, pool: _LanguagePool) -> Optional[PooledContainer]:
+        try:
+            handle = self.manager.create_container(pool.image, self.command, self.limits)
+        except Exception:
+            handle = None
+        with self.lock:
+            if handle is None:
+                pool.stats["createFailures"] += 1
+                return None
+            pool.stats["created"] += 1
+        return PooledContainer(handle, pool.language)
+
+    def _destroy(self, pool: _LanguagePool, container: PooledContainer):
         try:
-            self.pool.put_nowait(container)
+            self.manager.destroy_container(container.id)
         except Exception:
             pass
+        with self.lock:
+            pool.stats["destroyed"] += 1
+
+    def _maintain(self):
+        next_check = time.monotonic()
+        while True:
+            with self.lock:
+                if self._closed:
+                    return
+            now = time.monotonic()
+            check = now >= next_check
+            if check:
+                next_check = now + self.check_interval_s
+            for pool in list(self._pools.values()):
+                if check:
+                    self._check_idle(pool)
+                self._scale(pool)
+            with self.lock:
+                if self._closed:
+                    return
+                # woken early only by demand, which just needs _scale; health checks keep their interval
+                self._demand.wait(max(0.0, next_check - time.monotonic()))
+
+    def _check_idle(self, pool: _LanguagePool):
+        now = time.monotonic()
+        with self.lock:
+            candidates = list(pool.idle)
+        # health checks run without the lock; acquire() may take a candidate meanwhile
+        verdicts = {c.id: self._unusable(c, now) for c in candidates}
+        drop = []
+        with self.lock:
+            keep = []
+            for container in pool.idle:
+                reason = verdicts.get(container.id)
+                if reason:
+                    drop.append(container)
+                    pool.stats[reason] += 1
+                else:
+                    keep.append(container)
+            # most recently used last, so acquire() hands out the warmest one
+            keep.sort(key=lambda c: c.last_used)
+            extra = len(keep) - max(self.min_size, pool.waiting)
+            while extra > 0 and now - keep[0].last_used >= self.idle_timeout_s:
+                drop.append(keep.pop(0))
+                pool.stats["scaledDown"] += 1
+                extra -= 1
+            pool.idle = keep
+        for container in drop:
+            self._destroy(pool, container)
+
+    def _unusable(self, container: PooledContainer, now: float) -> Optional[str]:
+        """Stats key naming why `container` must not be handed out, or None if it is fine."""
+        if container.expired(self.ttl_s, now):
+            return "expired"
+        if not self._healthy(container):
+            return "healthFailures"
+        return None
+
+    def _healthy(self, container: PooledContainer) -> bool:
+        try:
+            return bool(self.manager.is_running(container.id))
+        except Exception:
+            return False
+
+    def _scale(self, pool: _LanguagePool):
+        with self.lock:
+            # keep min_size warm, plus one for every caller currently waiting
+            want = min(self.max_size - pool.in_use, self.min_size + pool.waiting)
+            deficit = want - len(pool.idle) - pool.creating
+            deficit = min(deficit, self.max_size - pool.total)
+            if deficit <= 0:
+                return
+            pool.creating += deficit
+        for _ in range(deficit):
+            container = self._create(pool)
+            with self.lock:
+                pool.creating -= 1
+                if container is not None and not self._closed:
+                    pool.idle.append(container)
+                    container = None
+                self._changed.notify_all()
+            if container is not None:
+                self._destroy(pool, container)
@@ -1,21 +1,228 @@
 """docker_manager.py
 
 Create/destroy Docker containers for secure code execution.
-This is a lightweight skeleton — implement real Docker calls in production.
+
+Talks to the Docker Engine HTTP API directly over the daemon's Unix socket (or
+tcp://) with a small pool of keep-alive connections, so no operation forks the
+`docker` CLI. Batch helpers create/start and tear down many containers
+concurrently, and every operation has an asyncio variant that runs on the
+manager's own thread pool.
 """
-from typing import Dict, Any
+import asyncio
+import http.client
+import json
+import os
+import shlex
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from queue import Empty, LifoQueue
+from typing import Any, Dict, List, Optional, Sequence
+from urllib.parse import quote, urlencode, urlparse
+
+DEFAULT_DOCKER_HOST = "unix:///var/run/docker.sock"
+API_VERSION = "v1.41"
+
+
+class DockerAPIError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(f"Docker API error {status}: {message}")
+        self.status = status
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path: str, timeout: float):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self.sock = sock
+
+
+def host_config(limits: Dict[str, Any]) -> Dict[str, Any]:
+    """Translate our limit keys into a Docker HostConfig."""
+    memory = int(limits.get("memory_mb", 256)) << 20
+    config = {
+        "Memory": memory,
+        "MemorySwap": memory,
+        "NanoCpus": int(float(limits.get("cpus", 1.0)) * 1e9),
+        "PidsLimit": int(limits.get("pids", 64)),
+        "NetworkMode": "bridge" if limits.get("network") else "none",
+        "ReadonlyRootfs": bool(limits.get("read_only", True)),
+        "SecurityOpt": ["no-new-privileges"],
+        "CapDrop": ["ALL"],
+        "Tmpfs": {"/tmp": f"rw,exec,nosuid,size={int(limits.get('tmpfs_mb', 64))}m"},
+        "AutoRemove": False,
+    }
+    if limits.get("runtime"):
+        # e.g. runsc for gVisor
+        config["Runtime"] = limits["runtime"]
+    return config
 
 
 class DockerManager:
-    def __init__(self, docker_host: str = None):
-        self.docker_host = docker_host
+    def __init__(self, docker_host: str = None, max_connections: int = 8, timeout: float = 30.0,
+                 api_version: str = API_VERSION):
+        self.docker_host = docker_host or os.environ.get("DOCKER_HOST", DEFAULT_DOCKER_HOST)
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.api_version = api_version
+        self._idle: LifoQueue = LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._executor = ThreadPoolExecutor(max_workers=max_connections, thread_name_prefix="docker-api")
+        url = urlparse(self.docker_host)
+        if url.scheme not in ("unix", "tcp", "http"):
+            raise ValueError(f"unsupported docker host: {self.docker_host}")
+        self._url = url
+
+    # -- connections -------------------------------------------------------
+
+    def _connect(self) -> http.client.HTTPConnection:
+        if self._url.scheme == "unix":
+            return _UnixHTTPConnection(self._url.path, self.timeout)
+        return http.client.HTTPConnection(self._url.hostname, self._url.port or 2375, timeout=self.timeout)
+
+    def request(self, method: str, path: str, body: Any = None, query: Optional[Dict[str, Any]] = None,
+                ok: Sequence[int] = (200, 201, 204)) -> Any:
+        """One API call on a pooled keep-alive connection; returns the decoded JSON body (or None)."""
+        url = f"/{self.api_version}{path}"
+        if query:
+            url += "?" + urlencode(query)
+        payload = json.dumps(body).encode() if body is not None else None
+        headers = {"Content-Type": "application/json"} if payload is not None else {}
+        with self._slots:
+            for attempt in range(2):
+                try:
+                    conn = self._idle.get_nowait()
+                    reused = True
+                except Empty:
+                    conn = self._connect()
+                    reused = False
+                try:
+                    conn.request(method, url, body=payload, headers=headers)
+                    resp = conn.getresponse()
+                    data = resp.read()
+                except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                    conn.close()
+                    # the daemon closed an idle keep-alive connection; retry once on a fresh one
+                    if reused and attempt == 0:
+                        continue
+                    raise
+                except Exception:
+                    conn.close()
+                    raise
+                if resp.will_close:
+                    conn.close()
+                else:
+                    self._idle.put(conn)
+                break
+        if resp.status not in ok:
+            try:
+                message = json.loads(data).get("message", "")
+            except Exception:
+                message = data.decode("utf-8", "replace")
+            raise DockerAPIError(resp.status, message)
+        if data and resp.getheader("Content-Type", "").startswith("application/json"):
+            return json.loads(data)
+        return None
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except Empty:
+                return
+
+    # -- containers --------------------------------------------------------
 
     def create_container(self, image: str, command: str, limits: Dict[str, Any]):
-        """Create and return a container handle (placeholder)."""
-        # TODO: integrate with docker-py and apply resource limits, security profiles
-        return {"id": "container-placeholder", "image": image, "cmd": command}
+        """Create and start a container; returns its handle."""
+        spec = {
+            "Image": image,
+            "Cmd": shlex.split(command) if isinstance(command, str) else list(command),
+            "User": str(limits.get("user", "65534:65534")),
+            "WorkingDir": "/tmp",
+            "OpenStdin": False,
+            "NetworkDisabled": not limits.get("network"),
+            "Labels": {"sandbox-service": "1"},
+            "HostConfig": host_config(limits),
+        }
+        created = self.request("POST", "/containers/create", spec)
+        container_id = created["Id"]
+        try:
+            self.request("POST", f"/containers/{quote(container_id)}/start", ok=(204, 304))
+        except Exception:
+            self.destroy_container(container_id)
+            raise
+        return {"id": container_id, "image": image, "cmd": command}
+
+    def create_containers(self, image: str, command: str, limits: Dict[str, Any], count: int) -> List[Dict[str, Any]]:
+        """Create and start `count` containers concurrently; failed ones are skipped."""
+        futures = [self._executor.submit(self.create_container, image, command, limits) for _ in range(count)]
+        handles = []
+        for fut in futures:
+            try:
+                handles.append(fut.result())
+            except Exception:
+                pass
+        return handles
+
+    def is_running(self, container_id: str) -> bool:
+        """Whether the container is still up."""
+        try:
+            info = self.request("GET", f"/containers/{quote(container_id)}/json")
+        except DockerAPIError as e:
+            if e.status == 404:
+                return False
+            raise
+        return bool(info.get("State", {}).get("Running"))
+
+    def inspect(self, container_id: str) -> Dict[str, Any]:
+        return self.request("GET", f"/containers/{quote(container_id)}/json")
 
     def destroy_container(self, container_id: str):
-        """Destroy the container (placeholder)."""
-        # TODO: docker stop + remove
+        """Kill and remove the container (and its anonymous volumes). Already gone counts as success."""
+        try:
+            self.request("DELETE", f"/containers/{quote(container_id)}", query={"force": "true", "v": "true"})
+        except DockerAPIError as e:
+            if e.status != 404:
+                raise
         return True
+
+    def destroy_containers(self, container_ids: Sequence[str]) -> Dict[str, bool]:
+        """Tear down many containers concurrently; maps each id to whether it is gone."""
+        futures = {cid: self._executor.submit(self.destroy_container, cid) for cid in container_ids}
+        done = {}
+        for cid, fut in futures.items():
+            try:
+                done[cid] = bool(fut.result())
+            except Exception:
+                done[cid] = False
+        return done
+
+    # -- asyncio variants --------------------------------------------------
+
+    async def _in_pool(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def acreate_container(self, image: str, command: str, limits: Dict[str, Any]):
+        return await self._in_pool(self.create_container, image, command, limits)
+
+    async def acreate_containers(self, image: str, command: str, limits: Dict[str, Any], count: int):
+        results = await asyncio.gather(*(self.acreate_container(image, command, limits) for _ in range(count)),
+                                       return_exceptions=True)
+        return [r for r in results if not isinstance(r, BaseException)]
+
+    async def ais_running(self, container_id: str) -> bool:
+        return await self._in_pool(self.is_running, container_id)
+
+    async def adestroy_container(self, container_id: str):
+        return await self._in_pool(self.destroy_container, container_id)
+
+    async def adestroy_containers(self, container_ids: Sequence[str]) -> Dict[str, bool]:
+        results = await asyncio.gather(*(self.adestroy_container(cid) for cid in container_ids), return_exceptions=True)
+        return {cid: r is True for cid, r in zip(container_ids, results)}
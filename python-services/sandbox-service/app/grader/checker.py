@@ -0,0 +1,146 @@
+"""Output checkers.
+
+A checker compares a test's output to the expected answer and returns a
+CheckResult with a score in [0, 1]. Built in: "exact" (line by line, ignoring
+trailing whitespace and trailing blank lines), "tokens" (whitespace-separated
+tokens) and "float[:eps]" (tokens, numbers within an absolute/relative eps).
+
+Custom checker programs follow the testlib convention: they are run as
+`checker <input> <output> <answer>`, exit 0 for accepted and 1 (or 2) for
+wrong answer, and may print a score in [0, 1] as the first token of stdout
+for partial credit. Any other outcome is a checker error, not a wrong answer.
+"""
+import os
+import shutil
+import tempfile
+import threading
+from dataclasses import dataclass
+from typing import Callable, Optional, Union
+
+from app.multi_language.engine import ExecutionEngine, ExecutionResult, default_engine
+
+
+@dataclass
+class CheckResult:
+    passed: bool
+    score: float = 0.0
+    message: str = ""
+    # the checker itself failed; the verdict says nothing about the submission
+    error: bool = False
+
+
+Checker = Callable[[str, str, str], CheckResult]
+
+
+def _verdict(ok: bool, message: str = "") -> CheckResult:
+    return CheckResult(ok, 1.0 if ok else 0.0, message)
+
+
+def exact(input_data: str, output: str, expected: str) -> CheckResult:
+    def norm(text):
+        return [line.rstrip() for line in text.rstrip().splitlines()]
+    got, want = norm(output), norm(expected)
+    if got == want:
+        return _verdict(True)
+    for i, (a, b) in enumerate(zip(got, want), 1):
+        if a != b:
+            return _verdict(False, f"line {i} differs")
+    return _verdict(False, f"expected {len(want)} lines, got {len(got)}")
+
+
+def tokens(input_data: str, output: str, expected: str) -> CheckResult:
+    got, want = output.split(), expected.split()
+    if got == want:
+        return _verdict(True)
+    return _verdict(False, f"expected {len(want)} tokens, got {len(got)}" if len(got) != len(want)
+                    else "token mismatch")
+
+
+def floats(eps: float = 1e-6) -> Checker:
+    def check(input_data: str, output: str, expected: str) -> CheckResult:
+        got, want = output.split(), expected.split()
+        if len(got) != len(want):
+            return _verdict(False, f"expected {len(want)} tokens, got {len(got)}")
+        for i, (a, b) in enumerate(zip(got, want), 1):
+            try:
+                x, y = float(a), float(b)
+            except ValueError:
+                if a != b:
+                    return _verdict(False, f"token {i} differs")
+                continue
+            if abs(x - y) > eps * max(1.0, abs(y)):
+                return _verdict(False, f"token {i}: expected {b}, got {a}")
+        return _verdict(True)
+    return check
+
+
+class ProgramChecker:
+    """A custom checker program, compiled once (through the compile cache) and reused for every test."""
+
+    def __init__(self, source_path: str, language: str = "cpp", timeout: float = 5.0,
+                 engine: Optional[ExecutionEngine] = None):
+        self.source_path = source_path
+        self.language = language
+        self.timeout = timeout
+        self.engine = engine or default_engine()
+        self._prepared = None
+        self._lock = threading.Lock()
+
+    def _prepare(self):
+        with self._lock:
+            if self._prepared is None:
+                prepared = self.engine.prepare(self.language, self.source_path)
+                if isinstance(prepared, ExecutionResult):
+                    raise RuntimeError(f"checker does not compile: {prepared.compile_output or prepared.stderr}")
+                self._prepared = prepared
+            return self._prepared
+
+    def __call__(self, input_data: str, output: str, expected: str) -> CheckResult:
+        try:
+            prepared = self._prepare()
+        except RuntimeError as e:
+            return CheckResult(False, 0.0, str(e), error=True)
+        workdir = tempfile.mkdtemp(prefix="checker-")
+        try:
+            paths = []
+            for name, text in (("input", input_data), ("output", output), ("answer", expected)):
+                path = os.path.join(workdir, name)
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write(text)
+                paths.append(path)
+            res = self.engine.run(prepared, "", self.timeout, args=paths)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        message = (res.stderr or res.stdout).strip()[:1000]
+        if res.status not in ("ok", "runtime_error") or res.exit_code not in (0, 1, 2):
+            return CheckResult(False, 0.0, f"checker failed ({res.status}, exit {res.exit_code}): {message}",
+                               error=True)
+        passed = res.exit_code == 0
+        score = 1.0 if passed else 0.0
+        first = res.stdout.split()[:1]
+        if first:
+            try:
+                score = min(1.0, max(0.0, float(first[0])))
+            except ValueError:
+                pass
+        return CheckResult(passed, score, message)
+
+
+BUILTIN = {"exact": exact, "tokens": tokens}
+
+
+def get_checker(spec: Union[str, dict, Checker, None] = None) -> Checker:
+    """Resolve "exact", "tokens", "float[:eps]", {"program": path, "language": ...} or a callable."""
+    if spec is None:
+        return exact
+    if callable(spec):
+        return spec
+    if isinstance(spec, dict):
+        return ProgramChecker(spec["program"], spec.get("language", "cpp"), float(spec.get("timeout", 5.0)))
+    name, _, arg = spec.partition(":")
+    if name == "float":
+        return floats(float(arg) if arg else 1e-6)
+    try:
+        return BUILTIN[name]
+    except KeyError:
+        raise ValueError(f"unknown checker: {spec}")
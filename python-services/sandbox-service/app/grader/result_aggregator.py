@@ -1,5 +1,39 @@
 """Aggregate results and produce final payload."""
+from collections import Counter
 
+from app.grader.score_calculator import calculate_score
 
-def aggregate_results(test_results):
-    return {"tests": test_results, "summary": {}}
+
+def aggregate_results(test_results, max_score: float = 100):
+    """Final payload from run_tests() output: per-test details plus score and per-subtask breakdown."""
+    details = test_results.get("details", [])
+    ran = [d for d in details if d.get("status") != "skipped"]
+    subtasks = test_results.get("subtasks", [])
+    total_weight = sum(s["weight"] for s in subtasks) or 1
+    summary = {
+        "status": test_results.get("status", "ok"),
+        "score": calculate_score(test_results, max_score),
+        "maxScore": max_score,
+        "passed": test_results.get("passed", 0),
+        "total": test_results.get("total", len(details)),
+        "executed": test_results.get("executed", len(ran)),
+        "verdicts": dict(Counter(d["status"] for d in details)),
+        "maxRunMs": max((d.get("runMs", 0) for d in ran), default=0),
+        "maxMemoryKb": max((d.get("memoryKb", 0) for d in ran), default=0),
+        "subtasks": [
+            {
+                "name": s["name"],
+                "points": round(s["weight"] * s["score"] / total_weight * max_score, 2),
+                "maxPoints": round(s["weight"] / total_weight * max_score, 2),
+                "passed": s["passed"],
+                "firstFailure": s["firstFailure"],
+                "skipped": s["skipped"],
+                "status": s.get("status", "ok"),
+                "internalErrors": s.get("internalErrors", []),
+            }
+            for s in subtasks
+        ],
+    }
+    if test_results.get("compileOutput"):
+        summary["compileOutput"] = test_results["compileOutput"]
+    return {"tests": details, "summary": summary}
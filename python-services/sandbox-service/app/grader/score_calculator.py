@@ -1,9 +1,29 @@
 """Score calculation utilities."""
+from typing import Dict, List
 
 
-def calculate_score(results):
+def subtask_score(mode: str, test_scores: List[float]) -> float:
+    """Fraction in [0, 1] earned by a subtask.
+
+    "min": the weakest test decides (all-or-nothing for plain checkers), so the
+    subtask can stop at its first failure. "sum": the mean over all its tests.
+    """
+    if not test_scores:
+        return 0.0
+    if mode == "min":
+        return min(test_scores)
+    return sum(test_scores) / len(test_scores)
+
+
+def calculate_score(results: Dict, max_score: float = 100) -> float:
+    subtasks = results.get("subtasks")
+    if subtasks:
+        total_weight = sum(s["weight"] for s in subtasks)
+        if total_weight <= 0:
+            return 0
+        return round(sum(s["weight"] * s["score"] for s in subtasks) / total_weight * max_score, 2)
     total = results.get("total", 0)
     passed = results.get("passed", 0)
     if total == 0:
         return 0
-    return int((passed / total) * 100)
+    return int((passed / total) * max_score)
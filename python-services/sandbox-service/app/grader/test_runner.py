@@ -1,7 +1,182 @@
-"""Run test cases against submission outputs (placeholder)."""
-from typing import List, Dict
+"""Run test cases against a submission.
 
+Tests are grouped into weighted subtasks. A "min" subtask (the default when
+subtasks are declared) is worth its weakest test, so it runs its tests in
+order and stops at the first failure; the rest are reported as skipped. A
+"sum" subtask runs every test and earns the mean score. Without subtasks all
+tests form one "sum" subtask. The submission is compiled once; subtasks (and
+the tests of "sum" subtasks) run concurrently, and a test shared by several
+subtasks is executed only once.
 
-def run_tests(submission_path: str, tests: List[Dict]) -> Dict:
-    # Placeholder: run tests and return results
-    return {"total": len(tests), "passed": 0, "details": []}
+A checker_error or internal_error is no verdict on the submission: it neither
+stops a "min" subtask nor counts as a failed test. The subtask (and the whole
+result) is reported as internal_error instead, with the affected tests listed
+in "internalErrors", and is scored over the tests that did get a verdict.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from app.grader.checker import get_checker
+from app.grader.score_calculator import subtask_score
+from app.multi_language.engine import ExecutionEngine, ExecutionResult, default_engine
+
+# test statuses that say nothing about the submission
+NO_VERDICT = ("checker_error", "internal_error")
+
+
+def _subtasks(tests: List[Dict], subtasks: Optional[List[Dict]]) -> List[Dict]:
+    """Normalized subtask groups; raises ValueError for an unknown mode or a test index out of range."""
+    if subtasks:
+        groups = [
+            {"name": str(s.get("name", i)), "weight": float(s.get("weight", 1)), "mode": s.get("mode", "min"),
+             "tests": list(s.get("tests", []))}
+            for i, s in enumerate(subtasks)
+        ]
+        for group in groups:
+            if group["mode"] not in ("min", "sum"):
+                raise ValueError(f"subtask {group['name']}: unknown mode {group['mode']!r}")
+            for index in group["tests"]:
+                if not isinstance(index, int) or isinstance(index, bool) or not 0 <= index < len(tests):
+                    raise ValueError(f"subtask {group['name']}: test index {index!r} is out of range "
+                                     f"(there are {len(tests)} tests)")
+        return groups
+    groups: Dict[str, List[int]] = {}
+    for i, test in enumerate(tests):
+        if "subtask" in test:
+            groups.setdefault(str(test["subtask"]), []).append(i)
+    if groups:
+        return [{"name": name, "weight": 1.0, "mode": "min", "tests": idx} for name, idx in groups.items()]
+    return [{"name": "all", "weight": 1.0, "mode": "sum", "tests": list(range(len(tests)))}]
+
+
+def _detail(index: int, res: ExecutionResult, check=None) -> Dict:
+    status, passed, score, message = res.status, False, 0.0, ""
+    if res.status == "ok" and check is not None:
+        passed, score, message = check.passed, check.score, check.message
+        status = "checker_error" if check.error else ("passed" if passed else "wrong_answer")
+    elif res.status != "ok":
+        message = res.stderr[-1000:]
+    return {
+        "index": index,
+        "status": status,
+        "passed": passed,
+        "score": score,
+        "message": message,
+        "runMs": res.run_ms,
+        "cpuMs": res.cpu_user_ms + res.cpu_sys_ms,
+        "memoryKb": res.memory_kb,
+    }
+
+
+class _Memo:
+    """Per-test results shared by the subtasks; the first asker runs the test, later askers wait for it.
+
+    If the test raises, every asker gets the same exception.
+    """
+
+    def __init__(self, evaluate):
+        self.evaluate = evaluate
+        self.lock = threading.Lock()
+        # index -> [done event, result, exception]
+        self.entries: Dict[int, List] = {}
+
+    def get(self, index: int) -> Dict:
+        with self.lock:
+            entry = self.entries.get(index)
+            owner = entry is None
+            if owner:
+                entry = self.entries[index] = [threading.Event(), None, None]
+        if owner:
+            try:
+                entry[1] = self.evaluate(index)
+            except BaseException as e:
+                entry[2] = e
+            finally:
+                entry[0].set()
+        else:
+            entry[0].wait()
+        if entry[2] is not None:
+            raise entry[2]
+        return entry[1]
+
+
+def run_tests(submission_path: str, tests: List[Dict], language: str = "python",
+              subtasks: Optional[List[Dict]] = None, checker=None, time_limit_ms: int = 2000,
+              memory_mb: int = 256, parallelism: int = 4, engine: Optional[ExecutionEngine] = None) -> Dict:
+    """Grade `submission_path` against `tests` ({"input", "expected", optional "subtask"}).
+
+    `subtasks` is a list of {"name", "weight", "tests": [test indices], "mode": "min" | "sum"};
+    `checker` is anything get_checker() accepts. Raises ValueError for invalid subtasks, before
+    anything is compiled or run. A test whose evaluation fails is reported as internal_error.
+    """
+    engine = engine or default_engine()
+    groups = _subtasks(tests, subtasks)
+    prepared = engine.prepare(language, submission_path)
+    if isinstance(prepared, ExecutionResult):
+        return {
+            "status": prepared.status, "total": len(tests), "passed": 0, "executed": 0,
+            "compileOutput": prepared.compile_output or prepared.stderr,
+            "details": [{"index": i, "status": "skipped", "passed": False, "score": 0.0} for i in range(len(tests))],
+            "subtasks": [dict(g, score=0.0, passed=False, firstFailure=None, skipped=len(g["tests"]), status="ok",
+                              internalErrors=[]) for g in groups],
+        }
+    check = get_checker(checker)
+    timeout = time_limit_ms / 1000
+
+    def evaluate(index: int) -> Dict:
+        test = tests[index]
+        try:
+            res = engine.run(prepared, test.get("input", ""), timeout, memory_mb)
+            verdict = check(test.get("input", ""), res.stdout, test.get("expected", "")) if res.status == "ok" else None
+        except Exception as e:
+            return _detail(index, ExecutionResult("internal_error", stderr=f"{type(e).__name__}: {e}"))
+        return _detail(index, res, verdict)
+
+    memo = _Memo(evaluate)
+
+    def run_in_order(group: Dict):
+        for index in group["tests"]:
+            detail = memo.get(index)
+            if detail["status"] in NO_VERDICT:
+                continue
+            if not detail["passed"]:
+                # the subtask is lost at its first failure; skip what remains
+                return
+
+    with ThreadPoolExecutor(max_workers=max(1, parallelism), thread_name_prefix="grader") as pool:
+        futures = []
+        for group in groups:
+            if group["mode"] == "min":
+                futures.append(pool.submit(run_in_order, group))
+            else:
+                futures.extend(pool.submit(memo.get, index) for index in group["tests"])
+        for fut in futures:
+            fut.result()
+
+    details = []
+    for i in range(len(tests)):
+        entry = memo.entries.get(i)
+        details.append(entry[1] if entry else {"index": i, "status": "skipped", "passed": False, "score": 0.0})
+    breakdown = []
+    for group in groups:
+        ran = [details[i] for i in group["tests"] if details[i]["status"] != "skipped"]
+        errors = [d["index"] for d in ran if d["status"] in NO_VERDICT]
+        judged = [d for d in ran if d["status"] not in NO_VERDICT]
+        failure = next((d["index"] for d in judged if not d["passed"]), None)
+        scores = [d["score"] for d in judged] + [0.0] * (len(group["tests"]) - len(ran))
+        breakdown.append(dict(
+            group, score=subtask_score(group["mode"], scores),
+            passed=failure is None and not errors and len(ran) == len(group["tests"]),
+            firstFailure=failure, skipped=len(group["tests"]) - len(ran),
+            status="internal_error" if errors else "ok", internalErrors=errors,
+        ))
+    return {
+        "status": "internal_error" if any(b["internalErrors"] for b in breakdown) else "ok",
+        "total": len(tests),
+        "passed": sum(d["passed"] for d in details),
+        "executed": len(memo.entries),
+        "compileMs": prepared.compile_ms,
+        "details": details,
+        "subtasks": breakdown,
+    }
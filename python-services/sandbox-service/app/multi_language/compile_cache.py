@@ -0,0 +1,268 @@
+"""Content-addressed cache of compiled artifacts (C++ binaries, Java class files).
+
+An entry is keyed by the source bytes, its file name, the compiler flags and the
+toolchain version, so each unique source compiles once and every later test
+case or resubmission just runs the cached artifact. Entries are directories
+under the cache root, published with an atomic rename.
+
+Submissions run as the same user as the service and could rewrite a cached
+artifact that another source will later run. So the cache only trusts
+artifacts whose digest it recorded in this process when it built them (the
+record lives in memory, out of a submission's reach). Every hit re-hashes the
+entry, and a changed entry is dropped and rebuilt. An entry published by
+another process (or a lost publish race) is trusted only if a fresh build
+yields the same digest; otherwise this process keeps its own build under a
+private name. The total size is tracked incrementally and kept under
+`max_bytes` by evicting the least recently used entries (mtime is bumped on
+every hit), skipping entries pinned by a running submission in this process
+and entries used within `min_idle_s`, which also covers runs in other
+processes. Entries found at startup or published by this process are
+counted and may be evicted; other processes account for their own.
+"""
+import errno
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+DEFAULT_ROOT = os.path.join(tempfile.gettempdir(), "sandbox-compile-cache")
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+@lru_cache(maxsize=None)
+def toolchain_version(*cmd: str) -> str:
+    """First line of e.g. `g++ --version`; part of the cache key so upgrades invalidate entries."""
+    try:
+        p = subprocess.run(list(cmd), capture_output=True, text=True, timeout=10)
+        text = (p.stdout or p.stderr).strip()
+        return text.splitlines()[0] if text else ""
+    except Exception:
+        return ""
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for base, _, files in os.walk(path):
+        for name in files:
+            total += os.lstat(os.path.join(base, name)).st_size
+    return total
+
+
+def _digest(path: str) -> Tuple[str, int]:
+    """(sha256 over every file's relative path, mode and bytes, total size) of an entry directory."""
+    h = hashlib.sha256()
+    total = 0
+    for base, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            full = os.path.join(base, name)
+            st = os.lstat(full)
+            h.update(os.path.relpath(full, path).encode("utf-8", "surrogateescape") + b"\0")
+            h.update(str(st.st_mode).encode() + b"\0")
+            if os.path.islink(full):
+                h.update(os.readlink(full).encode("utf-8", "surrogateescape"))
+            else:
+                with open(full, "rb") as f:
+                    for chunk in iter(lambda: f.read(1 << 20), b""):
+                        h.update(chunk)
+            h.update(b"\0")
+            total += st.st_size
+    return h.hexdigest(), total
+
+
+class CompileCache:
+    def __init__(self, root: str = None, max_bytes: int = None, min_idle_s: float = 60.0):
+        self.root = root or os.environ.get("SANDBOX_COMPILE_CACHE_DIR", DEFAULT_ROOT)
+        self.max_bytes = max_bytes or int(os.environ.get("SANDBOX_COMPILE_CACHE_BYTES", DEFAULT_MAX_BYTES))
+        self.min_idle_s = min_idle_s
+        os.makedirs(self.root, exist_ok=True)
+        self._lock = threading.Lock()
+        # a key's lock lives only while some caller holds it
+        self._key_locks: "weakref.WeakValueDictionary[str, threading.Lock]" = weakref.WeakValueDictionary()
+        self._pins: Dict[str, int] = {}
+        # key -> (entry dir, digest) for the artifacts this process built and vouches for
+        self._trusted: Dict[str, Tuple[str, str]] = {}
+        # entry dir -> size in bytes, and their sum
+        self._sizes: Dict[str, int] = {}
+        self._total = 0
+        # entries left by earlier processes are not trusted, but they count and can be evicted
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if not name.startswith(".") and os.path.isdir(path):
+                try:
+                    self._sizes[path] = _dir_size(path)
+                except OSError:
+                    continue
+                self._total += self._sizes[path]
+        self.stats = {"hits": 0, "misses": 0, "failures": 0, "evictions": 0, "raceLosses": 0, "tampered": 0,
+                      "foreignMismatches": 0}
+
+    @staticmethod
+    def key(source_path: str, flags: Sequence[str], toolchain: str) -> str:
+        h = hashlib.sha256()
+        with open(source_path, "rb") as f:
+            h.update(f.read())
+        for part in (os.path.basename(source_path), "\0".join(flags), toolchain):
+            h.update(b"\0" + part.encode("utf-8"))
+        return h.hexdigest()
+
+    def get_or_build(self, source_path: str, flags: Sequence[str], toolchain: str,
+                     build: Callable[[str, str], Tuple[int, str]]) -> Tuple[Optional[str], int, str]:
+        """Return (entry_dir, rc, stderr) for a compiled `source_path`.
+
+        On a miss `build(source_path, out_dir)` compiles into a scratch dir and
+        returns (rc, stderr); only successful builds are cached. entry_dir is None
+        when compilation failed.
+        """
+        key = self.key(source_path, flags, toolchain)
+        with self._lock:
+            key_lock = self._key_locks.get(key)
+            if key_lock is None:
+                key_lock = self._key_locks[key] = threading.Lock()
+        # one compile per key even when many test cases ask at once
+        with key_lock:
+            entry = self._verified(key)
+            if entry is not None:
+                self._touch(entry)
+                with self._lock:
+                    self.stats["hits"] += 1
+                return entry, 0, ""
+            scratch = tempfile.mkdtemp(prefix=".build-", dir=self.root)
+            try:
+                rc, err = build(source_path, scratch)
+                if rc != 0:
+                    with self._lock:
+                        self.stats["failures"] += 1
+                    return None, rc, err
+                digest, size = _digest(scratch)
+                entry = self._publish(key, scratch, digest)
+                scratch = None
+            finally:
+                if scratch:
+                    shutil.rmtree(scratch, ignore_errors=True)
+            with self._lock:
+                self._trusted[key] = (entry, digest)
+                self._total += size - self._sizes.get(entry, 0)
+                self._sizes[entry] = size
+                self.stats["misses"] += 1
+        self._evict(keep=entry)
+        return entry, 0, err
+
+    def _verified(self, key: str) -> Optional[str]:
+        """The trusted entry for `key` if it is still byte-for-byte what this process built."""
+        with self._lock:
+            trusted = self._trusted.get(key)
+        if trusted is None:
+            return None
+        entry, digest = trusted
+        try:
+            ok = _digest(entry)[0] == digest
+        except OSError:
+            # evicted (here or by another process)
+            ok = False
+        if ok:
+            return entry
+        with self._lock:
+            self._trusted.pop(key, None)
+            self._total -= self._sizes.pop(entry, 0)
+            if os.path.isdir(entry):
+                self.stats["tampered"] += 1
+        if os.path.isdir(entry):
+            shutil.rmtree(entry, ignore_errors=True)
+        return None
+
+    def _publish(self, key: str, scratch: str, digest: str) -> str:
+        """Move a fresh build into place and return its entry dir; `scratch` is consumed."""
+        entry = os.path.join(self.root, key)
+        try:
+            os.rename(scratch, entry)
+            return entry
+        except OSError as e:
+            if e.errno not in (errno.ENOTEMPTY, errno.EEXIST) or not os.path.isdir(entry):
+                shutil.rmtree(scratch, ignore_errors=True)
+                raise
+        # someone else's entry (another process, or one this process no longer trusts):
+        # reuse it only if it is identical to what we just built
+        with self._lock:
+            self.stats["raceLosses"] += 1
+        try:
+            same = _digest(entry)[0] == digest
+        except OSError:
+            same = False
+        if same:
+            shutil.rmtree(scratch, ignore_errors=True)
+            self._touch(entry)
+            return entry
+        with self._lock:
+            self.stats["foreignMismatches"] += 1
+        private = tempfile.mkdtemp(prefix=f"{key}-", dir=self.root)
+        os.rmdir(private)
+        os.rename(scratch, private)
+        return private
+
+    @contextmanager
+    def pinned(self, entry: str):
+        """Keep `entry` from being evicted while a submission runs from it."""
+        with self._lock:
+            self._pins[entry] = self._pins.get(entry, 0) + 1
+        self._touch(entry)
+        try:
+            yield entry
+        finally:
+            with self._lock:
+                if self._pins[entry] <= 1:
+                    del self._pins[entry]
+                else:
+                    self._pins[entry] -= 1
+
+    def _touch(self, entry: str):
+        try:
+            os.utime(entry)
+        except OSError:
+            pass
+
+    def _evict(self, keep: str):
+        with self._lock:
+            if self._total <= self.max_bytes:
+                return
+            candidates = [path for path in self._sizes if path != keep and path not in self._pins]
+        entries = []
+        for path in candidates:
+            try:
+                entries.append((os.stat(path).st_mtime, path))
+            except OSError:
+                # already gone (e.g. evicted by another process)
+                entries.append((0.0, path))
+        recent = time.time() - self.min_idle_s
+        for mtime, path in sorted(entries):
+            with self._lock:
+                if self._total <= self.max_bytes:
+                    return
+                if path in self._pins or mtime > recent:
+                    continue
+                self._total -= self._sizes.pop(path, 0)
+                for key, (entry, _) in list(self._trusted.items()):
+                    if entry == path:
+                        del self._trusted[key]
+                self.stats["evictions"] += 1
+            shutil.rmtree(path, ignore_errors=True)
+
+
+_default: Optional[CompileCache] = None
+_default_lock = threading.Lock()
+
+
+def default_cache() -> CompileCache:
+    """Process-wide cache shared by the runners."""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = CompileCache()
+        return _default
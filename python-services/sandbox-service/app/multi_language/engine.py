@@ -0,0 +1,415 @@
+"""Unified multi-language execution engine.
+
+Every language is a LanguageSpec in a registry: where the source goes, how to
+compile it (optional), how to run the result and which rlimits apply. The
+engine compiles through the shared compile cache under its own budget, then
+runs the artifact with stdin fed from memory, bounded stdout/stderr capture,
+wall-clock and CPU deadlines (from the shared DeadlineManager) that exclude
+compilation, and wait4 resource accounting, and returns a structured
+ExecutionResult. Runs go through rlimit_shim.py, which applies the rlimits
+after exec and reports the submission's own rusage. Processes are capped per
+run by a cgroup `pids.max` (SANDBOX_CGROUP_DIR), not by RLIMIT_NPROC, which
+would count every thread of the server's UID.
+
+More languages can be registered in code (`register_language`) or from a JSON
+file named by SANDBOX_LANGUAGES_FILE:
+
+    {"ruby": {"source_file": "main.rb", "run": ["ruby", "{src}"], "toolchain": ["ruby", "--version"]}}
+
+Command templates may use {src} (source path), {dir} (source dir), {out}
+(artifact dir), {main} (source file stem) and {memory_mb}.
+"""
+import json
+import os
+import selectors
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional, Sequence
+
+from app.multi_language.compile_cache import CompileCache, default_cache, toolchain_version
+from app.resource_monitor.cgroup import RunCgroup
+from app.resource_monitor.sampler import default_sampler
+from app.resource_monitor.timeout_manager import deadline_manager, kill_group
+
+DEFAULT_OUTPUT_LIMIT = 64 * 1024
+SHIM = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rlimit_shim.py")
+CHUNK = 65536
+
+
+@dataclass
+class LanguageSpec:
+    name: str
+    source_file: str
+    run: List[str]
+    compile: Optional[List[str]] = None
+    toolchain: Optional[List[str]] = None
+    # cap RLIMIT_AS at memory_mb; off for runtimes that reserve huge virtual ranges
+    # (JVM, V8), which get a heap flag via {memory_mb} instead
+    address_space: bool = True
+    # process/thread cap, enforced as the run cgroup's pids.max (see resource_monitor/cgroup.py)
+    nproc: int = 64
+    fsize_mb: int = 16
+    stack_mb: Optional[int] = 64
+    env: Dict[str, str] = field(default_factory=dict)
+
+
+@dataclass
+class ExecutionResult:
+    # ok | compile_error | runtime_error | timeout | output_limit | internal_error
+    status: str
+    exit_code: Optional[int] = None
+    stdout: str = ""
+    stderr: str = ""
+    compile_output: str = ""
+    stdout_truncated: bool = False
+    stderr_truncated: bool = False
+    compile_ms: int = 0
+    run_ms: int = 0
+    cpu_user_ms: int = 0
+    cpu_sys_ms: int = 0
+    memory_kb: int = 0
+    cached_build: bool = False
+    # peak/mean CPU and memory from the background sampler, when it is on
+    usage: Optional[Dict] = None
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+    def as_tuple(self):
+        """(exit_code, stdout, stderr) as returned by the legacy per-language runners."""
+        if self.status == "compile_error":
+            return self.exit_code if self.exit_code is not None else 1, "", self.compile_output
+        if self.status in ("timeout", "internal_error"):
+            return -1, "", self.stderr
+        return self.exit_code, self.stdout, self.stderr
+
+
+_LANGUAGES: Dict[str, LanguageSpec] = {}
+
+
+def register_language(spec: LanguageSpec):
+    _LANGUAGES[spec.name] = spec
+
+
+def get_language(name: str) -> LanguageSpec:
+    try:
+        return _LANGUAGES[name]
+    except KeyError:
+        raise ValueError(f"unsupported language: {name}")
+
+
+def languages() -> List[str]:
+    return sorted(_LANGUAGES)
+
+
+def load_languages(path: str):
+    """Register (or override) languages from a JSON config file."""
+    with open(path, encoding="utf-8") as f:
+        for name, cfg in json.load(f).items():
+            register_language(LanguageSpec(name=name, **cfg))
+
+
+for _spec in (
+    LanguageSpec("python", "main.py", run=["python", "{src}"], toolchain=["python", "--version"]),
+    LanguageSpec("node", "main.js", run=["node", "--max-old-space-size={memory_mb}", "{src}"],
+                 toolchain=["node", "--version"], address_space=False),
+    LanguageSpec("cpp", "main.cpp", compile=["g++", "-O2", "-std=gnu++17", "{src}", "-o", "{out}/main"],
+                 run=["{out}/main"], toolchain=["g++", "--version"]),
+    LanguageSpec("java", "Main.java", compile=["javac", "-d", "{out}", "{src}"],
+                 run=["java", "-Xmx{memory_mb}m", "-XX:+UseSerialGC", "-cp", "{out}", "{main}"],
+                 toolchain=["javac", "-version"], address_space=False, nproc=256),
+):
+    register_language(_spec)
+
+if os.environ.get("SANDBOX_LANGUAGES_FILE"):
+    load_languages(os.environ["SANDBOX_LANGUAGES_FILE"])
+
+
+def shim_argv(report_fd: int, limits: List[List], cmd: Sequence[str], cgroup: Optional[RunCgroup] = None) -> List[str]:
+    """Command line that runs `cmd` under `limits` (inside `cgroup`) through rlimit_shim.py, reporting on `report_fd`."""
+    return [sys.executable, "-I", "-S", "-B", SHIM, str(report_fd), json.dumps(limits), cgroup.procs if cgroup else "",
+            *cmd]
+
+
+def _fill(template: List[str], **values) -> List[str]:
+    return [part.format(**values) for part in template]
+
+
+class _Capture:
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.data = bytearray()
+        self.truncated = False
+
+    def add(self, chunk: bytes) -> bool:
+        """Keep up to `limit` bytes; False once the stream went over it."""
+        room = self.limit - len(self.data)
+        if len(chunk) > room:
+            self.data += chunk[:max(0, room)]
+            self.truncated = True
+            return False
+        self.data += chunk
+        return True
+
+    def text(self) -> str:
+        return self.data.decode("utf-8", errors="replace")
+
+
+class Prepared:
+    """A compiled (or, for interpreted languages, located) submission ready to run."""
+
+    def __init__(self, spec: LanguageSpec, source_path: str, artifact_dir: str, compile_ms: int, cached: bool,
+                 compile_output: str = "", cache: Optional[CompileCache] = None):
+        self.spec = spec
+        self.source_path = source_path
+        self.artifact_dir = artifact_dir
+        # set when artifact_dir is a compile cache entry
+        self.cache = cache
+        self.compile_ms = compile_ms
+        self.cached = cached
+        self.compile_output = compile_output
+
+
+class ExecutionEngine:
+    def __init__(self, cache: Optional[CompileCache] = None):
+        self.cache = cache
+
+    def prepare(self, language: str, source_path: str, compile_timeout: float = 10.0):
+        """Compile `source_path` (cached) within `compile_timeout`. Returns Prepared or a compile_error result."""
+        spec = get_language(language)
+        source_path = os.path.abspath(source_path)
+        if not spec.compile:
+            return Prepared(spec, source_path, os.path.dirname(source_path), 0, False)
+        cache = self.cache or default_cache()
+        start = time.perf_counter()
+        built = {"ran": False}
+
+        def build(src: str, out_dir: str):
+            built["ran"] = True
+            cmd = _fill(spec.compile, src=src, dir=os.path.dirname(src), out=out_dir,
+                        main=os.path.splitext(os.path.basename(src))[0], memory_mb=0)
+            try:
+                p = subprocess.run(cmd, capture_output=True, text=True, timeout=compile_timeout)
+            except subprocess.TimeoutExpired:
+                return 124, f"compilation timed out after {compile_timeout} seconds"
+            return p.returncode, (p.stderr or "") + (p.stdout or "")
+
+        toolchain = toolchain_version(*spec.toolchain) if spec.toolchain else ""
+        flags = [spec.name, *spec.compile]
+        try:
+            entry, rc, output = cache.get_or_build(source_path, flags, toolchain, build)
+        except Exception as e:
+            return ExecutionResult("internal_error", stderr=str(e))
+        compile_ms = int((time.perf_counter() - start) * 1000)
+        if entry is None:
+            return ExecutionResult("compile_error", exit_code=rc, compile_output=output, compile_ms=compile_ms)
+        return Prepared(spec, source_path, entry, compile_ms, not built["ran"], output, cache)
+
+    def run(self, prepared: Prepared, stdin: str = "", timeout: float = 2.0, memory_mb: int = 256,
+            output_limit: int = DEFAULT_OUTPUT_LIMIT, args: Sequence[str] = ()) -> ExecutionResult:
+        """Run a prepared submission once, feeding `stdin`, within `timeout` seconds of wall time.
+
+        `args` are appended to the language's run command (e.g. file paths for a checker).
+        """
+        if prepared.cache is None:
+            return self._run(prepared, stdin, timeout, memory_mb, output_limit, args)
+        with prepared.cache.pinned(prepared.artifact_dir):
+            return self._run(prepared, stdin, timeout, memory_mb, output_limit, args)
+
+    def _run(self, prepared: Prepared, stdin: str, timeout: float, memory_mb: int, output_limit: int,
+             args: Sequence[str]) -> ExecutionResult:
+        spec = prepared.spec
+        src = prepared.source_path
+        cmd = _fill(spec.run, src=src, dir=os.path.dirname(src), out=prepared.artifact_dir,
+                    main=os.path.splitext(os.path.basename(src))[0], memory_mb=memory_mb) + list(args)
+        result = ExecutionResult("ok", compile_ms=prepared.compile_ms, cached_build=prepared.cached,
+                                 compile_output=prepared.compile_output)
+        env = dict(os.environ, **spec.env)
+        try:
+            cgroup = RunCgroup.create(f"run-{spec.name}", spec.nproc)
+        except OSError as e:
+            result.status, result.stderr = "internal_error", f"cannot create run cgroup: {e}"
+            return result
+        report_r, report_w = os.pipe()
+        try:
+            # no preexec_fn: the rlimits are applied by the shim, so Popen can vfork safely in threaded servers
+            proc = subprocess.Popen(
+                shim_argv(report_w, self._limits(spec, timeout, memory_mb), cmd, cgroup),
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                cwd=os.path.dirname(src), env=env, start_new_session=True, pass_fds=(report_w,),
+            )
+        except OSError as e:
+            os.close(report_r)
+            if cgroup:
+                cgroup.remove()
+            result.status, result.stderr = "internal_error", str(e)
+            return result
+        finally:
+            os.close(report_w)
+
+        report = os.fdopen(report_r, "rb")
+        status = None
+        deadline = sampler = sample_key = None
+        try:
+            first = report.readline().split()
+            child = int(first[1]) if first[:1] == [b"pid"] else None
+            # the clock starts once the submission exists; shim startup is not charged to it
+            start = time.perf_counter()
+            # the shim leads the session; CPU and memory are those of the submission itself
+            deadline = deadline_manager().register(child or proc.pid, wall_s=timeout, cpu_s=timeout, pgid=proc.pid)
+            sampler = default_sampler() if child else None
+            sample_key = f"run-{child}-{id(proc)}"
+            if sampler:
+                sampler.watch(sample_key, pid=child)
+            out, err, over = self._pump(proc, stdin.encode("utf-8"), output_limit, start + timeout)
+            if over:
+                kill_group(proc.pid)
+            proc.returncode = os.waitstatus_to_exitcode(os.waitpid(proc.pid, 0)[1])
+            last = report.read().split()
+            if last[:1] == [b"exit"]:
+                status, maxrss_kb, utime, stime = int(last[1]), int(last[2]), float(last[3]), float(last[4])
+        finally:
+            report.close()
+            if deadline is not None:
+                deadline_manager().cancel(deadline)
+            if sampler:
+                result.usage = sampler.unwatch(sample_key)
+            # nothing the submission started may outlive it, not even in another session
+            kill_group(proc.pid)
+            if cgroup:
+                cgroup.remove()
+            if proc.returncode is None:
+                # _pump (or anything above) raised: still reap the shim
+                try:
+                    os.waitpid(proc.pid, 0)
+                except ChildProcessError:
+                    pass
+                proc.returncode = -signal.SIGKILL
+        result.run_ms = int((time.perf_counter() - start) * 1000)
+        result.stdout, result.stderr = out.text(), err.text()
+        result.stdout_truncated, result.stderr_truncated = out.truncated, err.truncated
+        if status is not None:
+            result.exit_code = os.waitstatus_to_exitcode(status)
+            result.cpu_user_ms, result.cpu_sys_ms = int(utime * 1000), int(stime * 1000)
+            result.memory_kb = maxrss_kb
+        else:
+            # the shim was killed with the group before it could reap the submission
+            result.exit_code = proc.returncode
+            if result.usage:
+                result.cpu_user_ms = result.usage["cpuMs"]
+                result.memory_kb = result.usage["memoryPeakKb"]
+        if over:
+            result.status = "output_limit"
+        elif deadline.expired or result.exit_code == -signal.SIGXCPU:
+            result.status = "timeout"
+            result.stderr = result.stderr or f"timed out after {timeout} seconds"
+        elif result.exit_code != 0:
+            result.status = "runtime_error"
+        return result
+
+    def execute(self, language: str, source_path: str, stdin: str = "", compile_timeout: float = 10.0,
+                run_timeout: float = 2.0, memory_mb: int = 256,
+                output_limit: int = DEFAULT_OUTPUT_LIMIT) -> ExecutionResult:
+        """prepare() then run(), with separate compile and run budgets."""
+        prepared = self.prepare(language, source_path, compile_timeout)
+        if isinstance(prepared, ExecutionResult):
+            return prepared
+        return self.run(prepared, stdin, run_timeout, memory_mb, output_limit)
+
+    @staticmethod
+    def _limits(spec: LanguageSpec, timeout: float, memory_mb: int) -> List[List]:
+        """[rlimit name, soft, hard] triples for the shim to apply before exec."""
+        cpu_s = int(timeout) + 1
+        limits = [
+            ["RLIMIT_CPU", cpu_s, cpu_s + 1],
+            ["RLIMIT_FSIZE", spec.fsize_mb << 20, spec.fsize_mb << 20],
+            ["RLIMIT_CORE", 0, 0],
+        ]
+        if spec.address_space:
+            limits.append(["RLIMIT_AS", memory_mb << 20, memory_mb << 20])
+        if spec.stack_mb:
+            limits.append(["RLIMIT_STACK", spec.stack_mb << 20, spec.stack_mb << 20])
+        return limits
+
+    @staticmethod
+    def _pump(proc: subprocess.Popen, data: bytes, output_limit: int, deadline: float):
+        """Feed stdin and drain stdout/stderr until EOF, the deadline, or output past `output_limit`."""
+        out, err = _Capture(output_limit), _Capture(output_limit)
+        sinks = {proc.stdout.fileno(): out, proc.stderr.fileno(): err}
+        sel = selectors.DefaultSelector()
+        try:
+            for fd in sinks:
+                os.set_blocking(fd, False)
+                sel.register(fd, selectors.EVENT_READ)
+            stdin_fd = proc.stdin.fileno()
+            if data:
+                os.set_blocking(stdin_fd, False)
+                sel.register(stdin_fd, selectors.EVENT_WRITE)
+            else:
+                proc.stdin.close()
+            view = memoryview(data)
+            while sinks or data:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    return out, err, False
+                for key, _ in sel.select(remaining):
+                    fd = key.fd
+                    if fd == stdin_fd:
+                        try:
+                            n = os.write(fd, view[:CHUNK])
+                        except BlockingIOError:
+                            continue
+                        except BrokenPipeError:
+                            n = len(view)
+                        view = view[n:]
+                        if not view:
+                            sel.unregister(fd)
+                            try:
+                                proc.stdin.close()
+                            except OSError:
+                                pass
+                            data = b""
+                        continue
+                    try:
+                        chunk = os.read(fd, CHUNK)
+                    except BlockingIOError:
+                        continue
+                    if not chunk:
+                        sel.unregister(fd)
+                        del sinks[fd]
+                        continue
+                    if not sinks[fd].add(chunk):
+                        return out, err, True
+            return out, err, False
+        finally:
+            sel.close()
+            for stream in (proc.stdin, proc.stdout, proc.stderr):
+                try:
+                    stream.close()
+                except Exception:
+                    pass
+
+
+    def execute_code(self, language: str, code: str, stdin: str = "", **kwargs) -> ExecutionResult:
+        """Write `code` into a scratch dir using the language's file layout and execute it."""
+        spec = get_language(language)
+        workdir = tempfile.mkdtemp(prefix="sandbox-")
+        try:
+            source_path = os.path.join(workdir, spec.source_file)
+            with open(source_path, "w", encoding="utf-8") as f:
+                f.write(code)
+            return self.execute(language, source_path, stdin, **kwargs)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+_engine = ExecutionEngine()
+
+
+def default_engine() -> ExecutionEngine:
+    return _engine
@@ -1,16 +1,270 @@
-"""Java runner placeholder: compile and run Java code."""
+"""Java runner placeholder: compile and run Java code.
+
+Compilation goes through the execution engine and its compile cache, so a
+source is compiled once and every further run only executes the cached classes.
+Runs either start a
+fresh `java` per call (mode "spawn", the default) or go to a long-lived JVM host
+(mode "worker", see jvm_host/JvmHost.java) that loads each submission in its own
+classloader; set SANDBOX_JAVA_MODE or pass `mode`. Worker mode keeps
+SANDBOX_JVM_WORKERS hosts (default 2), each serving one run at a time.
+"""
+import os
+import queue
+import secrets
+import selectors
+import shutil
 import subprocess
-from typing import Tuple
+import tempfile
+import threading
+import time
+from typing import List, Optional, Tuple
+
+from app.multi_language.engine import ExecutionEngine, ExecutionResult, default_engine, get_language, shim_argv
+from app.resource_monitor.cgroup import RunCgroup
+from app.resource_monitor.timeout_manager import kill_group, process_cpu_seconds
 
+HOST_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "jvm_host", "JvmHost.java")
 
-def run_java(source_path: str, timeout: int = 5) -> Tuple[int, str, str]:
+
+def _read(path: str) -> str:
     try:
-        compile_p = subprocess.run(["javac", source_path], capture_output=True, text=True, timeout=timeout)
-        if compile_p.returncode != 0:
-            return compile_p.returncode, "", compile_p.stderr
+        with open(path, encoding="utf-8", errors="replace") as f:
+            return f.read()
+    except OSError:
+        return ""
+
+
+def _host_limits(case_timeout: float, heap_mb: int, cpu_lifetime_s: int) -> List[List]:
+    """The spawn-mode rlimits for java, except RLIMIT_CPU, which would count every case the host ever ran."""
+    limits = [lim for lim in ExecutionEngine._limits(get_language("java"), case_timeout, heap_mb)
+              if lim[0] != "RLIMIT_CPU"]
+    # lifetime backstop only; per-case CPU is checked from /proc around each case
+    limits.append(["RLIMIT_CPU", cpu_lifetime_s, cpu_lifetime_s + 1])
+    return limits
+
+
+class JvmWorker:
+    """One long-lived JVM host, used by one caller at a time.
+
+    The host runs through rlimit_shim.py in its own session with the same
+    rlimits and pids cgroup as a spawned `java` (RLIMIT_CPU becomes a lifetime
+    cap). Replies
+    come back on a private pipe tagged with a per-request nonce, so nothing a
+    submission prints can pass for one. A case that times out kills the JVM
+    (threads cannot be stopped safely), as do System.exit() and cases that
+    leave threads behind; the next call starts a fresh host. The host is also
+    recycled after `max_submissions` distinct submissions so class metadata
+    and JIT state cannot pile up.
+    """
+
+    def __init__(self, max_submissions: int = 20, heap_mb: int = 256, java: str = "java",
+                 cpu_lifetime_s: int = 600):
+        self.max_submissions = max_submissions
+        self.heap_mb = heap_mb
+        self.java = java
+        self.cpu_lifetime_s = cpu_lifetime_s
+        self.lock = threading.Lock()
+        self._proc: Optional[subprocess.Popen] = None
+        self._java_pid: Optional[int] = None
+        self._ctl: Optional[int] = None
+        self._report: Optional[int] = None
+        self._cgroup: Optional[RunCgroup] = None
+        self._buf = b""
+        self._submissions = set()
+        self.stats = {"started": 0, "recycled": 0, "cases": 0, "forgedReplies": 0}
+
+    def run(self, class_dir: str, class_name: str, input_data: str, timeout: float) -> Tuple[int, str, str]:
+        with self.lock:
+            if class_dir not in self._submissions and len(self._submissions) >= self.max_submissions:
+                self._stop()
+                self.stats["recycled"] += 1
+            if self._proc is None or self._proc.poll() is not None:
+                self._stop()
+                self._start(timeout)
+            self._submissions.add(class_dir)
+            self.stats["cases"] += 1
+            case_dir = tempfile.mkdtemp(prefix="jvm-case-")
+            try:
+                paths = [os.path.join(case_dir, name) for name in ("stdin", "stdout", "stderr")]
+                with open(paths[0], "w", encoding="utf-8") as f:
+                    f.write(input_data)
+                nonce = secrets.token_hex(16)
+                cpu_before = process_cpu_seconds(self._java_pid) or 0.0
+                self._proc.stdin.write("\t".join(["RUN", nonce, class_dir, class_name, *paths]).encode("utf-8") + b"\n")
+                self._proc.stdin.flush()
+                fields = self._reply(nonce, time.monotonic() + timeout)
+                if fields is None:
+                    # timed out: the only reliable way to stop the case is to drop the JVM
+                    self._stop()
+                    return -1, "", f"timed out after {timeout} seconds"
+                if not fields:
+                    # the submission called System.exit(); its status is the JVM's
+                    rc = self._exit_status()
+                    self._stop()
+                    return rc, _read(paths[1]), _read(paths[2])
+                rc = int(fields[2])
+                cpu = (process_cpu_seconds(self._java_pid) or cpu_before) - cpu_before
+                if "DIRTY" in fields[3:]:
+                    self._stop()
+                if cpu > timeout:
+                    self._stop()
+                    return -1, "", f"CPU time limit of {timeout} seconds exceeded"
+                return rc, _read(paths[1]), _read(paths[2])
+            finally:
+                shutil.rmtree(case_dir, ignore_errors=True)
+
+    def close(self):
+        with self.lock:
+            self._stop()
+
+    def _start(self, timeout: float):
+        host = default_engine().prepare("java", HOST_SOURCE, compile_timeout=60)
+        if isinstance(host, ExecutionResult):
+            raise RuntimeError(f"failed to compile JVM host: {host.compile_output or host.stderr}")
+        # the host's pids.max covers every case it runs; a case that fills it only breaks this host
+        self._cgroup = RunCgroup.create("jvm-host", get_language("java").nproc)
+        ctl_r, ctl_w = os.pipe()
+        report_r, report_w = os.pipe()
+        cmd = [self.java, f"-Xmx{self.heap_mb}m", "-XX:+UseSerialGC", "-Xshare:auto", "-cp", host.artifact_dir,
+               "JvmHost", str(ctl_w)]
+        try:
+            self._proc = subprocess.Popen(
+                shim_argv(report_w, _host_limits(timeout, self.heap_mb, self.cpu_lifetime_s), cmd, self._cgroup),
+                stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                start_new_session=True, pass_fds=(report_w, ctl_w),
+            )
+        except OSError:
+            os.close(ctl_r)
+            os.close(report_r)
+            if self._cgroup:
+                self._cgroup.remove()
+                self._cgroup = None
+            raise
+        finally:
+            os.close(ctl_w)
+            os.close(report_w)
+        self._ctl, self._report = ctl_r, report_r
+        self._buf = b""
+        self._submissions = set()
+        self.stats["started"] += 1
+        line = self._report_line(time.monotonic() + 10)
+        self._java_pid = int(line.split()[1]) if line.startswith(b"pid ") else None
+        # JVM startup is not part of any case budget
+        if self._java_pid is None or self._readline(time.monotonic() + max(timeout, 10)) != b"READY\n":
+            self._stop()
+            raise RuntimeError("JVM host failed to start")
+
+    def _reply(self, nonce: str, deadline: float) -> Optional[List[str]]:
+        """Fields of this request's DONE line; [] on EOF (the JVM exited), None once `deadline` passes."""
+        while True:
+            line = self._readline(deadline)
+            if not line:
+                return None if line is None else []
+            fields = line.decode("utf-8", "replace").rstrip("\n").split("\t")
+            if fields[:2] == ["DONE", nonce] and len(fields) >= 3 and fields[2].lstrip("-").isdigit():
+                return fields
+            # anything else on the control pipe was written by the submission
+            self.stats["forgedReplies"] += 1
+
+    def _readline(self, deadline: float, fd: Optional[int] = None) -> Optional[bytes]:
+        """Next line from the control pipe; b"" on EOF, None once `deadline` passes."""
+        fd = self._ctl if fd is None else fd
+        with selectors.DefaultSelector() as sel:
+            sel.register(fd, selectors.EVENT_READ)
+            while b"\n" not in self._buf:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not sel.select(remaining):
+                    return None
+                chunk = os.read(fd, 4096)
+                if not chunk:
+                    return b""
+                self._buf += chunk
+        line, _, self._buf = self._buf.partition(b"\n")
+        return line + b"\n"
+
+    def _report_line(self, deadline: float) -> bytes:
+        # the shim's report pipe carries "pid ..." then "exit ..."; it never shares _buf with the control pipe
+        buf, self._buf = self._buf, b""
+        try:
+            return self._readline(deadline, self._report) or b""
+        finally:
+            self._buf = buf
+
+    def _exit_status(self) -> int:
+        line = self._report_line(time.monotonic() + 5)
+        if line.startswith(b"exit "):
+            return os.waitstatus_to_exitcode(int(line.split()[1]))
+        return -1
+
+    def _stop(self):
+        if self._proc is not None:
+            kill_group(self._proc.pid)
+            try:
+                self._proc.wait()
+            except Exception:
+                pass
+            try:
+                self._proc.stdin.close()
+            except Exception:
+                pass
+        if self._cgroup is not None:
+            self._cgroup.remove()
+        for fd in (self._ctl, self._report):
+            if fd is not None:
+                os.close(fd)
+        self._proc = self._java_pid = self._ctl = self._report = self._cgroup = None
+
+
+class JvmPool:
+    """A fixed set of JVM hosts; each run takes an idle host, so runs on different hosts do not serialize."""
+
+    def __init__(self, size: int = 2, **worker_kwargs):
+        self.size = max(1, size)
+        self._idle: "queue.Queue[JvmWorker]" = queue.Queue()
+        self.workers = [JvmWorker(**worker_kwargs) for _ in range(self.size)]
+        for worker in self.workers:
+            self._idle.put(worker)
+
+    def run(self, class_dir: str, class_name: str, input_data: str, timeout: float) -> Tuple[int, str, str]:
+        worker = self._idle.get()
+        try:
+            return worker.run(class_dir, class_name, input_data, timeout)
+        finally:
+            self._idle.put(worker)
+
+    def close(self):
+        for worker in self.workers:
+            worker.close()
+
+
+_pool: Optional[JvmPool] = None
+_pool_lock = threading.Lock()
+
+
+def jvm_pool() -> JvmPool:
+    """Process-wide JVM hosts shared by every worker-mode run."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = JvmPool(
+                size=int(os.environ.get("SANDBOX_JVM_WORKERS", "2")),
+                max_submissions=int(os.environ.get("SANDBOX_JVM_MAX_SUBMISSIONS", "20")),
+                heap_mb=int(os.environ.get("SANDBOX_JVM_HEAP_MB", "256")),
+            )
+        return _pool
+
+
+def run_java(source_path: str, timeout: int = 5, mode: str = None, input_data: str = "") -> Tuple[int, str, str]:
+    engine = default_engine()
+    prepared = engine.prepare("java", source_path)
+    if isinstance(prepared, ExecutionResult):
+        return prepared.as_tuple()
+    if (mode or os.environ.get("SANDBOX_JAVA_MODE", "spawn")) == "worker":
         # assume class name equals filename without extension
         class_name = source_path.rsplit("/", 1)[-1].rsplit(".", 1)[0]
-        run_p = subprocess.run(["java", class_name], capture_output=True, text=True, timeout=timeout)
-        return run_p.returncode, run_p.stdout, run_p.stderr
-    except Exception as e:
-        return -1, "", str(e)
+        try:
+            with prepared.cache.pinned(prepared.artifact_dir):
+                return jvm_pool().run(prepared.artifact_dir, class_name, input_data, timeout)
+        except Exception as e:
+            return -1, "", str(e)
+    return engine.run(prepared, input_data, timeout).as_tuple()
@@ -0,0 +1,166 @@
+import java.io.BufferedInputStream;
+import java.io.BufferedOutputStream;
+import java.io.BufferedReader;
+import java.io.FileDescriptor;
+import java.io.FileInputStream;
+import java.io.FileOutputStream;
+import java.io.InputStream;
+import java.io.InputStreamReader;
+import java.io.OutputStream;
+import java.io.PrintStream;
+import java.lang.reflect.InvocationTargetException;
+import java.lang.reflect.Method;
+import java.net.URL;
+import java.net.URLClassLoader;
+import java.nio.charset.StandardCharsets;
+import java.nio.file.Paths;
+import java.util.Locale;
+import java.util.Properties;
+import java.util.Set;
+import java.util.TimeZone;
+
+/**
+ * Long-lived JVM that runs submissions for java_runner's worker mode.
+ *
+ * Usage: java JvmHost <controlFd>. Reads one request per line on stdin:
+ *   RUN \t nonce \t classDir \t className \t stdinPath \t stdoutPath \t stderrPath
+ * loads className from classDir in a fresh classloader whose parent is the
+ * platform loader (host classes and earlier cases stay invisible), runs its
+ * main() with System.in/out/err redirected to the given files, and answers
+ *   DONE \t nonce \t exitCode [\t DIRTY]
+ * on the inherited control fd, never on stdout (which the Python side sends to
+ * /dev/null). The nonce only ever lives in a local variable, so a submission
+ * that finds the control fd still cannot forge a reply the Python side accepts.
+ * DIRTY means the case left a thread behind: any live thread that did not exist
+ * before it, in any ThreadGroup. Virtual threads do not show up in a thread
+ * census, but they need the scheduler's carrier threads, which do; so a case
+ * that used virtual threads is DIRTY too. A DIRTY host gets no further requests
+ * (a leftover thread could otherwise read the next request from stdin).
+ * The default Locale, TimeZone, System properties and uncaught-exception
+ * handler are put back after every case.
+ * System.exit() in a submission ends the host; the shutdown hook flushes the
+ * case output first and the Python side reads the exit status.
+ */
+public final class JvmHost {
+    private static volatile PrintStream caseOut;
+    private static volatile PrintStream caseErr;
+
+    private static final PrintStream NULL_STREAM = new PrintStream(OutputStream.nullOutputStream());
+
+    private static final Locale LOCALE = Locale.getDefault();
+    private static final Locale DISPLAY_LOCALE = Locale.getDefault(Locale.Category.DISPLAY);
+    private static final Locale FORMAT_LOCALE = Locale.getDefault(Locale.Category.FORMAT);
+    private static final TimeZone TIME_ZONE = TimeZone.getDefault();
+    private static final Properties PROPERTIES = (Properties) System.getProperties().clone();
+    private static final Thread.UncaughtExceptionHandler UNCAUGHT = Thread.getDefaultUncaughtExceptionHandler();
+
+    public static void main(String[] args) throws Exception {
+        PrintStream ctl = new PrintStream(new FileOutputStream("/proc/self/fd/" + Integer.parseInt(args[0])), true,
+                "UTF-8");
+        BufferedReader requests = new BufferedReader(
+                new InputStreamReader(new FileInputStream(FileDescriptor.in), StandardCharsets.UTF_8));
+        Runtime.getRuntime().addShutdownHook(new Thread(JvmHost::flushCase));
+        System.setIn(InputStream.nullInputStream());
+        System.setOut(NULL_STREAM);
+        System.setErr(NULL_STREAM);
+        ctl.println("READY");
+        String line;
+        while ((line = requests.readLine()) != null) {
+            String[] f = line.split("\t", -1);
+            if (f.length != 7 || !f[0].equals("RUN")) {
+                ctl.println("ERROR\tbad request");
+                continue;
+            }
+            String nonce = f[1];
+            Set<Thread> threadsBefore = Thread.getAllStackTraces().keySet();
+            int rc = runCase(f[2], f[3], f[4], f[5], f[6]);
+            resetGlobals();
+            boolean dirty = leftThreads(threadsBefore);
+            ctl.println("DONE\t" + nonce + "\t" + rc + (dirty ? "\tDIRTY" : ""));
+        }
+    }
+
+    private static int runCase(String classDir, String className, String inPath, String outPath, String errPath) {
+        int rc = 0;
+        ClassLoader hostLoader = Thread.currentThread().getContextClassLoader();
+        try (InputStream stdin = new BufferedInputStream(new FileInputStream(inPath))) {
+            caseOut = new PrintStream(new BufferedOutputStream(new FileOutputStream(outPath)), false, "UTF-8");
+            caseErr = new PrintStream(new FileOutputStream(errPath), true, "UTF-8");
+            System.setIn(stdin);
+            System.setOut(caseOut);
+            System.setErr(caseErr);
+            try (URLClassLoader loader = new URLClassLoader(
+                    new URL[] {Paths.get(classDir).toUri().toURL()}, ClassLoader.getPlatformClassLoader())) {
+                Thread.currentThread().setContextClassLoader(loader);
+                Method main;
+                try {
+                    Class<?> cls = Class.forName(className, true, loader);
+                    main = cls.getMethod("main", String[].class);
+                    main.setAccessible(true);
+                } catch (ReflectiveOperationException | LinkageError e) {
+                    caseErr.println("Error: Could not find or load main class " + className);
+                    caseErr.println("Caused by: " + e);
+                    return 1;
+                }
+                try {
+                    main.invoke(null, (Object) new String[0]);
+                } catch (InvocationTargetException e) {
+                    // same shape as an uncaught exception in a plain `java Main` run
+                    caseErr.print("Exception in thread \"main\" ");
+                    e.getCause().printStackTrace(caseErr);
+                    rc = 1;
+                }
+            }
+        } catch (Throwable t) {
+            if (caseErr != null) {
+                t.printStackTrace(caseErr);
+            }
+            rc = 1;
+        } finally {
+            flushCase();
+            System.setIn(InputStream.nullInputStream());
+            System.setOut(NULL_STREAM);
+            System.setErr(NULL_STREAM);
+            if (caseOut != null) {
+                caseOut.close();
+            }
+            if (caseErr != null) {
+                caseErr.close();
+            }
+            caseOut = null;
+            caseErr = null;
+            Thread.currentThread().setContextClassLoader(hostLoader);
+        }
+        return rc;
+    }
+
+    /** True if some live thread did not exist before the case. */
+    private static boolean leftThreads(Set<Thread> before) {
+        for (Thread t : Thread.getAllStackTraces().keySet()) {
+            if (t.isAlive() && !before.contains(t)) {
+                return true;
+            }
+        }
+        return false;
+    }
+
+    private static void resetGlobals() {
+        Locale.setDefault(LOCALE);
+        Locale.setDefault(Locale.Category.DISPLAY, DISPLAY_LOCALE);
+        Locale.setDefault(Locale.Category.FORMAT, FORMAT_LOCALE);
+        TimeZone.setDefault(TIME_ZONE);
+        System.setProperties((Properties) PROPERTIES.clone());
+        Thread.setDefaultUncaughtExceptionHandler(UNCAUGHT);
+    }
+
+    private static void flushCase() {
+        PrintStream out = caseOut;
+        PrintStream err = caseErr;
+        if (out != null) {
+            out.flush();
+        }
+        if (err != null) {
+            err.flush();
+        }
+    }
+}
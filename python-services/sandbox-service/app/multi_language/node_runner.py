@@ -1,11 +1,8 @@
 """Node.js execution runner placeholder."""
-import subprocess
 from typing import Tuple
 
+from app.multi_language.engine import default_engine
+
 
 def run_node(script_path: str, timeout: int = 5) -> Tuple[int, str, str]:
-    try:
-        p = subprocess.run(["node", script_path], capture_output=True, text=True, timeout=timeout)
-        return p.returncode, p.stdout, p.stderr
-    except Exception as e:
-        return -1, "", str(e)
+    return default_engine().execute("node", script_path, run_timeout=timeout).as_tuple()
@@ -0,0 +1,49 @@
+"""Exec shim for engine runs: `python -I -S -B rlimit_shim.py <report_fd> <limits_json> <cgroup_procs> <cmd...>`.
+
+The engine starts this script instead of the submission so that no Python
+code has to run between fork and exec in the (threaded) server. The shim forks
+once more, moves that child into the run's cgroup (`cgroup_procs`, "" for
+none; failing to join it is fatal, since the cgroup carries the process cap),
+applies the rlimits and execs `cmd`. The child's
+rusage therefore covers only the submission, not the server's RSS that a
+fork-then-exec child would inherit in ru_maxrss. On `report_fd` it writes
+"pid <pid>" as soon as the child exists, and "exit <status> <maxrss_kb>
+<utime> <stime>" once it has been reaped. Only the stdlib may be used here.
+"""
+import json
+import os
+import resource
+import sys
+
+
+def main():
+    report = int(sys.argv[1])
+    limits = json.loads(sys.argv[2])
+    cgroup_procs = sys.argv[3]
+    cmd = sys.argv[4:]
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.close(report)
+            if cgroup_procs:
+                with open(cgroup_procs, "w") as f:
+                    f.write("0")
+            for name, soft, hard in limits:
+                resource.setrlimit(getattr(resource, name), (soft, hard))
+            os.execvp(cmd[0], cmd)
+        except BaseException as e:
+            os.write(2, f"cannot run {cmd[0]}: {e}\n".encode())
+        finally:
+            os._exit(127)
+    os.write(report, f"pid {pid}\n".encode())
+    # the submission's EOF on stdout/stderr must not wait for this process
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in (0, 1, 2):
+        os.dup2(devnull, fd)
+    _, status, ru = os.wait4(pid, 0)
+    os.write(report, f"exit {status} {ru.ru_maxrss} {ru.ru_utime} {ru.ru_stime}\n".encode())
+    os._exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Per-run cgroup v2 leaves for process caps.
+
+RLIMIT_NPROC counts every task of the real UID, so in a server whose threads
+share the submission's UID it cannot cap a single run. Instead each run gets
+its own leaf under SANDBOX_CGROUP_DIR (a delegated, writable cgroup v2
+directory with no processes of its own, or a cgroup v1 `pids` hierarchy)
+with `pids.max` set; rlimit_shim.py
+moves the submission into it before exec. Without SANDBOX_CGROUP_DIR there is
+no per-run process cap and the service relies on its container's pids limit.
+"""
+import itertools
+import os
+import signal
+import threading
+import time
+from typing import Optional
+
+_seq = itertools.count(1)
+_enable_lock = threading.Lock()
+_enabled = set()
+
+
+class RunCgroup:
+    """One run's cgroup directory; `remove()` kills whatever is still inside."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    @classmethod
+    def create(cls, name: str, pids_max: int) -> Optional["RunCgroup"]:
+        """A fresh leaf with `pids.max` = pids_max, or None if SANDBOX_CGROUP_DIR is unset."""
+        root = os.environ.get("SANDBOX_CGROUP_DIR")
+        if not root:
+            return None
+        with _enable_lock:
+            if root not in _enabled:
+                try:
+                    with open(os.path.join(root, "cgroup.subtree_control"), "w") as f:
+                        f.write("+pids +memory")
+                except OSError:
+                    pass
+                _enabled.add(root)
+        path = os.path.join(root, f"{name}-{os.getpid()}-{next(_seq)}")
+        os.mkdir(path)
+        cg = cls(path)
+        try:
+            with open(os.path.join(path, "pids.max"), "w") as f:
+                f.write(str(pids_max))
+        except OSError:
+            cg.remove()
+            raise
+        return cg
+
+    @property
+    def procs(self) -> str:
+        return os.path.join(self.path, "cgroup.procs")
+
+    def remove(self, timeout: float = 1.0):
+        """SIGKILL everything left in the cgroup and delete it."""
+        try:
+            # Linux 5.14+
+            with open(os.path.join(self.path, "cgroup.kill"), "w") as f:
+                f.write("1")
+            listed = False
+        except OSError:
+            listed = True
+        deadline = time.monotonic() + timeout
+        while True:
+            if listed:
+                self._kill_listed()
+            try:
+                os.rmdir(self.path)
+                return
+            except FileNotFoundError:
+                return
+            except OSError:
+                # EBUSY until the killed tasks are gone
+                if time.monotonic() >= deadline:
+                    return
+                time.sleep(0.005)
+
+    def _kill_listed(self):
+        # no cgroup.kill (older kernels, cgroup v1): signal the members one by one; remove() repeats
+        # this until the cgroup is empty, which also catches a fork racing the first pass
+        try:
+            with open(self.procs) as f:
+                pids = [int(v) for v in f.read().split()]
+        except (OSError, ValueError):
+            return
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except OSError:
+                pass
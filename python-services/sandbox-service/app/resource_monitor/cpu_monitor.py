@@ -1,9 +1,16 @@
 """CPU usage monitoring utilities (placeholder)."""
 import psutil
 
+from app.resource_monitor.sampler import default_sampler
+
 
 def cpu_percent(pid: int = None):
     if pid:
+        # runs watched by the background sampler answer without blocking
+        sampler = default_sampler()
+        latest = sampler.latest(pid) if sampler else None
+        if latest is not None:
+            return latest[1]
         try:
             p = psutil.Process(pid)
             return p.cpu_percent(interval=0.1)
@@ -1,9 +1,15 @@
 """Memory monitoring utilities (placeholder)."""
 import psutil
 
+from app.resource_monitor.sampler import default_sampler
+
 
 def memory_info(pid: int = None):
     if pid:
+        sampler = default_sampler()
+        latest = sampler.latest(pid) if sampler else None
+        if latest is not None:
+            return latest[2] * 1024
         try:
             p = psutil.Process(pid)
             return p.memory_info().rss
@@ -0,0 +1,265 @@
+"""Continuous CPU/memory sampling of running submissions.
+
+One background thread samples every watched run at a fixed rate by reading
+/proc (the process and its descendants) or the run's cgroup files directly,
+so no caller ever blocks for a sampling interval. Each run keeps a bounded
+time series plus running peak/mean figures; `unwatch` returns the final
+summary for grading metrics and anti-abuse checks.
+"""
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+from app.resource_monitor.timeout_manager import stat_cpu_seconds
+
+PAGE_KB = os.sysconf("SC_PAGE_SIZE") // 1024
+
+
+def _pread(fd: int) -> Optional[bytes]:
+    try:
+        return os.pread(fd, 4096, 0)
+    except OSError:
+        return None
+
+
+def _read(path: str) -> Optional[bytes]:
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _children(pid: int) -> List[int]:
+    data = _read(f"/proc/{pid}/task/{pid}/children")
+    return [int(v) for v in data.split()] if data else []
+
+
+class RunSeries:
+    """Samples of one run: (t seconds since watch, cpu %, memory KB)."""
+
+    def __init__(self, key: str, pid: Optional[int], cgroup: Optional[str], max_samples: int):
+        self.key = key
+        self.pid = pid
+        self.cgroup = cgroup
+        self.started = time.monotonic()
+        self.samples: deque = deque(maxlen=max_samples)
+        self.count = 0
+        self.cpu_peak = 0.0
+        self.cpu_sum = 0.0
+        self.memory_peak_kb = 0
+        self.memory_sum_kb = 0
+        self.cpu_seconds = 0.0
+        self._last: Optional[Tuple[float, float]] = None
+        self._fds: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def summary(self) -> Dict:
+        n = max(self.count, 1)
+        return {
+            "key": self.key,
+            "samples": self.count,
+            "durationMs": int((time.monotonic() - self.started) * 1000),
+            "cpuMs": int(self.cpu_seconds * 1000),
+            "cpuPeakPercent": round(self.cpu_peak, 1),
+            "cpuMeanPercent": round(self.cpu_sum / n, 1),
+            "memoryPeakKb": self.memory_peak_kb,
+            "memoryMeanKb": self.memory_sum_kb // n,
+        }
+
+    def series(self) -> List[Tuple[float, float, int]]:
+        return list(self.samples)
+
+    def _get(self, path: str) -> Optional[bytes]:
+        """Read a /proc or cgroup file through a descriptor kept open for the whole run."""
+        fd = self._fds.get(path)
+        if fd is None:
+            try:
+                fd = self._fds[path] = os.open(path, os.O_RDONLY)
+            except OSError:
+                return None
+        return _pread(fd)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            for fd in self._fds.values():
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+            self._fds.clear()
+
+    def _read_cgroup(self) -> Optional[Tuple[float, int]]:
+        cpu = mem = None
+        data = self._get(os.path.join(self.cgroup, "cpu.stat"))
+        if data:
+            for line in data.splitlines():
+                if line.startswith(b"usage_usec "):
+                    cpu = int(line.split()[1]) / 1e6
+        else:
+            data = self._get(os.path.join(self.cgroup, "cpuacct.usage"))
+            cpu = int(data) / 1e9 if data else None
+        for name in ("memory.current", "memory.usage_in_bytes"):
+            data = self._get(os.path.join(self.cgroup, name))
+            if data:
+                mem = int(data) // 1024
+                break
+        if cpu is None or mem is None:
+            return None
+        return cpu, mem
+
+    def _read_proc(self) -> Optional[Tuple[float, int]]:
+        # the run's own process through kept-open fds, descendants by a walk of children files
+        stat = self._get(f"/proc/{self.pid}/stat")
+        statm = self._get(f"/proc/{self.pid}/statm")
+        if not stat or not statm:
+            return None
+        cpu = stat_cpu_seconds(stat)
+        mem = int(statm.split()[1]) * PAGE_KB
+        todo = _children(self.pid)
+        while todo:
+            pid = todo.pop()
+            stat, statm = _read(f"/proc/{pid}/stat"), _read(f"/proc/{pid}/statm")
+            if stat and statm:
+                cpu += stat_cpu_seconds(stat)
+                mem += int(statm.split()[1]) * PAGE_KB
+                todo.extend(_children(pid))
+        return cpu, mem
+
+    def sample(self, now: float) -> bool:
+        """Take one sample; False once the run can no longer be read (it exited)."""
+        with self._lock:
+            if self._closed:
+                return False
+            reading = self._read_cgroup() if self.cgroup else self._read_proc()
+            # an exited (zombie, not yet reaped) process still has a stat file but no memory
+            if reading is None or not reading[1]:
+                return False
+            cpu, mem = reading
+            percent = 0.0
+            if self._last is not None and now > self._last[0]:
+                percent = max(0.0, (cpu - self._last[1]) / (now - self._last[0]) * 100)
+            self._last = (now, cpu)
+            self.cpu_seconds = cpu
+            self.count += 1
+            self.cpu_sum += percent
+            self.cpu_peak = max(self.cpu_peak, percent)
+            self.memory_sum_kb += mem
+            self.memory_peak_kb = max(self.memory_peak_kb, mem)
+            self.samples.append((round(now - self.started, 4), round(percent, 1), mem))
+        return True
+
+
+class ResourceSampler:
+    def __init__(self, interval_s: float = 0.05, max_samples: int = 1200):
+        self.interval_s = interval_s
+        self.max_samples = max_samples
+        self.lock = threading.Lock()
+        self._wake = threading.Condition(self.lock)
+        self._runs: Dict[str, RunSeries] = {}
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+        self.stats = {"watched": 0, "samples": 0, "lastSweepMs": 0.0, "maxSweepMs": 0.0}
+
+    def watch(self, key: str, pid: Optional[int] = None, cgroup: Optional[str] = None) -> RunSeries:
+        """Start sampling a run by `pid` (and its descendants) or by its cgroup directory."""
+        if pid is None and cgroup is None:
+            raise ValueError("watch() needs a pid or a cgroup")
+        run = RunSeries(key, pid, cgroup, self.max_samples)
+        # first sample right away so even very short runs get a memory reading
+        run.sample(time.monotonic())
+        with self.lock:
+            self._runs[key] = run
+            self.stats["watched"] += 1
+            self._wake.notify()
+            if self._thread is None and not self._closed:
+                self._thread = threading.Thread(target=self._loop, name="resource-sampler", daemon=True)
+                self._thread.start()
+        return run
+
+    def unwatch(self, key: str) -> Optional[Dict]:
+        """Stop sampling `key`; returns its summary."""
+        with self.lock:
+            run = self._runs.pop(key, None)
+        if run is None:
+            return None
+        run.close()
+        return run.summary()
+
+    def get(self, key: str) -> Optional[RunSeries]:
+        with self.lock:
+            return self._runs.get(key)
+
+    def latest(self, pid: int) -> Optional[Tuple[float, float, int]]:
+        """Most recent (t, cpu %, memory KB) of a watched pid, without blocking."""
+        with self.lock:
+            for run in self._runs.values():
+                if run.pid == pid and run.samples:
+                    return run.samples[-1]
+        return None
+
+    def snapshot(self) -> Dict:
+        with self.lock:
+            return dict(self.stats, active=len(self._runs))
+
+    def close(self):
+        with self.lock:
+            self._closed = True
+            runs = list(self._runs.values())
+            self._runs.clear()
+            self._wake.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        for run in runs:
+            run.close()
+
+    def _loop(self):
+        next_at = time.monotonic()
+        while True:
+            with self.lock:
+                while not self._closed and not self._runs:
+                    self._wake.wait()
+                    next_at = time.monotonic()
+                if self._closed:
+                    return
+                runs = list(self._runs.values())
+            start = time.monotonic()
+            taken = 0
+            for run in runs:
+                # an exited run keeps its last readings until its owner unwatches it
+                taken += run.sample(start)
+            elapsed_ms = (time.monotonic() - start) * 1000
+            with self.lock:
+                self.stats["samples"] += taken
+                self.stats["lastSweepMs"] = round(elapsed_ms, 3)
+                self.stats["maxSweepMs"] = max(self.stats["maxSweepMs"], round(elapsed_ms, 3))
+            # fixed rate: skip ahead rather than burst when a sweep overruns
+            next_at += self.interval_s
+            delay = next_at - time.monotonic()
+            if delay < 0:
+                next_at = time.monotonic()
+                delay = 0
+            with self.lock:
+                if not self._closed:
+                    self._wake.wait(delay)
+
+
+_sampler: Optional[ResourceSampler] = None
+_sampler_lock = threading.Lock()
+
+
+def default_sampler() -> Optional[ResourceSampler]:
+    """Process-wide sampler; SANDBOX_SAMPLE_INTERVAL_MS sets the rate, 0 turns sampling off."""
+    global _sampler
+    interval_ms = int(os.environ.get("SANDBOX_SAMPLE_INTERVAL_MS", "50"))
+    if interval_ms <= 0:
+        return None
+    with _sampler_lock:
+        if _sampler is None:
+            _sampler = ResourceSampler(interval_s=interval_ms / 1000)
+        return _sampler
@@ -1,21 +1,266 @@
-"""Timeout manager for execution tasks."""
+"""Timeout manager for execution tasks.
+
+A DeadlineManager owns the process groups of running submissions and enforces
+wall-clock and CPU deadlines from a single timer-wheel thread, however many
+jobs are in flight. On expiry it SIGKILLs the whole group, so nothing a
+submission forked outlives it. CPU is re-checked no sooner than the earliest
+moment the budget could be used up (remaining CPU / cores), which keeps
+/proc reads rare for jobs that mostly wait.
+"""
+import math
+import os
+import signal
+import subprocess
 import threading
-from typing import Callable
+import time
+from typing import Dict, List, Optional, Sequence, Set
+
+CLK_TCK = os.sysconf("SC_CLK_TCK")
+NCPU = os.cpu_count() or 1
+
+
+def stat_cpu_seconds(data: bytes) -> float:
+    """utime+stime+cutime+cstime from the contents of a /proc/<pid>/stat file."""
+    # the command name may contain spaces; fields resume after its closing paren
+    fields = data[data.rfind(b")") + 2:].split()
+    return sum(int(v) for v in fields[11:15]) / CLK_TCK
+
+
+def process_cpu_seconds(pid: int) -> Optional[float]:
+    """CPU time of `pid` plus its reaped children."""
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as f:
+            return stat_cpu_seconds(f.read())
+    except OSError:
+        return None
+
+
+def kill_group(pgid: int) -> bool:
+    try:
+        os.killpg(pgid, signal.SIGKILL)
+        return True
+    except ProcessLookupError:
+        return True
+    except OSError:
+        return False
+
+
+class Deadline:
+    """A registered process group; `reason` is "wall" or "cpu" once it was killed."""
+
+    def __init__(self, pid: int, pgid: int, wall_s: Optional[float], cpu_s: Optional[float]):
+        self.pid = pid
+        self.pgid = pgid
+        self.wall_s = wall_s
+        self.cpu_s = cpu_s
+        self.started = time.monotonic()
+        self.reason: Optional[str] = None
+        self.overrun_ms = 0.0
+        self.done = False
+        self._timers: Set["_Timer"] = set()
+
+    @property
+    def expired(self) -> bool:
+        return self.reason is not None
+
+
+class _Timer:
+    __slots__ = ("tick", "kind", "deadline", "due")
+
+    def __init__(self, tick: int, kind: str, deadline: Deadline, due: float):
+        self.tick = tick
+        self.kind = kind
+        self.deadline = deadline
+        self.due = due
+
+
+class DeadlineManager:
+    def __init__(self, tick_s: float = 0.01, slots: int = 1024):
+        self.tick_s = tick_s
+        self.slots: List[Set[_Timer]] = [set() for _ in range(slots)]
+        self.lock = threading.Lock()
+        self._wake = threading.Condition(self.lock)
+        self._origin = time.monotonic()
+        self._current = 0
+        self._pending = 0
+        self._active: Dict[int, Deadline] = {}
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+        self.stats = {
+            "registered": 0, "completed": 0, "expiredWall": 0, "expiredCpu": 0,
+            "killFailures": 0, "cpuChecks": 0, "maxOverrunMs": 0.0, "totalOverrunMs": 0.0,
+        }
+
+    def register(self, pid: int, wall_s: Optional[float] = None, cpu_s: Optional[float] = None,
+                 pgid: Optional[int] = None) -> Deadline:
+        """Watch process group `pgid` (default: `pid`, i.e. a session leader) until `cancel`."""
+        deadline = Deadline(pid, pid if pgid is None else pgid, wall_s, cpu_s)
+        with self.lock:
+            if self._closed:
+                raise RuntimeError("deadline manager is closed")
+            self._active[id(deadline)] = deadline
+            self.stats["registered"] += 1
+            if wall_s is not None:
+                self._schedule(deadline, "wall", deadline.started + wall_s)
+            if cpu_s is not None:
+                self._schedule(deadline, "cpu", deadline.started + cpu_s / NCPU)
+            self._wake.notify()
+        self._ensure_thread()
+        return deadline
+
+    def cancel(self, deadline: Deadline):
+        """The job finished (or was reaped); stop watching it."""
+        with self.lock:
+            if deadline.done:
+                return
+            deadline.done = True
+            self._active.pop(id(deadline), None)
+            for timer in deadline._timers:
+                self.slots[timer.tick % len(self.slots)].discard(timer)
+                self._pending -= 1
+            deadline._timers.clear()
+            if not deadline.expired:
+                self.stats["completed"] += 1
+
+    def spawn(self, cmd: Sequence[str], wall_s: Optional[float] = None, cpu_s: Optional[float] = None,
+              **popen_kwargs):
+        """Popen `cmd` in its own session and register it; returns (proc, deadline)."""
+        proc = subprocess.Popen(cmd, start_new_session=True, **popen_kwargs)
+        return proc, self.register(proc.pid, wall_s, cpu_s)
+
+    def snapshot(self) -> Dict:
+        with self.lock:
+            stats = dict(self.stats)
+            stats["active"] = len(self._active)
+            stats["timers"] = self._pending
+        expired = stats["expiredWall"] + stats["expiredCpu"]
+        stats["meanOverrunMs"] = stats["totalOverrunMs"] / expired if expired else 0.0
+        return stats
+
+    def close(self, kill: bool = True):
+        """Stop the wheel; with `kill`, take down every group still registered."""
+        with self.lock:
+            self._closed = True
+            active = list(self._active.values())
+            self._wake.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if kill:
+            for deadline in active:
+                kill_group(deadline.pgid)
+
+    # -- timer wheel -------------------------------------------------------
+
+    def _ensure_thread(self):
+        with self.lock:
+            if self._thread is None and not self._closed:
+                self._thread = threading.Thread(target=self._loop, name="deadline-wheel", daemon=True)
+                self._thread.start()
+
+    def _schedule(self, deadline: Deadline, kind: str, due: float):
+        if not self._pending:
+            # the wheel does not turn while it is empty; catch up for free, nothing can have been missed
+            self._current = max(self._current, int((time.monotonic() - self._origin) / self.tick_s))
+        # never in the past: the current slot may already have been swept
+        tick = max(self._current + 1, math.ceil((due - self._origin) / self.tick_s))
+        timer = _Timer(tick, kind, deadline, due)
+        self.slots[tick % len(self.slots)].add(timer)
+        deadline._timers.add(timer)
+        self._pending += 1
+
+    def _loop(self):
+        while True:
+            fired = []
+            with self.lock:
+                while not self._closed and not self._pending:
+                    self._wake.wait()
+                if self._closed:
+                    return
+                now_tick = int((time.monotonic() - self._origin) / self.tick_s)
+                if now_tick - self._current >= len(self.slots):
+                    # a revolution or more behind: one pass over every slot finds everything due
+                    for slot in self.slots:
+                        fired.extend(self._take(slot, now_tick))
+                    self._current = now_tick
+                while self._current < now_tick:
+                    self._current += 1
+                    fired.extend(self._take(self.slots[self._current % len(self.slots)], self._current))
+                if not fired:
+                    next_at = self._origin + (self._current + 1) * self.tick_s
+                    self._wake.wait(max(0.0, next_at - time.monotonic()))
+                    continue
+            for timer in fired:
+                self._fire(timer)
+
+    def _take(self, slot: Set[_Timer], upto: int) -> List[_Timer]:
+        # a slot also holds timers for later revolutions of the wheel
+        due = [t for t in slot if t.tick <= upto]
+        for timer in due:
+            slot.discard(timer)
+            timer.deadline._timers.discard(timer)
+            self._pending -= 1
+        return due
+
+    def _fire(self, timer: _Timer):
+        deadline = timer.deadline
+        if timer.kind == "cpu":
+            used = process_cpu_seconds(deadline.pid)
+            with self.lock:
+                self.stats["cpuChecks"] += 1
+                if deadline.done or used is None:
+                    return
+                remaining = deadline.cpu_s - used
+                if remaining > 0:
+                    # cannot burn `remaining` CPU seconds faster than on every core at once
+                    self._schedule(deadline, "cpu", time.monotonic() + max(remaining / NCPU, self.tick_s))
+                    return
+        with self.lock:
+            if deadline.done or deadline.expired:
+                return
+            deadline.reason = timer.kind
+        ok = kill_group(deadline.pgid)
+        overrun_ms = (time.monotonic() - timer.due) * 1000
+        with self.lock:
+            deadline.overrun_ms = overrun_ms
+            self.stats["expiredWall" if timer.kind == "wall" else "expiredCpu"] += 1
+            self.stats["totalOverrunMs"] += overrun_ms
+            self.stats["maxOverrunMs"] = max(self.stats["maxOverrunMs"], overrun_ms)
+            if not ok:
+                self.stats["killFailures"] += 1
+
+
+_manager: Optional[DeadlineManager] = None
+_manager_lock = threading.Lock()
+
 
+def deadline_manager() -> DeadlineManager:
+    """Process-wide manager shared by every runner."""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = DeadlineManager(tick_s=float(os.environ.get("SANDBOX_DEADLINE_TICK_S", "0.01")))
+        return _manager
 
-def run_with_timeout(func: Callable, args=(), kwargs=None, timeout: int = 5):
-    kwargs = kwargs or {}
-    result = {"done": False, "value": None}
 
-    def target():
-        try:
-            result["value"] = func(*args, **kwargs)
-        finally:
-            result["done"] = True
+def run_with_timeout(cmd: Sequence[str], timeout: float = 5, cpu_timeout: Optional[float] = None,
+                     input_data: Optional[str] = None, **popen_kwargs):
+    """Run `cmd` under wall/CPU deadlines. Returns (finished, CompletedProcess or None).
 
-    t = threading.Thread(target=target)
-    t.start()
-    t.join(timeout)
-    if t.is_alive():
+    On a deadline the command's whole process group is killed, so unlike a
+    watcher thread nothing is left running after this returns.
+    """
+    manager = deadline_manager()
+    proc, deadline = manager.spawn(
+        cmd, timeout, cpu_timeout, stdin=subprocess.PIPE if input_data is not None else subprocess.DEVNULL,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, **popen_kwargs,
+    )
+    try:
+        out, err = proc.communicate(input_data)
+    finally:
+        manager.cancel(deadline)
+        # reap anything the command left behind in its group
+        kill_group(deadline.pgid)
+    if deadline.expired:
         return False, None
-    return True, result["value"]
+    return True, subprocess.CompletedProcess(proc.args, proc.returncode, out, err)
@@ -11,7 +11,9 @@ from pydantic import BaseModel
 import tempfile
 import os
 import json
-from typing import List, Dict
+from typing import List, Dict, Optional
+from app.grader.result_aggregator import aggregate_results
+from app.grader.test_runner import run_tests
 from app.multi_language.python_runner import run_python
 
 
@@ -20,9 +22,17 @@ class TestCase(BaseModel):
     expected: str
 
 
+class Subtask(BaseModel):
+    name: Optional[str] = None
+    weight: float = 1
+    mode: str = 'min'
+    tests: List[int]
+
+
 class RunRequest(BaseModel):
     code: str
     tests: List[TestCase] = []
+    subtasks: Optional[List[Subtask]] = None
 
 
 class PlagRequest(BaseModel):
@@ -41,7 +51,25 @@ def run(req: RunRequest):
         with open(main_path, 'w', encoding='utf-8') as f:
             f.write(req.code)
 
-        # naive execution: run main.py once and return placeholder tests
+        if req.tests:
+            subtasks = [s.dict(exclude_none=True) for s in req.subtasks] if req.subtasks else None
+            try:
+                graded = aggregate_results(run_tests(main_path, [t.dict() for t in req.tests], subtasks=subtasks))
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            summary = graded['summary']
+            return {
+                'passed': summary['passed'] == summary['total'],
+                'score': summary['score'],
+                'runtimeMs': summary['maxRunMs'],
+                'memoryKb': summary['maxMemoryKb'],
+                'results': graded['tests'],
+                'testsSummary': [],
+                'subtasks': summary['subtasks'],
+                'error': summary.get('compileOutput'),
+            }
+
+        # no tests: run main.py once and report its error, if any
         code, out, err = run_python(main_path, timeout=5)
         result = {
             'passed': False,
@@ -1,22 +1,184 @@
-"""gRPC server stub for sandbox service."""
-import grpc
+"""gRPC server for sandbox service.
+
+Serves SandboxService (sandbox.proto) on a grpc.aio server backed by the
+execution engine. `RunStream` compiles once, runs the tests `parallelism` at a
+time and yields each verdict as soon as it is ready; `Run` collects the same
+stream into one response. A client that cancels the call (or a failing test
+with `stop_on_failure`) drops every test that has not started yet; runs already
+in the executor cannot be interrupted, so the stream waits for them before it
+removes the submission's work directory, and `Run` reports such a run as
+`stopped`.
+
+Stubs are generated from sandbox.proto next to this file on first start
+(grpcio-tools), so run it as a script: `python grpc/server.py`.
+"""
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
 from concurrent import futures
-import time
 
-# Import generated stubs when compiled. For now the proto is present as sandbox.proto
+import grpc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+# after this directory, so `import grpc` keeps resolving to grpcio
+sys.path.append(os.path.dirname(HERE))
+
+from app.grader.checker import exact  # noqa: E402
+from app.multi_language.engine import ExecutionResult, default_engine, get_language  # noqa: E402
+
+DEFAULT_TIME_LIMIT_MS = int(os.environ.get('SANDBOX_TIME_LIMIT_MS', '2000'))
+DEFAULT_MEMORY_MB = int(os.environ.get('SANDBOX_MEMORY_MB', '256'))
+DEFAULT_PARALLELISM = int(os.environ.get('SANDBOX_PARALLELISM', '4'))
+MAX_WORKERS = int(os.environ.get('SANDBOX_GRPC_WORKERS', '32'))
+
 
+def _remove_when_done(workdir: str, runs):
+    """Removes workdir once every run in `runs` (concurrent futures) has finished."""
+    def check(_=None):
+        if all(r.done() for r in runs):
+            shutil.rmtree(workdir, ignore_errors=True)
+    left = [r for r in runs if not r.done()]
+    if not left:
+        check()
+    for r in left:
+        r.add_done_callback(check)
 
-def serve():
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
-    # TODO: import and add the generated servicer class
-    server.add_insecure_port('[::]:50054')
-    server.start()
+
+def _load_stubs():
     try:
-        while True:
-            time.sleep(86400)
-    except KeyboardInterrupt:
-        server.stop(0)
+        import sandbox_pb2
+        import sandbox_pb2_grpc
+    except ImportError:
+        from grpc_tools import protoc
+        rc = protoc.main(['grpc_tools.protoc', f'-I{HERE}', f'--python_out={HERE}',
+                          f'--grpc_python_out={HERE}', os.path.join(HERE, 'sandbox.proto')])
+        if rc != 0:
+            raise RuntimeError('failed to generate gRPC stubs from sandbox.proto')
+        import sandbox_pb2
+        import sandbox_pb2_grpc
+    return sandbox_pb2, sandbox_pb2_grpc
+
+
+pb2, pb2_grpc = _load_stubs()
+
+
+def _test_result(submission_id: str, index: int, res: ExecutionResult, expected: str):
+    status = res.status
+    if status == 'ok':
+        status = 'passed' if exact('', res.stdout, expected).passed else 'wrong_answer'
+    return pb2.TestResult(
+        submission_id=submission_id, index=index, status=status, passed=status == 'passed',
+        stdout=res.stdout, stderr=res.stderr, run_ms=res.run_ms,
+        cpu_ms=res.cpu_user_ms + res.cpu_sys_ms, memory_kb=res.memory_kb,
+    )
+
+
+class SandboxServicer(pb2_grpc.SandboxServiceServicer):
+    def __init__(self, engine=None, max_workers: int = MAX_WORKERS):
+        self.engine = engine or default_engine()
+        self.executor = futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='sandbox-run')
+
+    async def RunStream(self, request, context):
+        async for _, result in self._stream(request, context):
+            yield result
+
+    async def _stream(self, request, context):
+        """Yields (compiled, TestResult); compiled is False only for the single compile/prepare failure."""
+        try:
+            spec = get_language(request.language or 'python')
+        except ValueError as e:
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+        if not request.code and not request.artifact_path:
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, 'either code or artifact_path is required')
+
+        loop = asyncio.get_running_loop()
+        workdir = tempfile.mkdtemp(prefix='sandbox-grpc-')
+        running = set()
+        try:
+            source_path = request.artifact_path
+            if request.code:
+                source_path = os.path.join(workdir, spec.source_file)
+                with open(source_path, 'w', encoding='utf-8') as f:
+                    f.write(request.code)
+            prepared = await loop.run_in_executor(self.executor, self.engine.prepare, spec.name, source_path)
+            if isinstance(prepared, ExecutionResult):
+                yield False, pb2.TestResult(submission_id=request.submission_id, status=prepared.status,
+                                            stderr=prepared.compile_output or prepared.stderr)
+                return
+
+            timeout = (request.time_limit_ms or DEFAULT_TIME_LIMIT_MS) / 1000
+            memory_mb = request.memory_mb or DEFAULT_MEMORY_MB
+            slots = asyncio.Semaphore(max(1, request.parallelism or DEFAULT_PARALLELISM))
+
+            async def run_one(index, test):
+                async with slots:
+                    run = self.executor.submit(self.engine.run, prepared, test.input, timeout, memory_mb)
+                    running.add(run)
+                    res = await asyncio.wrap_future(run)
+                return _test_result(request.submission_id, index, res, test.expected)
+
+            def outcome(task):
+                # a test whose run raised is reported as internal_error; the stream goes on
+                if task.exception() is not None:
+                    return pb2.TestResult(submission_id=request.submission_id, index=indices[task],
+                                          status='internal_error', stderr=repr(task.exception()))
+                return task.result()
+
+            indices = {asyncio.ensure_future(run_one(i, t)): i for i, t in enumerate(request.tests)}
+            pending = set(indices)
+            try:
+                while pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in sorted(done, key=indices.get):
+                        result = outcome(task)
+                        yield True, result
+                        if request.stop_on_failure and not result.passed:
+                            return
+            finally:
+                # queued tests never start; the ones already in the executor run to completion and
+                # must be waited for, as they may still read the binary or source in workdir
+                for task in pending:
+                    task.cancel()
+                busy = [asyncio.wrap_future(r) for r in running if not r.cancel()]
+                if busy:
+                    await asyncio.wait(busy)
+        finally:
+            # if the wait above was itself cancelled, removal is left to the last run to finish
+            _remove_when_done(workdir, running)
+
+    async def Run(self, request, context):
+        status, results = 'completed', []
+        async for compiled, result in self._stream(request, context):
+            if not compiled:
+                # prepare failed (compile_error or internal_error); no test ran
+                status = result.status
+            results.append(result)
+        if status == 'completed' and len(results) < len(request.tests):
+            # stop_on_failure ended the run before every test had a result
+            status = 'stopped'
+        results.sort(key=lambda r: r.index)
+        return pb2.RunResponse(
+            submission_id=request.submission_id, status=status,
+            passed=sum(r.passed for r in results), total=len(request.tests), results=results,
+        )
+
+
+async def serve(port: int = 50054):
+    server = grpc.aio.server()
+    pb2_grpc.add_SandboxServiceServicer_to_server(SandboxServicer(), server)
+    server.add_insecure_port(f'[::]:{port}')
+    await server.start()
+    try:
+        await server.wait_for_termination()
+    finally:
+        await server.stop(5)
 
 
 if __name__ == '__main__':
-    serve()
+    try:
+        asyncio.run(serve(int(os.environ.get('SANDBOX_GRPC_PORT', '50054'))))
+    except KeyboardInterrupt:
+        pass
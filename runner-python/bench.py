@@ -0,0 +1,166 @@
+"""Runner benchmark: generated submissions, latency percentiles as JSON.
+
+Generates one fixture submission per profile (tiny, cpu, output, memory,
+timeout, crash) into a temp dir, then measures
+  - run_case:   per-case latency calling sandbox_exec directly (spawn and/or warm)
+  - entrypoint: per-submission wall time of `python entrypoint.py` plus the
+                per-case timeMs it reports
+and prints a JSON report for regression tracking.
+
+    python bench.py --cases 20 --repeat 3 --modes spawn,warm --out bench.json
+"""
+import argparse, json, os, platform, subprocess, sys, tempfile, time
+from pathlib import Path
+from typing import Dict, List
+
+from sandbox_exec import run_case, available_cpus, WarmPool
+
+HERE = Path(__file__).resolve().parent
+
+PROFILES = {
+    # interpreter startup dominates
+    "tiny": (
+        "print(input())\n",
+        lambda i: (f"{i}\n", f"{i}\n"),
+    ),
+    "cpu": (
+        "n = int(input())\n"
+        "s = 0\n"
+        "for k in range(n):\n"
+        "    s += k * k % 7\n"
+        "print(s)\n",
+        lambda i: (f"{200000 + i}\n", f"{sum(k * k % 7 for k in range(200000 + i))}\n"),
+    ),
+    "output": (
+        "n = int(input())\n"
+        "print('\\n'.join(str(k) for k in range(n)))\n",
+        lambda i: (f"{100000 + i}\n", "\n".join(str(k) for k in range(100000 + i)) + "\n"),
+    ),
+    "memory": (
+        "n = int(input())\n"
+        "xs = [k for k in range(n)]\n"
+        "print(len(xs))\n",
+        lambda i: (f"{2000000 + i}\n", f"{2000000 + i}\n"),
+    ),
+    "timeout": (
+        "while True:\n"
+        "    pass\n",
+        lambda i: ("", ""),
+    ),
+    "crash": (
+        "raise RuntimeError('boom')\n",
+        lambda i: ("", ""),
+    ),
+}
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """count/mean and nearest-rank p50/p95/p99 in ms."""
+    if not samples:
+        return {"count": 0}
+    xs = sorted(samples)
+
+    def pct(p: float) -> float:
+        return round(xs[min(len(xs) - 1, max(0, int(round(p / 100.0 * len(xs))) - 1))], 2)
+
+    return {
+        "count": len(xs),
+        "meanMs": round(sum(xs) / len(xs), 2),
+        "p50Ms": pct(50), "p95Ms": pct(95), "p99Ms": pct(99),
+        "maxMs": round(xs[-1], 2),
+    }
+
+def write_fixture(root: Path, name: str, cases: int) -> Path:
+    code, gen = PROFILES[name]
+    d = root / name
+    d.mkdir(parents=True)
+    (d / "main.py").write_text(code, encoding="utf-8")
+    tests = [dict(zip(("input", "expected"), gen(i))) for i in range(cases)]
+    (d / "tests.json").write_text(json.dumps(tests), encoding="utf-8")
+    return d
+
+def bench_run_case(work: Path, mode: str, workers: int, repeat: int, timeout_s: float) -> Dict:
+    tests = json.loads((work / "tests.json").read_text(encoding="utf-8"))
+    code_path = str(work / "main.py")
+    pool = WarmPool(size=workers) if mode == "warm" else None
+    execute = pool.run_case if pool else run_case
+    lat = []
+    try:
+        # a worker's first call pays its fork-server boot; keep every worker's out of the
+        # numbers (the pool hands workers out in FIFO order, so this touches each once)
+        for _ in range(workers):
+            execute(code_path=code_path, input_data=tests[0]["input"], timeout_s=timeout_s)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for t in tests:
+                t0 = time.perf_counter()
+                execute(code_path=code_path, input_data=t["input"], timeout_s=timeout_s)
+                lat.append((time.perf_counter() - t0) * 1000)
+        elapsed = time.perf_counter() - start
+    finally:
+        if pool:
+            pool.close()
+    out = percentiles(lat)
+    out["throughputPerS"] = round(len(lat) / elapsed, 2) if elapsed else None
+    return out
+
+def bench_entrypoint(work: Path, mode: str, workers: int, repeat: int, timeout_s: float) -> Dict:
+    env = dict(os.environ, WORK_DIR=str(work), RUNNER_EXEC_MODE=mode,
+               RUNNER_WORKERS=str(workers), TEST_TIMEOUT_S=str(timeout_s))
+    sub_lat, case_lat = [], []
+    start = time.perf_counter()
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        p = subprocess.run([sys.executable, str(HERE / "entrypoint.py")], env=env,
+                           stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=False)
+        sub_lat.append((time.perf_counter() - t0) * 1000)
+        result = json.loads(p.stdout)
+        case_lat.extend(t["timeMs"] for t in result.get("testsSummary", []))
+    elapsed = time.perf_counter() - start
+    sub = percentiles(sub_lat)
+    sub["throughputPerS"] = round(len(sub_lat) / elapsed, 2) if elapsed else None
+    return {"submission": sub, "case": percentiles(case_lat)}
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--profiles", default=",".join(PROFILES), help="comma-separated subset of %s" % ",".join(PROFILES))
+    ap.add_argument("--cases", type=int, default=10, help="test cases per submission")
+    ap.add_argument("--repeat", type=int, default=3, help="runs per profile and mode")
+    ap.add_argument("--modes", default="spawn,warm")
+    ap.add_argument("--workers", type=int, default=available_cpus())
+    ap.add_argument("--timeout", type=float, default=0.5, help="per-case timeout in seconds")
+    ap.add_argument("--out", help="also write the report to this file")
+    args = ap.parse_args(argv)
+
+    modes = [m for m in args.modes.split(",") if m]
+    if "warm" in modes and not WarmPool.supported():
+        modes.remove("warm")
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": available_cpus(),
+            "workers": args.workers,
+            "cases": args.cases,
+            "repeat": args.repeat,
+            "timeoutS": args.timeout,
+            "modes": modes,
+        },
+        "profiles": {},
+    }
+    with tempfile.TemporaryDirectory(prefix="runner-bench-") as tmp:
+        for name in [p for p in args.profiles.split(",") if p]:
+            work = write_fixture(Path(tmp), name, args.cases)
+            report["profiles"][name] = {
+                mode: {
+                    "runCase": bench_run_case(work, mode, args.workers, args.repeat, args.timeout),
+                    "entrypoint": bench_entrypoint(work, mode, args.workers, args.repeat, args.timeout),
+                }
+                for mode in modes
+            }
+    text = json.dumps(report, indent=2)
+    if args.out:
+        Path(args.out).write_text(text + "\n", encoding="utf-8")
+    print(text)
+
+if __name__ == "__main__":
+    main()
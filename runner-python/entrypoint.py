@@ -1,79 +1,178 @@
-import json, sys, os, time, traceback
+import json, sys, os, time, threading, traceback
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Dict, Any
-from sandbox_exec import run_case
-from scoring import compare_output
+from typing import List, Dict, Any, Tuple
+from sandbox_exec import run_case, available_cpus, WarmPool, ABORT_MISMATCH, ABORT_OUTPUT_LIMIT, ABORT_CANCELLED, MAX_OUTPUT_BYTES, CHUNK
+from scoring import Comparator, FileComparator
 
-WORK_DIR = Path("/work")
+WORK_DIR = Path(os.environ.get("WORK_DIR", "/work"))
 
-def load_tests() -> List[Dict[str, str]]:
+def worker_count() -> int:
+    """RUNNER_WORKERS if set, else the CPUs available inside the container's cgroup quota."""
+    try:
+        return max(1, int(os.environ["RUNNER_WORKERS"]))
+    except (KeyError, ValueError):
+        return available_cpus()
+
+def make_executor(workers: int = 1):
+    """
+    Picks how test cases are executed, via RUNNER_EXEC_MODE:
+      warm  - dispatch to a pre-forked interpreter (default where fork is available)
+      spawn - fresh `python -I -S -B` process per case
+    Returns: (run_case callable, pool or None)
+    """
+    mode = os.environ.get("RUNNER_EXEC_MODE", "warm").strip().lower()
+    if mode == "warm" and WarmPool.supported():
+        try:
+            pool = WarmPool(size=workers)
+            return pool.run_case, pool
+        except Exception:
+            pass
+    return run_case, None
+
+def load_tests() -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    tests.json is either a plain list of tests or
+    {"tests": [...], "strategy": "full"|"fail-fast", "order": "given"|"samples-first",
+     "compare": <Comparator mode>, "floatTolerance": <float>}.
+    A test carries "input"/"expected" inline, or "inputFile"/"expectedFile"
+    paths relative to the work dir for large cases.
+    Returns: (tests, options)
+    """
     tests_path = WORK_DIR / "tests.json"
     if not tests_path.exists():
-        raise FileNotFoundError("tests.json not found in /work")
-    return json.loads(tests_path.read_text(encoding="utf-8"))
+        raise FileNotFoundError(f"tests.json not found in {WORK_DIR}")
+    data = json.loads(tests_path.read_text(encoding="utf-8"))
+    if isinstance(data, dict):
+        return data.get("tests", []), {k: v for k, v in data.items() if k != "tests"}
+    return data, {}
 
-def main():
-    code_path_py = WORK_DIR / "main.py"
-    if not code_path_py.exists():
-        print(json.dumps({
-            "passed": False, "score": 0,
-            "runtimeMs": None, "memoryKb": None,
-            "testsSummary": [], "traces": [], "antiCheat": {},
-            "error": "main.py not found"
-        }))
-        return
+def run_plan(tests: List[Dict[str, Any]], options: Dict[str, Any]) -> Tuple[List[int], bool]:
+    """
+    Execution order (0-based indexes) and whether to stop at the first failure.
+    Per-request options win over RUNNER_STRATEGY / RUNNER_ORDER.
+    """
+    strategy = str(options.get("strategy") or os.environ.get("RUNNER_STRATEGY", "full")).lower()
+    order = str(options.get("order") or os.environ.get("RUNNER_ORDER", "given")).lower()
+    idx = list(range(len(tests)))
+    if order == "samples-first":
+        # stable: sample cases first, then unflagged ones, hidden cases last
+        idx.sort(key=lambda j: 0 if tests[j].get("sample") else (2 if tests[j].get("hidden") else 1))
+    return idx, strategy == "fail-fast"
 
-    try:
-        tests = load_tests()
-    except Exception as e:
-        print(json.dumps({
-            "passed": False, "score": 0,
-            "runtimeMs": None, "memoryKb": None,
-            "testsSummary": [], "traces": [], "antiCheat": {},
-            "error": f"Failed to load tests.json: {e}"
-        }))
-        return
+def work_file(rel: str) -> Path:
+    """Resolve a manifest path, refusing anything outside the work dir."""
+    p = (WORK_DIR / rel).resolve()
+    if not p.is_relative_to(WORK_DIR.resolve()) or not p.is_file():
+        raise ValueError(f"test file not found in work dir: {rel}")
+    return p
+
+def build_comparators(tests: List[Dict[str, Any]], options: Dict[str, Any]) -> List[Comparator]:
+    """
+    One Comparator per test, built once for the whole suite. The mode comes from
+    the test's own "compare", else the suite's, else RUNNER_COMPARE.
+    Tests with "expectedFile" get a streaming FileComparator (default mode only).
+    """
+    mode = options.get("compare") or os.environ.get("RUNNER_COMPARE", "default")
+    tol = float(options.get("floatTolerance", 1e-6))
+    comparators = []
+    for t in tests:
+        if "inputFile" in t:
+            work_file(t["inputFile"])
+        if "expectedFile" in t:
+            if (t.get("compare") or mode) != "default":
+                raise ValueError("expectedFile tests only support the default compare mode")
+            comparators.append(FileComparator(str(work_file(t["expectedFile"]))))
+        else:
+            comparators.append(Comparator(t.get("expected", ""), t.get("compare") or mode, tol))
+    return comparators
 
-    per_test = []
+def _skipped(i: int, note: str) -> Dict[str, Any]:
+    return {
+        "id": i, "pass": False, "skipped": True,
+        "timeMs": 0, "memKb": 0, "cpuUserMs": 0, "cpuSysMs": 0,
+        "stderr": "", "note": note
+    }
+
+def grade_submission(code_path: str, tests: List[Dict[str, Any]], options: Dict[str, Any],
+                     comparators: List[Comparator], execute, workers: int, timeout_seconds: float,
+                     stop: threading.Event = None) -> Dict[str, Any]:
+    """
+    Runs every planned case through `execute` (run_case or WarmPool.run_case) on
+    up to `workers` threads and builds the runner result payload.
+    Setting `stop` from outside cancels the remaining and in-flight cases.
+    """
     total_ok = 0
     start_all = time.perf_counter()
     peak_mem_kb_all = 0
-    timeout_seconds = float(os.environ.get("TEST_TIMEOUT_S", "2.0"))
+    order, fail_fast = run_plan(tests, options)
+    stop = stop or threading.Event()
+    skip_note = "skipped (fail-fast)" if fail_fast else "skipped (cancelled)"
 
-    for i, t in enumerate(tests, start=1):
-        test_input = t.get("input", "")
-        expected = t.get("expected", "")
-
-        rc, out, err, time_ms, mem_kb = run_case(
-            code_path=str(code_path_py),
-            input_data=test_input,
-            timeout_s=timeout_seconds
+    def grade(i: int, t: Dict[str, str]) -> Dict[str, Any]:
+        if stop.is_set():
+            return _skipped(i, skip_note)
+        comparator = comparators[i - 1]
+        checker = comparator.prefix_checker()
+        rc, out, err, time_ms, mem_kb, cpu_user_ms, cpu_sys_ms, abort = execute(
+            code_path=code_path,
+            input_data=t.get("input", ""),
+            timeout_s=timeout_seconds,
+            output_check=checker,
+            cancel=stop,
+            input_path=str(work_file(t["inputFile"])) if "inputFile" in t else None,
+            keep_stdout=not comparator.streaming,
+            # file-backed output may legitimately exceed the default cap
+            max_output_bytes=max(MAX_OUTPUT_BYTES, 2 * comparator.size + CHUNK) if comparator.streaming else None
         )
-        if mem_kb:
-            peak_mem_kb_all = max(peak_mem_kb_all, mem_kb)
+        if abort == ABORT_CANCELLED:
+            # another case already failed (or the caller gave up); this one was stopped mid-run
+            return _skipped(i, skip_note)
 
-        passed, note = compare_output(out, expected)
+        if abort == ABORT_MISMATCH:
+            passed, note = False, "mismatch (early abort)"
+        elif abort == ABORT_OUTPUT_LIMIT:
+            passed, note = False, "output limit exceeded"
+        else:
+            passed, note = checker.finish() if comparator.streaming else comparator.compare(out)
         if rc != 0 and passed:
             passed = False
             note = note + " (non-zero exit)"
+        if fail_fast and not passed:
+            stop.set()
 
-        per_test.append({
+        return {
             "id": i,
             "pass": bool(passed),
             "timeMs": time_ms,
             "memKb": mem_kb,
+            "cpuUserMs": cpu_user_ms,
+            "cpuSysMs": cpu_sys_ms,
             "stderr": (err or "")[:2000],
             "note": note
-        })
+        }
+
+    ids = [j + 1 for j in order]
+    if workers == 1:
+        per_test = [grade(i, tests[i - 1]) for i in ids]
+    else:
+        # cases are independent; map() hands them out in plan order
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            per_test = list(ex.map(grade, ids, [tests[i - 1] for i in ids]))
+    # testsSummary always follows tests.json order
+    per_test.sort(key=lambda r: r["id"])
 
-        if passed:
+    for r in per_test:
+        if r["memKb"]:
+            peak_mem_kb_all = max(peak_mem_kb_all, r["memKb"])
+        if r["pass"]:
             total_ok += 1
 
     elapsed_all_ms = int((time.perf_counter() - start_all) * 1000)
     score = round(100.0 * total_ok / max(1, len(tests)), 2)
     overall_pass = total_ok == len(tests)
 
-    result = {
+    return {
         "passed": overall_pass,
         "score": score,
         "runtimeMs": elapsed_all_ms,
@@ -83,6 +182,38 @@ def main():
         "antiCheat": {},
     }
 
+def main():
+    code_path_py = WORK_DIR / "main.py"
+    if not code_path_py.exists():
+        print(json.dumps({
+            "passed": False, "score": 0,
+            "runtimeMs": None, "memoryKb": None,
+            "testsSummary": [], "traces": [], "antiCheat": {},
+            "error": "main.py not found"
+        }))
+        return
+
+    try:
+        tests, options = load_tests()
+        comparators = build_comparators(tests, options)
+    except Exception as e:
+        print(json.dumps({
+            "passed": False, "score": 0,
+            "runtimeMs": None, "memoryKb": None,
+            "testsSummary": [], "traces": [], "antiCheat": {},
+            "error": f"Failed to load tests.json: {e}"
+        }))
+        return
+
+    timeout_seconds = float(os.environ.get("TEST_TIMEOUT_S", "2.0"))
+    workers = min(worker_count(), max(1, len(tests)))
+    execute, pool = make_executor(workers)
+    try:
+        result = grade_submission(str(code_path_py), tests, options, comparators, execute, workers, timeout_seconds)
+    finally:
+        if pool:
+            pool.close()
+
     print(json.dumps(result))
 
 if __name__ == "__main__":
@@ -1,44 +1,227 @@
 from fastapi import FastAPI, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import List, Dict, Any
-import time
+from typing import List, Dict, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import asyncio, json, os, shutil, tempfile, threading, time
 
-app = FastAPI(title='Runner Stub')
+from entrypoint import grade_submission, build_comparators, make_executor, worker_count
+
+app = FastAPI(title='Runner')
+
+# grading concurrency (submissions, not cases) and how many may wait behind them
+MAX_CONCURRENT = int(os.environ.get('RUNNER_MAX_CONCURRENT', '2'))
+MAX_QUEUE = int(os.environ.get('RUNNER_MAX_QUEUE', '16'))
+DEFAULT_DEADLINE_MS = int(os.environ.get('RUNNER_REQUEST_DEADLINE_MS', '30000'))
+DEFAULT_BATCH_DEADLINE_MS = int(os.environ.get('RUNNER_BATCH_DEADLINE_MS', '600000'))
+TEST_TIMEOUT_S = float(os.environ.get('TEST_TIMEOUT_S', '2.0'))
 
 class TestCase(BaseModel):
     input: str
     expected: str
+    sample: Optional[bool] = None
+    hidden: Optional[bool] = None
+    compare: Optional[str] = None
 
 class RunRequest(BaseModel):
     code: str
     tests: List[TestCase]
+    strategy: Optional[str] = None
+    order: Optional[str] = None
+    compare: Optional[str] = None
+    timeout_s: Optional[float] = None
+    deadline_ms: Optional[int] = None
+
+class BatchSubmission(BaseModel):
+    id: str
+    code: str
+
+class BatchRequest(BaseModel):
+    submissions: List[BatchSubmission]
+    tests: List[TestCase]
+    strategy: Optional[str] = None
+    order: Optional[str] = None
+    compare: Optional[str] = None
+    timeout_s: Optional[float] = None
+    deadline_ms: Optional[int] = None
+
+def _options(req) -> Dict[str, Any]:
+    return {k: v for k, v in (('strategy', req.strategy), ('order', req.order), ('compare', req.compare)) if v}
+
+class _Runner:
+    """
+    Process-wide execution state: one warm pool shared by every request, a
+    semaphore bounding concurrent submissions and a count of admitted requests
+    used for back-pressure.
+    """
+
+    def __init__(self):
+        self.workers = worker_count()
+        self.execute, self.pool = make_executor(self.workers)
+        self.slots = asyncio.Semaphore(MAX_CONCURRENT)
+        self.admitted = 0
+
+    def saturated(self) -> bool:
+        return self.admitted >= MAX_CONCURRENT + MAX_QUEUE
+
+    def close(self):
+        if self.pool:
+            self.pool.close()
+
+_runner: Optional[_Runner] = None
+
+@app.on_event('startup')
+async def _startup():
+    global _runner
+    _runner = _Runner()
+
+@app.on_event('shutdown')
+async def _shutdown():
+    if _runner:
+        _runner.close()
+
+def _grade(code: str, tests: List[Dict[str, Any]], options: Dict[str, Any], timeout_s: float, stop: threading.Event,
+           comparators=None, workers: int = None):
+    tmpdir = tempfile.mkdtemp(prefix='runner-')
+    try:
+        code_path = Path(tmpdir) / 'main.py'
+        code_path.write_text(code, encoding='utf-8')
+        comparators = comparators or build_comparators(tests, options)
+        workers = workers or min(_runner.workers, max(1, len(tests)))
+        return grade_submission(str(code_path), tests, options, comparators, _runner.execute, workers, timeout_s, stop)
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+async def run_submission(code: str, tests: List[Dict[str, Any]], options: Dict[str, Any],
+                         timeout_s: float, deadline: float) -> Dict[str, Any]:
+    """
+    Waits for a grading slot and grades one submission, giving up at `deadline`
+    (a time.monotonic() value). Raises HTTPException 504 when the deadline passes.
+    Callers must have admitted the request already (see /run).
+    """
+    try:
+        await asyncio.wait_for(_runner.slots.acquire(), max(0.0, deadline - time.monotonic()))
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail='Deadline exceeded while queued')
+    stop = threading.Event()
+    try:
+        task = asyncio.ensure_future(run_in_threadpool(_grade, code, tests, options, timeout_s, stop))
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), max(0.0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            # cancel in-flight cases and keep the slot until the worker thread has let go
+            stop.set()
+            await task
+            raise HTTPException(status_code=504, detail='Deadline exceeded')
+    finally:
+        _runner.slots.release()
 
 @app.post('/run')
-def run(req: RunRequest):
-    # Simple deterministic stub: return pass if code contains the word 'pass' or prints expected
-    tests_summary = []
-    total_ok = 0
-    start = time.perf_counter()
-    for i, t in enumerate(req.tests, start=1):
-        passed = 'print("hello")' in req.code or 'pass' in req.code
-        if passed:
-            total_ok += 1
-        tests_summary.append({
-            'id': i,
-            'pass': passed,
-            'timeMs': 10,
-            'memKb': 1024,
-            'stderr': '',
-            'note': 'stub'
-        })
-    elapsed = int((time.perf_counter() - start) * 1000)
-    score = round(100.0 * total_ok / max(1, len(req.tests)), 2)
+async def run(req: RunRequest):
+    if _runner.saturated():
+        raise HTTPException(status_code=429, detail='Runner saturated', headers={'Retry-After': '1'})
+    _runner.admitted += 1
+    try:
+        deadline = time.monotonic() + (req.deadline_ms or DEFAULT_DEADLINE_MS) / 1000.0
+        tests = [t.dict(exclude_none=True) for t in req.tests]
+        options = _options(req)
+        try:
+            return await run_submission(req.code, tests, options, req.timeout_s or TEST_TIMEOUT_S, deadline)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        _runner.admitted -= 1
+
+async def _batch_lines(req: BatchRequest, tests, options, comparators, deadline: float):
+    """
+    Grades every submission against the shared, already prepared suite and
+    yields one NDJSON line per submission as it finishes, then a summary line.
+    Submissions run concurrently so their cases interleave on the warm pool;
+    with fewer submissions than workers each one fans its cases out instead.
+    """
+    # one event per submission: fail-fast in one must not cancel the others
+    stops = [threading.Event() for _ in req.submissions]
+    timeout_s = req.timeout_s or TEST_TIMEOUT_S
+    concurrency = max(1, min(_runner.workers, len(req.submissions)))
+    per_sub_workers = max(1, min(_runner.workers // concurrency, len(tests)))
+    ex = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='batch')
+    pending = {}
+    for sub, stop in zip(req.submissions, stops):
+        fut = asyncio.wrap_future(ex.submit(_grade, sub.code, tests, options, timeout_s, stop, comparators, per_sub_workers))
+        pending[fut] = sub.id
+    done_count = 0
+    try:
+        while pending:
+            done, _ = await asyncio.wait(pending, timeout=max(0.0, deadline - time.monotonic()),
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                break
+            for fut in done:
+                sub_id = pending.pop(fut)
+                try:
+                    line = {'id': sub_id, 'result': fut.result()}
+                except Exception as e:
+                    line = {'id': sub_id, 'error': str(e)}
+                done_count += 1
+                yield json.dumps(line) + '\n'
+        timed_out = list(pending.values())
+        if timed_out:
+            for stop in stops:
+                stop.set()
+            for sub_id in timed_out:
+                yield json.dumps({'id': sub_id, 'error': 'Deadline exceeded'}) + '\n'
+        yield json.dumps({'done': True, 'completed': done_count, 'timedOut': len(timed_out)}) + '\n'
+    finally:
+        # also reached when the client goes away mid-stream; keep the slot until
+        # the cancelled cases have actually stopped
+        for stop in stops:
+            stop.set()
+        ex.shutdown(wait=False, cancel_futures=True)
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+@app.post('/run/batch')
+async def run_batch(req: BatchRequest):
+    """
+    Grades many submissions against one test suite, streaming NDJSON results
+    as each submission completes. The whole batch counts as one admitted request.
+    """
+    if _runner.saturated():
+        raise HTTPException(status_code=429, detail='Runner saturated', headers={'Retry-After': '1'})
+    tests = [t.dict(exclude_none=True) for t in req.tests]
+    options = _options(req)
+    try:
+        # prepared once and shared by every submission in the batch
+        comparators = build_comparators(tests, options)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    deadline = time.monotonic() + (req.deadline_ms or DEFAULT_BATCH_DEADLINE_MS) / 1000.0
+    _runner.admitted += 1
+    try:
+        await asyncio.wait_for(_runner.slots.acquire(), max(0.0, deadline - time.monotonic()))
+    except asyncio.TimeoutError:
+        _runner.admitted -= 1
+        raise HTTPException(status_code=504, detail='Deadline exceeded while queued')
+
+    async def stream():
+        try:
+            async for line in _batch_lines(req, tests, options, comparators, deadline):
+                yield line
+        finally:
+            _runner.slots.release()
+            _runner.admitted -= 1
+
+    return StreamingResponse(stream(), media_type='application/x-ndjson')
+
+@app.get('/health')
+def health():
     return {
-        'passed': total_ok == len(req.tests),
-        'score': score,
-        'runtimeMs': elapsed,
-        'memoryKb': 1024,
-        'testsSummary': tests_summary,
+        'workers': _runner.workers,
+        'warm': _runner.pool is not None,
+        'admitted': _runner.admitted,
+        'capacity': MAX_CONCURRENT + MAX_QUEUE,
     }
 
 @app.post('/plagiarism')
@@ -1,6 +1,19 @@
-import subprocess, time, psutil, sys
+import subprocess, time, sys, os, json, math, signal, socket, selectors, threading
+from pathlib import Path
+from queue import Queue
 
 PYTHON_BIN = sys.executable
+WARM_WORKER = str(Path(__file__).resolve().with_name("warm_worker.py"))
+CHUNK = 65536
+MAX_OUTPUT_BYTES = int(os.environ.get("RUNNER_MAX_OUTPUT_BYTES", str(16 * 1024 * 1024)))
+STDERR_KEEP_BYTES = 64 * 1024
+
+# why the runner stopped a case; returned next to (never instead of) its real exit status
+ABORT_TIMEOUT = "timeout"
+ABORT_OUTPUT_LIMIT = "output-limit"
+ABORT_MISMATCH = "mismatch"
+ABORT_CANCELLED = "cancelled"
+CANCEL_POLL_S = 0.05
 
 def _python_cmd(code_path: str):
     # -I isolate: ignore user site, env vars
@@ -8,46 +21,424 @@ def _python_cmd(code_path: str):
     # -B no .pyc bytecode files
     return [PYTHON_BIN, "-I", "-S", "-B", code_path]
 
-def run_case(code_path: str, input_data: str, timeout_s: float):
+# moves the shell into the cgroup whose cgroup.procs is $0, then execs the case in
+# place, so it is inside the cgroup before its first instruction (no preexec_fn)
+_JOIN_CGROUP = 'echo 0 2>/dev/null >"$0"; exec "$@"'
+
+def available_cpus() -> int:
+    """
+    CPUs this container may actually use: the affinity mask capped by the
+    cgroup CPU quota (v2 cpu.max, falling back to v1 cfs quota/period).
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except Exception:
+        cpus = os.cpu_count() or 1
+    quota = None
+    try:
+        q, period = Path("/sys/fs/cgroup/cpu.max").read_text().split()[:2]
+        if q != "max":
+            quota = int(q) / int(period)
+    except Exception:
+        try:
+            q = int(Path("/sys/fs/cgroup/cpu/cpu.cfs_quota_us").read_text())
+            period = int(Path("/sys/fs/cgroup/cpu/cpu.cfs_period_us").read_text())
+            if q > 0 and period > 0:
+                quota = q / period
+        except Exception:
+            pass
+    if quota:
+        cpus = min(cpus, math.ceil(quota))
+    return max(1, cpus)
+
+class _CaseCgroup:
     """
-    Runs candidate code with stdin=input_data.
-    Returns: (returncode, stdout, stderr, time_ms, peak_mem_kb)
+    Per-case cgroup v2 leaf under RUNNER_CGROUP_DIR, used for whole-tree
+    `memory.peak` accounting. The directory must be a delegated, writable
+    cgroup with no processes of its own; without it, ru_maxrss is used.
     """
-    cmd = _python_cmd(code_path)
+    _seq = 0
+    _lock = threading.Lock()
+
+    def __init__(self, path: Path):
+        self.path = path
+
+    @classmethod
+    def create(cls):
+        root = os.environ.get("RUNNER_CGROUP_DIR")
+        if not root:
+            return None
+        with cls._lock:
+            cls._seq += 1
+            path = Path(root) / f"case-{os.getpid()}-{cls._seq}"
+        try:
+            try:
+                (Path(root) / "cgroup.subtree_control").write_text("+memory")
+            except OSError:
+                pass
+            path.mkdir()
+            return cls(path)
+        except OSError:
+            return None
+
+    @property
+    def procs(self) -> str:
+        return str(self.path / "cgroup.procs")
+
+    def wrap(self, cmd):
+        """cmd prefixed so the process joins this cgroup before exec'ing it."""
+        return ["/bin/sh", "-c", _JOIN_CGROUP, self.procs, *cmd]
+
+    def kill(self):
+        """SIGKILL everything in the cgroup (cgroup.kill, Linux 5.14+)."""
+        try:
+            (self.path / "cgroup.kill").write_text("1")
+        except OSError:
+            pass
+
+    def peak_kb(self) -> int:
+        try:
+            return int((self.path / "memory.peak").read_text()) // 1024
+        except (OSError, ValueError):
+            return 0
+
+    def remove(self):
+        try:
+            self.path.rmdir()
+        except OSError:
+            pass
+
+def _usage(maxrss_kb: int, utime: float, stime: float, cg):
+    """(peak_mem_kb, cpu_user_ms, cpu_sys_ms) from rusage, preferring the cgroup peak when present."""
+    peak = cg.peak_kb() if cg else 0
+    return (peak or int(maxrss_kb), int(utime * 1000), int(stime * 1000))
+
+def _killpg(pid: int):
+    try: os.killpg(pid, signal.SIGKILL)
+    except Exception: pass
+
+def _wait4(pid: int, deadline: float):
+    """Reap pid with its rusage, giving up at deadline. Returns (status, rusage) or None."""
+    while True:
+        wpid, status, ru = os.wait4(pid, os.WNOHANG)
+        if wpid:
+            return status, ru
+        if time.perf_counter() >= deadline:
+            return None
+        time.sleep(0.001)
+
+def run_case(code_path: str, input_data: str, timeout_s: float, output_check=None, max_output_bytes: int = None, cancel=None,
+             input_path: str = None, keep_stdout: bool = True):
+    """
+    Runs candidate code with stdin=input_data, or with stdin opened directly on
+    input_path so large inputs never pass through the runner.
+    Output is streamed with bounded memory; the process is killed once it writes
+    more than max_output_bytes, output_check.feed() reports a mismatch or the
+    optional `cancel` event is set. With keep_stdout=False stdout is only fed to
+    output_check and "" is returned in its place.
+    Returns: (returncode, stdout, stderr, time_ms, peak_mem_kb, cpu_user_ms, cpu_sys_ms, abort)
+    returncode is always the process's own exit status (-9 once the runner killed it);
+    abort is None, or one of the ABORT_* reasons for a case stopped by the runner.
+    peak_mem_kb is kernel-reported (cgroup memory.peak or ru_maxrss), not sampled.
+    Note ru_maxrss survives exec, so without a cgroup a spawned case never reports
+    less than the runner's own RSS at fork time; warm mode forks from a small server.
+    """
+    if not hasattr(os, "wait4"):
+        return _run_case_portable(code_path, input_data, timeout_s, output_check, max_output_bytes, cancel,
+                                  input_path, keep_stdout)
+    cg = _CaseCgroup.create()
+    cmd = cg.wrap(_python_cmd(code_path)) if cg else _python_cmd(code_path)
+    in_r, in_w, data = _stdin(input_data, input_path)
+    out_r, out_w = os.pipe()
+    err_r, err_w = os.pipe()
     start = time.perf_counter()
-    proc = subprocess.Popen(
-        cmd,
-        stdin=subprocess.PIPE,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        text=True
-    )
-    p = psutil.Process(proc.pid)
-    peak_mem_kb = 0
+    deadline = start + timeout_s
+    try:
+        # own session so a timeout can kill the whole process group
+        proc = subprocess.Popen(cmd, stdin=in_r, stdout=out_w, stderr=err_w, start_new_session=True)
+    except BaseException:
+        for fd in (in_w, out_r, err_r):
+            if fd is not None: os.close(fd)
+        if cg: cg.remove()
+        raise
+    finally:
+        for fd in (in_r, out_w, err_w):
+            os.close(fd)
+    try:
+        out, err, abort = _pump(in_w, out_r, err_r, data, deadline,
+                                output_check, max_output_bytes, cancel, keep_stdout)
+        reaped = None if abort else _wait4(proc.pid, deadline)
+        if reaped is None:
+            abort = abort or ABORT_TIMEOUT
+            _killpg(proc.pid)
+            reaped = os.wait4(proc.pid, 0)[1:]
+        status, ru = reaped
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        time_ms = int((time.perf_counter() - start) * 1000)
+        usage = _usage(ru.ru_maxrss, ru.ru_utime, ru.ru_stime, cg)
+    finally:
+        os.close(out_r)
+        os.close(err_r)
+        if cg: cg.remove()
+    return (proc.returncode,) + _output(abort, out, err) + (time_ms,) + usage + (abort,)
 
+def _run_case_portable(code_path: str, input_data: str, timeout_s: float, output_check=None, max_output_bytes: int = None, cancel=None,
+                       input_path: str = None, keep_stdout: bool = True):
+    # no wait4/process groups (e.g. Windows dev machines): plain communicate, no resource numbers
+    start = time.perf_counter()
+    stdin_f = open(input_path, "rb") if input_path else None
     try:
-        out, err = proc.communicate(input=input_data, timeout=timeout_s)
+        proc = subprocess.Popen(
+            _python_cmd(code_path),
+            stdin=stdin_f or subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True
+        )
+        out, err = proc.communicate(input=None if stdin_f else input_data, timeout=timeout_s)
     except subprocess.TimeoutExpired:
-        # kill children then parent
-        for ch in p.children(recursive=True):
-            try: ch.kill()
-            except Exception: pass
-        try: p.kill()
-        except Exception: pass
-        return (124, "", "TIMEOUT", int((time.perf_counter()-start)*1000), peak_mem_kb)
+        proc.kill()
+        proc.communicate()
+        return (proc.returncode, "", "TIMEOUT", int((time.perf_counter()-start)*1000), 0, 0, 0, ABORT_TIMEOUT)
+    finally:
+        if stdin_f: stdin_f.close()
+    time_ms = int((time.perf_counter() - start) * 1000)
+    abort = None
+    if output_check is not None and not output_check.feed(out.encode("utf-8")):
+        abort = ABORT_MISMATCH
+    return (proc.returncode, out if keep_stdout else "", err, time_ms, 0, 0, 0, abort)
+
+class _Ring:
+    """Keeps only the last `size` bytes written to it."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.buf = bytearray()
 
-    # sample RSS (heuristic, not true peak)
+    def write(self, chunk: bytes):
+        self.buf += chunk
+        if len(self.buf) > self.size:
+            del self.buf[:len(self.buf) - self.size]
+
+def _pump(stdin_fd: int, stdout_fd: int, stderr_fd: int, data: bytes, deadline: float,
+          output_check=None, max_output_bytes: int = None, cancel=None, keep_stdout: bool = True):
+    """
+    Feeds stdin (when stdin_fd is not None) and drains stdout/stderr without blocking on either side.
+    stdout is kept up to max_output_bytes and passed to output_check.feed() as it
+    arrives; stderr keeps only its last STDERR_KEEP_BYTES.
+    Returns: (stdout_bytes, stderr_bytes, abort) where abort is None or one of
+    the ABORT_* reasons; on abort the caller must
+    kill the process. `cancel` is a threading.Event polled while waiting.
+    """
+    cap = max_output_bytes or MAX_OUTPUT_BYTES
+    out = bytearray()
+    err = _Ring(STDERR_KEEP_BYTES)
+    total = 0
+    view = memoryview(data)
+    sel = selectors.DefaultSelector()
+    if stdin_fd is not None:
+        os.set_blocking(stdin_fd, False)
+        if view:
+            sel.register(stdin_fd, selectors.EVENT_WRITE)
+        else:
+            os.close(stdin_fd)
+    sel.register(stdout_fd, selectors.EVENT_READ)
+    sel.register(stderr_fd, selectors.EVENT_READ)
+    abort = None
     try:
-        rss_total = p.memory_info().rss
-        for ch in p.children(recursive=True):
+        while sel.get_map() and not abort:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                abort = ABORT_TIMEOUT
+                break
+            if cancel is not None:
+                if cancel.is_set():
+                    abort = ABORT_CANCELLED
+                    break
+                remaining = min(remaining, CANCEL_POLL_S)
+            for key, _ in sel.select(remaining):
+                fd = key.fd
+                if fd == stdin_fd:
+                    try:
+                        view = view[os.write(fd, view[:CHUNK]):]
+                    except (BrokenPipeError, BlockingIOError) as e:
+                        if isinstance(e, BlockingIOError):
+                            continue
+                        view = view[:0]
+                    if not view:
+                        sel.unregister(fd)
+                        os.close(fd)
+                    continue
+                chunk = os.read(fd, CHUNK)
+                if not chunk:
+                    sel.unregister(fd)
+                    continue
+                total += len(chunk)
+                if total > cap:
+                    abort = ABORT_OUTPUT_LIMIT
+                    break
+                if fd == stderr_fd:
+                    err.write(chunk)
+                    continue
+                if keep_stdout:
+                    out += chunk
+                if output_check is not None and not output_check.feed(chunk):
+                    abort = ABORT_MISMATCH
+                    break
+    finally:
+        for key in list(sel.get_map().values()):
+            sel.unregister(key.fd)
+            if key.fd == stdin_fd:
+                os.close(stdin_fd)
+        sel.close()
+    return bytes(out), bytes(err.buf), abort
+
+def _output(abort: str, out: bytes, err: bytes):
+    """(stdout, stderr) reported for a case, depending on why (if at all) the runner stopped it."""
+    if abort is None or abort == ABORT_MISMATCH:
+        return _decode(out), _decode(err)
+    if abort == ABORT_OUTPUT_LIMIT:
+        return "", "OUTPUT LIMIT EXCEEDED"
+    if abort == ABORT_CANCELLED:
+        return "", "CANCELLED"
+    return "", "TIMEOUT"
+
+def _stdin(input_data: str, input_path: str):
+    """(child_fd, parent_fd, data): a pipe fed with input_data, or the input file itself (parent_fd None)."""
+    if input_path:
+        return os.open(input_path, os.O_RDONLY), None, b""
+    r, w = os.pipe()
+    return r, w, (input_data or "").encode("utf-8")
+
+def _decode(b: bytes) -> str:
+    return b.decode("utf-8", errors="replace")
+
+class _WarmWorker:
+    """One fork-server process plus the control socket used to drive it."""
+
+    def __init__(self):
+        self.sock, theirs = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        try:
+            self.proc = subprocess.Popen(
+                [PYTHON_BIN, "-I", "-S", "-B", WARM_WORKER, str(theirs.fileno())],
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                pass_fds=(theirs.fileno(),),
+            )
+        finally:
+            theirs.close()
+        self.ready = False
+
+    def _wait_ready(self):
+        # interpreter boot happens outside the per-case clock
+        if not self.ready:
+            self.sock.settimeout(10.0)
+            json.loads(self.sock.recv(4096))["ready"]
+            self.ready = True
+
+    def alive(self) -> bool:
+        return self.proc.poll() is None
+
+    def run_case(self, code_path: str, input_data: str, timeout_s: float, output_check=None, max_output_bytes: int = None, cancel=None,
+                 input_path: str = None, keep_stdout: bool = True):
+        self._wait_ready()
+        cg = _CaseCgroup.create()
+        req = {"codePath": code_path, "cgroupProcs": cg.procs if cg else None}
+        in_r, in_w, data = _stdin(input_data, input_path)
+        out_r, out_w = os.pipe()
+        err_r, err_w = os.pipe()
+        start = time.perf_counter()
+        deadline = start + timeout_s
+        pid = None
+        try:
             try:
-                rss_total += ch.memory_info().rss
-            except Exception:
-                pass
-        peak_mem_kb = int(rss_total / 1024)
-    except Exception:
-        peak_mem_kb = 0
+                socket.send_fds(self.sock, [json.dumps(req).encode()], [in_r, out_w, err_w])
+            finally:
+                for fd in (in_r, out_w, err_w):
+                    os.close(fd)
+            self.sock.settimeout(max(0.0, deadline - time.perf_counter()) + 1.0)
+            pid = json.loads(self.sock.recv(4096))["pid"]
+            stdin_fd, in_w = in_w, None  # _pump closes it
+            out, err, abort = _pump(stdin_fd, out_r, err_r, data, deadline,
+                                    output_check, max_output_bytes, cancel, keep_stdout)
+            if not abort:
+                try:
+                    self.sock.settimeout(max(0.05, deadline - time.perf_counter()))
+                    done = json.loads(self.sock.recv(4096))
+                except socket.timeout:
+                    # pipes closed but the process is still running
+                    abort = ABORT_TIMEOUT
+            if abort:
+                _killpg(pid)
+                # the server reports after reaping, so this wait is bounded by the kill above
+                self.sock.settimeout(None)
+                done = json.loads(self.sock.recv(4096))
+            time_ms = int((time.perf_counter() - start) * 1000)
+            usage = _usage(done.get("maxrssKb") or 0, done.get("utime") or 0.0, done.get("stime") or 0.0, cg)
+        except BaseException:
+            # the control channel is out of step: stop the case (the pid may never have
+            # arrived) and the server, so that neither outlives this call
+            if pid is not None:
+                _killpg(pid)
+            if cg: cg.kill()
+            self.close()
+            raise
+        finally:
+            for fd in (in_w, out_r, err_r):
+                if fd is not None: os.close(fd)
+            if cg: cg.remove()
+        rc = os.waitstatus_to_exitcode(done["status"])
+        return (rc,) + _output(abort, out, err) + (time_ms,) + usage + (abort,)
 
-    rc = proc.returncode
-    time_ms = int((time.perf_counter() - start) * 1000)
-    return (rc, out, err, time_ms, peak_mem_kb)
+    def close(self):
+        try: self.sock.close()
+        except Exception: pass
+        try:
+            self.proc.wait(timeout=1)
+        except Exception:
+            self.proc.kill()
+
+class WarmPool:
+    """
+    Pool of pre-forked fork-server interpreters.
+    run_case() has the same contract as the module-level run_case().
+    """
+
+    def __init__(self, size: int = 1):
+        self.size = max(1, size)
+        self._idle: Queue = Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        for _ in range(self.size):
+            self._idle.put(_WarmWorker())
+
+    @staticmethod
+    def supported() -> bool:
+        return hasattr(os, "fork") and hasattr(socket, "send_fds") and Path(WARM_WORKER).exists()
+
+    def run_case(self, code_path: str, input_data: str, timeout_s: float, output_check=None, max_output_bytes: int = None, cancel=None,
+                 input_path: str = None, keep_stdout: bool = True):
+        worker = self._idle.get()
+        try:
+            if not worker.alive():
+                worker.close()
+                worker = _WarmWorker()
+            try:
+                return worker.run_case(code_path, input_data, timeout_s, output_check, max_output_bytes, cancel,
+                                       input_path, keep_stdout)
+            except (OSError, ValueError, KeyError):
+                # broken control channel: replace the server and run this case cold
+                worker.close()
+                worker = _WarmWorker()
+                return run_case(code_path, input_data, timeout_s, output_check, max_output_bytes, cancel,
+                                input_path, keep_stdout)
+        finally:
+            self._idle.put(worker)
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        for _ in range(self.size):
+            self._idle.get().close()
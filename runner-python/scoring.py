@@ -1,32 +1,287 @@
-import json
-from typing import Tuple
+import codecs, json, mmap, os
+from typing import List, Tuple
 
 def _normalize_lines(s: str) -> str:
     return "\n".join([line.rstrip() for line in s.strip().splitlines()])
 
-def compare_output(actual: str, expected: str) -> Tuple[bool, str]:
-    a = _normalize_lines(actual)
-    e = _normalize_lines(expected)
+_UNPARSED = object()
+FLOAT_TOL = 1e-6
 
-    if a == e:
-        return True, "exact"
+def _float_close(a: float, e: float, tol: float) -> bool:
+    return abs(a - e) <= tol * max(1.0, abs(e))
 
-    # numeric tolerance
+def _to_float(s: str):
     try:
-        an = float(a)
-        en = float(e)
-        if abs(an - en) <= 1e-6 * max(1.0, abs(en)):
-            return True, "float≈"
+        return float(s)
     except Exception:
-        pass
+        return None
 
-    # JSON equality (object/array)
-    try:
-        aj = json.loads(a)
-        ej = json.loads(e)
-        if aj == ej:
-            return True, "json-eq"
-    except Exception:
-        pass
+class Comparator:
+    """
+    Compares outputs against one expected output, normalised and parsed once.
+    Build one per test when the suite is loaded and reuse it for every run.
+
+    Modes:
+      default         exact lines, then whole-output float, then JSON (compare_output)
+      tokens          whitespace-separated tokens must be equal
+      float-tokens    tokens equal, numeric tokens within `tol`
+      unordered-lines same normalised lines in any order
+      json            JSON values must be equal
+    """
+    MODES = ("default", "tokens", "float-tokens", "unordered-lines", "json")
+    streaming = False
+
+    def __init__(self, expected: str, mode: str = "default", tol: float = FLOAT_TOL):
+        if mode not in self.MODES:
+            raise ValueError(f"unknown compare mode: {mode}")
+        self.mode = mode
+        self.tol = tol
+        self._e = _normalize_lines(expected or "")
+        self._lines = self._e.split("\n") if self._e else []
+        self._float = None
+        self._json = _UNPARSED
+        if mode in ("default", "json"):
+            if mode == "default":
+                self._float = _to_float(self._e)
+            try:
+                self._json = json.loads(self._e)
+            except Exception:
+                pass
+        elif mode in ("tokens", "float-tokens"):
+            self._tokens = self._e.split()
+            if mode == "float-tokens":
+                self._token_floats = [_to_float(t) for t in self._tokens]
+        else:
+            self._sorted_lines = sorted(self._lines)
+
+    def compare(self, actual: str) -> Tuple[bool, str]:
+        return getattr(self, "_cmp_" + self.mode.replace("-", "_"))(actual or "")
+
+    def prefix_checker(self):
+        """A fresh PrefixChecker for one streamed run, or None when the mode can't rule out a prefix."""
+        if self.mode != "default":
+            return None
+        return PrefixChecker(lines=self._lines, enabled=self._float is None and self._json is _UNPARSED)
+
+    def _cmp_default(self, actual: str) -> Tuple[bool, str]:
+        a = _normalize_lines(actual)
+        if a == self._e:
+            return True, "exact"
+        # the float and JSON fallbacks only run when the expected side parsed
+        if self._float is not None:
+            an = _to_float(a)
+            if an is not None and _float_close(an, self._float, self.tol):
+                return True, "float≈"
+        if self._json is not _UNPARSED:
+            try:
+                if json.loads(a) == self._json:
+                    return True, "json-eq"
+            except Exception:
+                pass
+        return False, "mismatch"
+
+    def _cmp_tokens(self, actual: str) -> Tuple[bool, str]:
+        if actual.split() == self._tokens:
+            return True, "tokens"
+        return False, "mismatch"
+
+    def _cmp_float_tokens(self, actual: str) -> Tuple[bool, str]:
+        got = actual.split()
+        if len(got) != len(self._tokens):
+            return False, "mismatch"
+        for a, e, ef in zip(got, self._tokens, self._token_floats):
+            if a == e:
+                continue
+            af = _to_float(a) if ef is not None else None
+            if af is None or not _float_close(af, ef, self.tol):
+                return False, "mismatch"
+        return True, "float-tokens"
+
+    def _cmp_unordered_lines(self, actual: str) -> Tuple[bool, str]:
+        a = _normalize_lines(actual)
+        if sorted(a.split("\n") if a else []) == self._sorted_lines:
+            return True, "unordered-lines"
+        return False, "mismatch"
+
+    def _cmp_json(self, actual: str) -> Tuple[bool, str]:
+        if self._json is _UNPARSED:
+            return False, "mismatch (expected is not JSON)"
+        try:
+            if json.loads(actual) == self._json:
+                return True, "json-eq"
+        except Exception:
+            pass
+        return False, "mismatch"
+
+def compare_output(actual: str, expected: str) -> Tuple[bool, str]:
+    return Comparator(expected).compare(actual)
+
+# characters str.splitlines() breaks on besides "\n"; the streaming check defers to compare_output when seen
+_OTHER_BREAKS = frozenset("\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029")
+
+class PrefixChecker:
+    """
+    Incremental form of Comparator's default mode for streamed stdout.
+    feed() returns False once the output can no longer match, so the runner
+    can stop the process early. It only ever rules out outputs the final
+    compare would also reject: when the expected output could match through
+    the float or JSON fallbacks, or the output uses unusual line breaks, it
+    stays permissive and the final compare decides.
+    """
 
-    return False, "mismatch"
+    def __init__(self, lines: List[str], enabled: bool = True):
+        self.enabled = enabled
+        self._lines = lines
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._pending = []
+        self._pending_len = 0
+        self._started = False
+        self._idx = 0
+
+    def feed(self, chunk: bytes) -> bool:
+        if not self.enabled:
+            return True
+        text = self._decoder.decode(chunk)
+        if not _OTHER_BREAKS.isdisjoint(text):
+            self.enabled = False
+            return True
+        if not self._started:
+            # the final compare strips leading whitespace of the whole output
+            text = text.lstrip()
+            if not text:
+                return True
+            self._started = True
+        parts = text.split("\n")
+        if len(parts) == 1:
+            return self._extend(text)
+        first = "".join(self._pending) + parts[0]
+        for line in [first] + parts[1:-1]:
+            if not self._line_ok(line.rstrip()):
+                return False
+        self._pending, self._pending_len = [], 0
+        return self._extend(parts[-1])
+
+    def _extend(self, text: str) -> bool:
+        # an unfinished line may only run past the expected line with whitespace
+        limit = len(self._lines[self._idx]) if self._idx < len(self._lines) else 0
+        off = self._pending_len
+        self._pending.append(text)
+        self._pending_len += len(text)
+        return not text[max(0, limit - off):].strip()
+
+    def _line_ok(self, line: str) -> bool:
+        i = self._idx
+        self._idx += 1
+        if i < len(self._lines):
+            return line == self._lines[i]
+        # past the expected end only trailing blank lines are tolerated
+        return not line
+
+_WS = b" \t\n\r\x0b\x0c"
+
+class FileComparator:
+    """
+    Default-mode comparison against an expected-output file that is never read
+    into memory. stdout is matched while it streams (see MappedStream), so the
+    runner keeps neither side of a multi-MB comparison. Normalisation is the
+    same strip/rstrip-per-line as Comparator, applied to bytes.
+    """
+    mode = "default"
+    streaming = True
+
+    def __init__(self, expected_path: str):
+        self.path = expected_path
+        self.size = os.path.getsize(expected_path)
+
+    def prefix_checker(self):
+        return MappedStream(self.path)
+
+    def compare(self, actual: str) -> Tuple[bool, str]:
+        stream = MappedStream(self.path)
+        stream.feed((actual or "").encode("utf-8"))
+        return stream.finish()
+
+class MappedStream:
+    """
+    One streamed comparison against an mmap'd expected file. feed() returns
+    False on the first divergence; finish() gives the final verdict.
+    Memory is bounded by the chunk size, not by either output.
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        mm = self._mm
+        start, end = 0, len(mm)
+        while start < end and mm[start] in _WS:
+            start += 1
+        while end > start and mm[end - 1] in _WS:
+            end -= 1
+        self._end = end
+        self._pos = start          # start of the current expected line
+        self._line_end = self._next_line_end()
+        self._off = 0              # bytes of the current line already matched
+        self._ws = b""             # whitespace held back until we know it isn't trailing
+        self._started = False
+        self._failed = False
+
+    def _next_line_end(self) -> int:
+        """End of the current expected line, trailing whitespace excluded."""
+        if self._pos >= self._end:
+            return self._pos
+        nl = self._mm.find(b"\n", self._pos, self._end)
+        e = self._end if nl == -1 else nl
+        while e > self._pos and self._mm[e - 1] in _WS:
+            e -= 1
+        return e
+
+    def _match(self, content: bytes) -> bool:
+        a = self._pos + self._off
+        if a + len(content) > self._line_end or self._mm[a:a + len(content)] != content:
+            return False
+        self._off += len(content)
+        return True
+
+    def _segment(self, seg: bytes) -> bool:
+        stripped = seg.rstrip(_WS)
+        if not stripped:
+            self._ws += seg
+            return True
+        ok = self._match(self._ws + stripped)
+        self._ws = seg[len(stripped):]
+        return ok
+
+    def _end_line(self) -> bool:
+        if self._pos + self._off != self._line_end:
+            return False
+        if self._pos < self._end:
+            nl = self._mm.find(b"\n", self._pos, self._end)
+            self._pos = self._end if nl == -1 else nl + 1
+        self._line_end = self._next_line_end()
+        self._off, self._ws = 0, b""
+        return True
+
+    def feed(self, chunk: bytes) -> bool:
+        if self._failed:
+            return False
+        if not self._started:
+            chunk = chunk.lstrip(_WS)
+            if not chunk:
+                return True
+            self._started = True
+        parts = chunk.split(b"\n")
+        for i, seg in enumerate(parts):
+            if not self._segment(seg) or (i < len(parts) - 1 and not self._end_line()):
+                self._failed = True
+                return False
+        return True
+
+    def finish(self) -> Tuple[bool, str]:
+        if not self._failed and self._off and not self._end_line():
+            self._failed = True
+        if isinstance(self._mm, mmap.mmap):
+            self._mm.close()
+        if self._failed or self._pos < self._end:
+            return False, "mismatch"
+        return True, "exact"
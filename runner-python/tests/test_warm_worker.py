@@ -0,0 +1,75 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from sandbox_exec import ABORT_TIMEOUT, WarmPool, run_case  # noqa: E402
+
+THREADED = """
+import threading
+
+def main():
+    print(int(input()) * 2)
+
+threading.Thread(target=main).start()
+"""
+
+LEAKS = """
+import sys
+print(sorted(m for m in ("json", "socket", "traceback") if m in sys.modules))
+"""
+
+
+@pytest.fixture
+def pool():
+    if not WarmPool.supported():
+        pytest.skip("warm mode needs fork and SCM_RIGHTS")
+    pool = WarmPool(size=1)
+    yield pool
+    pool.close()
+
+
+def _write(tmp_path, code):
+    path = tmp_path / "main.py"
+    path.write_text(code)
+    return str(path)
+
+
+def test_threaded_program_output_matches_in_both_modes(tmp_path, pool):
+    code_path = _write(tmp_path, THREADED)
+    spawn = run_case(code_path, "21\n", 5.0)[:3]
+    warm = pool.run_case(code_path, "21\n", 5.0)[:3]
+    assert spawn == (0, "42\n", "")
+    assert warm == spawn
+
+
+def test_worker_imports_are_not_visible_to_the_submission(tmp_path, pool):
+    code_path = _write(tmp_path, LEAKS)
+    spawn = run_case(code_path, "", 5.0)[:3]
+    warm = pool.run_case(code_path, "", 5.0)[:3]
+    assert warm == spawn
+
+
+def test_atexit_handlers_still_run_in_warm_mode(tmp_path, pool):
+    code_path = _write(tmp_path, "import atexit\natexit.register(print, 'bye')\nprint('hi')\n")
+    assert pool.run_case(code_path, "", 5.0)[:3] == (0, "hi\nbye\n", "")
+
+
+@pytest.mark.parametrize("status", [124, 125, 126, 127])
+def test_exit_status_is_reported_as_is_in_both_modes(tmp_path, pool, status):
+    code_path = _write(tmp_path, f"import sys\nsys.exit({status})\n")
+    for execute in (run_case, pool.run_case):
+        result = execute(code_path, "", 5.0)
+        assert result[0] == status
+        assert result[-1] is None
+
+
+def test_timeout_keeps_the_real_status_and_reports_the_abort(tmp_path, pool):
+    code_path = _write(tmp_path, "while True:\n    pass\n")
+    for execute in (run_case, pool.run_case):
+        result = execute(code_path, "", 0.3)
+        assert result[0] == -9
+        assert result[-1] == ABORT_TIMEOUT
@@ -0,0 +1,168 @@
+"""Fork-server for warm test-case execution.
+
+Started once per worker slot with the same isolation flags as a per-case
+spawn (`python -I -S -B`). It waits on a SEQPACKET control socket for
+requests carrying the child's stdin/stdout/stderr fds, forks a fresh child
+for each case and reports the pid and final wait status back. The server
+itself never runs candidate code, so every fork starts from the same clean
+snapshot. If the runner hangs up mid-case, the server kills the case. Only the stdlib may be imported here (site is disabled).
+"""
+import sys
+
+# modules a plain `python -I -S -B main.py` starts with; anything the server
+# imports on top of these is dropped from sys.modules in each child
+_BASELINE = frozenset(sys.modules)
+
+import atexit, json, os, select, signal, socket, traceback
+
+_print_exception = traceback.print_exception
+
+MAX_MSG = 65536
+# every submission has its own path, so this stays a small LRU: the server is
+# long-lived and whatever it holds is inherited by (and counted in ru_maxrss of) each fork
+MAX_COMPILED = 4
+
+_compiled = {}
+
+def _load(code_path):
+    # compile once per submission; the code object is immutable and shared by every fork
+    try:
+        st = os.stat(code_path)
+        key = (st.st_mtime_ns, st.st_size)
+        hit = _compiled.pop(code_path, None)
+        if hit and hit[0] == key:
+            _compiled[code_path] = hit
+            return hit[1], None
+        with open(code_path, "rb") as f:
+            code = compile(f.read(), code_path, "exec", dont_inherit=True)
+        _compiled[code_path] = (key, code)
+        while len(_compiled) > MAX_COMPILED:
+            del _compiled[next(iter(_compiled))]
+        return code, None
+    except Exception as e:
+        return None, e
+
+def _run_child(code, exc, code_path):
+    enc = sys.stdout.encoding or "utf-8"
+    sys.stdin = open(0, "r", encoding=enc, closefd=False)
+    sys.stdout = open(1, "w", encoding=enc, closefd=False)
+    sys.stderr = open(2, "w", encoding=enc, errors="backslashreplace", buffering=1, closefd=False)
+    sys.argv = [code_path]
+    for name in set(sys.modules) - _BASELINE:
+        del sys.modules[name]
+    rc = 0
+    try:
+        if exc is not None:
+            raise exc
+        main_mod = type(sys)("__main__")
+        main_mod.__file__ = code_path
+        sys.modules["__main__"] = main_mod
+        exec(code, main_mod.__dict__)
+    except SystemExit as e:
+        if e.code is None:
+            rc = 0
+        elif isinstance(e.code, int):
+            rc = e.code
+        else:
+            print(e.code, file=sys.stderr)
+            rc = 1
+    except BaseException as e:
+        # drop this frame so the traceback looks like a plain `python main.py` run
+        tb = e.__traceback__.tb_next if exc is None else None
+        _print_exception(type(e), e, tb)
+        rc = 1
+    # same order as interpreter shutdown: join non-daemon threads, then atexit handlers
+    threading = sys.modules.get("threading")
+    if threading is not None:
+        try:
+            threading._shutdown()
+        except BaseException:
+            pass
+    try:
+        atexit._run_exitfuncs()
+    except BaseException:
+        pass
+    try:
+        sys.stdout.flush()
+    except Exception:
+        rc = 120
+    try:
+        sys.stderr.flush()
+    except Exception:
+        pass
+    os._exit(rc & 0xFF)
+
+def _reap(sock, pid):
+    # wait4 the case, but if the runner hangs up first the case must not outlive it
+    try:
+        pidfd = os.pidfd_open(pid)
+    except (AttributeError, OSError):
+        return os.wait4(pid, 0)
+    try:
+        poller = select.poll()
+        poller.register(pidfd, select.POLLIN)
+        poller.register(sock, 0)  # POLLHUP/POLLERR are always reported
+        while True:
+            ready = dict(poller.poll())
+            if pidfd in ready:
+                break
+            if ready.get(sock.fileno(), 0) & (select.POLLHUP | select.POLLERR):
+                for kill in (os.killpg, os.kill):  # setsid may not have run yet
+                    try:
+                        kill(pid, signal.SIGKILL)
+                    except OSError:
+                        pass
+                break
+    finally:
+        os.close(pidfd)
+    return os.wait4(pid, 0)
+
+def serve(sock):
+    sock.send(b'{"ready": true}')
+    while True:
+        try:
+            msg, fds, _, _ = socket.recv_fds(sock, MAX_MSG, 3)
+        except OSError:
+            return
+        if not msg:
+            return
+        req = json.loads(msg)
+        code_path = req["codePath"]
+        code, exc = _load(code_path)
+        pid = os.fork()
+        if pid == 0:
+            try:
+                sock.close()
+                if req.get("cgroupProcs"):
+                    # join the per-case cgroup before any candidate code runs
+                    try:
+                        with open(req["cgroupProcs"], "w") as f:
+                            f.write(str(os.getpid()))
+                    except OSError:
+                        pass
+                os.setsid()
+                for target, fd in enumerate(fds):
+                    os.dup2(fd, target)
+                    os.close(fd)
+                _run_child(code, exc, code_path)
+            finally:
+                os._exit(70)
+        for fd in fds:
+            os.close(fd)
+        try:
+            sock.send(json.dumps({"pid": pid}).encode())
+        except OSError:
+            pass
+        _, status, ru = _reap(sock, pid)
+        try:
+            sock.send(json.dumps({
+                "status": status,
+                "maxrssKb": ru.ru_maxrss,
+                "utime": ru.ru_utime,
+                "stime": ru.ru_stime,
+            }).encode())
+        except OSError:
+            return
+
+if __name__ == "__main__":
+    serve(socket.socket(fileno=int(sys.argv[1])))